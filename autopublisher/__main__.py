@@ -9,6 +9,7 @@ from setproctitle import setproctitle
 
 from autopublisher.arguments import parser
 from autopublisher.config import config
+from autopublisher.documents.office import OfficeError, check_uno
 from autopublisher.services.telegrambot import Proxy, TelegramBot
 
 
@@ -18,10 +19,40 @@ log = logging.getLogger(__name__)
 def set_config(args: Namespace) -> None:
     config.telegram_bot_owner_id = args.telegram_bot_owner_id
     config.mail_server = args.mail_server
+    config.mail_port = args.mail_port
     config.mail_login = args.mail_login
     config.mail_passwd = args.mail_passwd
     config.mail_from = args.mail_from
     config.alternate_mail = args.mail_alternate
+    config.mail_keepalive_interval = args.mail_keepalive_interval
+    config.mail_connect_timeout = args.mail_connect_timeout
+    config.mail_timeout = args.mail_timeout
+    config.mail_retries = args.mail_retries
+    config.mail_retry_backoff = args.mail_retry_backoff
+    config.mail_retry_backoff_max = args.mail_retry_backoff_max
+    config.mail_deadline = args.mail_deadline
+    config.mail_fetch_mode = args.mail_fetch_mode
+    config.mail_watch = args.mail_watch
+    config.mail_idle_timeout = args.mail_idle_timeout
+    config.mail_poll_interval = args.mail_poll_interval
+    config.mail_batch = args.mail_batch
+    config.mail_batch_workers = args.mail_batch_workers
+    config.mail_async_workers = args.mail_async_workers
+    config.mail_state_file = args.mail_state_file
+    config.mail_index_file = args.mail_index_file
+    config.image_workers = args.image_workers
+    config.news_image_budget_kb = args.news_image_budget_kb
+    config.news_image_format = args.news_image_format
+    config.tool_workers = args.tool_workers
+    config.archive_max_size_mb = args.archive_max_size_mb
+    config.archive_max_members = args.archive_max_members
+    config.archive_max_ratio = args.archive_max_ratio
+    config.cache_folder = args.cache_folder
+    config.cache_size_mb = args.cache_size_mb
+    config.office_listener = args.office_listener
+    config.office_port = args.office_port
+    config.office_workers = args.office_workers
+    config.office_timeout = args.office_timeout
     config.site_url = args.site_url
     config.site_username = args.site_username
     config.site_passwd = args.site_passwd
@@ -44,6 +75,11 @@ def run_master(name: str, args: Namespace) -> None:
 
 def main() -> None:
     args = parser.parse_args()
+    if args.office_listener:
+        try:
+            check_uno()
+        except OfficeError as e:
+            parser.error(str(e))
     os.environ.clear()
 
     basic_config(
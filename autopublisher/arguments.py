@@ -23,6 +23,8 @@ def validate(
 
 
 uint = validate(int, constrain=lambda x: x > 0)
+ufloat = validate(float, constrain=lambda x: x > 0)
+uint_or_zero = validate(int, constrain=lambda x: x >= 0)
 
 
 parser = configargparse.ArgumentParser(
@@ -52,10 +54,210 @@ parser.add_argument(
 
 group = parser.add_argument_group("Mail options")
 group.add_argument("--mail-server", type=str, required=True)
+group.add_argument("--mail-port", type=uint, default=993)
 group.add_argument("--mail-login", type=str, required=True)
 group.add_argument("--mail-passwd", type=str, required=True)
 group.add_argument("--mail-from", type=str, required=True)
 group.add_argument("--mail-alternate", type=str, required=True)
+group.add_argument(
+    "--mail-keepalive-interval",
+    type=ufloat,
+    default=60.0,
+    help="Send NOOP to the idle IMAP connection every N seconds",
+)
+group.add_argument(
+    "--mail-connect-timeout",
+    type=ufloat,
+    default=15.0,
+    help="Timeout for TCP and TLS connection to the IMAP server, seconds",
+)
+group.add_argument(
+    "--mail-timeout",
+    type=ufloat,
+    default=30.0,
+    help="Timeout for each IMAP command (login, search, fetch...), seconds",
+)
+group.add_argument(
+    "--mail-retries",
+    type=uint,
+    default=3,
+    help="Attempts for an IMAP operation if the connection is lost "
+         "or the server does not respond",
+)
+group.add_argument(
+    "--mail-retry-backoff",
+    type=ufloat,
+    default=0.5,
+    help="Base delay before retry, doubled after each attempt "
+         "and randomized (full jitter), seconds",
+)
+group.add_argument(
+    "--mail-retry-backoff-max",
+    type=ufloat,
+    default=8.0,
+    help="Max delay before retry, seconds",
+)
+group.add_argument(
+    "--mail-deadline",
+    type=ufloat,
+    default=120.0,
+    help="Overall time limit for one mail check including retries, seconds",
+)
+group.add_argument(
+    "--mail-fetch-mode",
+    choices=("full", "lazy", "stream"),
+    default="full",
+    help="full: download the whole message at once; "
+         "lazy: download headers and structure first "
+         "and attachments only when they are needed; "
+         "stream: download the message in chunks to a temporary file "
+         "and decode attachments to disk without holding them in memory",
+)
+group.add_argument(
+    "--mail-watch",
+    action="store_true",
+    help="Watch INBOX in background and prefetch new mails",
+)
+group.add_argument(
+    "--mail-idle-timeout",
+    type=ufloat,
+    default=300.0,
+    help="Restart IMAP IDLE command every N seconds",
+)
+group.add_argument(
+    "--mail-poll-interval",
+    type=ufloat,
+    default=60.0,
+    help="Check INBOX every N seconds if server does not support IDLE",
+)
+group.add_argument(
+    "--mail-batch",
+    action="store_true",
+    help="Load all new mails from the sender at once "
+         "and prepare news from them in parallel",
+)
+group.add_argument(
+    "--mail-batch-workers",
+    type=uint,
+    default=4,
+    help="Number of mails prepared in parallel in batch mode",
+)
+group.add_argument(
+    "--mail-async-workers",
+    type=uint,
+    default=4,
+    help="Number of threads that run mail operations "
+         "for the bot handlers without blocking the event loop",
+)
+group.add_argument(
+    "--mail-state-file",
+    type=Path,
+    default=None,
+    help="Track new and processed mails by UID in this local file "
+         "instead of the \\Seen flag on the server",
+)
+group.add_argument(
+    "--mail-index-file",
+    type=Path,
+    default=None,
+    help="Keep published mails (Message-ID, attachment hashes, URL) "
+         "in this SQLite database and skip mails published before",
+)
+
+group = parser.add_argument_group("Image options")
+group.add_argument(
+    "--image-workers",
+    type=uint,
+    default=None,
+    help="Number of processes preparing news photos, "
+         "by default the number of CPU cores",
+)
+group.add_argument(
+    "--news-image-budget-kb",
+    type=uint,
+    default=300,
+    help="Maximum size of a news photo, JPEG quality is lowered "
+         "until the photo fits",
+)
+group.add_argument(
+    "--news-image-format",
+    choices=("jpeg", "webp"),
+    default="jpeg",
+    help="Format of news photos uploaded to the site",
+)
+group.add_argument(
+    "--tool-workers",
+    type=uint,
+    default=None,
+    help="Number of processes of one external tool (convert, soffice, "
+         "unrar) running at the same time, by default the number "
+         "of CPU cores",
+)
+
+group = parser.add_argument_group("Archive options")
+group.add_argument(
+    "--archive-max-size-mb",
+    type=uint,
+    default=256,
+    help="Maximum total uncompressed size of files extracted "
+         "from a .zip or .rar attachment",
+)
+group.add_argument(
+    "--archive-max-members",
+    type=uint,
+    default=100,
+    help="Maximum number of files extracted from an archive",
+)
+group.add_argument(
+    "--archive-max-ratio",
+    type=ufloat,
+    default=100.0,
+    help="Maximum compression ratio of an archived file, "
+         "archives above it are rejected as zip bombs",
+)
+
+group = parser.add_argument_group("Cache options")
+group.add_argument(
+    "--cache-folder",
+    type=Path,
+    default=None,
+    help="Keep formatted documents, PDFs and prepared images "
+         "in this folder between mails, by default in the tmp folder",
+)
+group.add_argument(
+    "--cache-size-mb",
+    type=uint_or_zero,
+    default=512,
+    help="Cache size limit, least recently used files are removed first, "
+         "0 disables the cache",
+)
+
+group = parser.add_argument_group("LibreOffice options")
+group.add_argument(
+    "--office-listener",
+    action="store_true",
+    help="Keep LibreOffice running in background and convert documents "
+         "with it instead of starting soffice for every document, "
+         "requires the uno module (python3-uno)",
+)
+group.add_argument(
+    "--office-port",
+    type=uint,
+    default=2002,
+    help="Port on 127.0.0.1 for the background LibreOffice UNO listener",
+)
+group.add_argument(
+    "--office-workers",
+    type=uint,
+    default=1,
+    help="Number of documents converted by LibreOffice at the same time",
+)
+group.add_argument(
+    "--office-timeout",
+    type=ufloat,
+    default=60.0,
+    help="Timeout for LibreOffice start and document conversion, seconds",
+)
 
 group = parser.add_argument_group("Site options")
 group.add_argument("--site-url", type=URL, required=True)
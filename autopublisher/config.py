@@ -9,10 +9,12 @@ if platform.system().lower() == "darwin":
     FIREFOX_BINARY_PATH = "/Applications/Firefox.app/Contents/MacOS/firefox"
     SOFFICE_PATH = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
     IMAGEMAGICK_PATH = "/opt/homebrew/bin/convert"
+    UNRAR_PATH = "/opt/homebrew/bin/unrar"
 else:
     FIREFOX_BINARY_PATH = "/usr/bin/firefox"
     SOFFICE_PATH = "/usr/bin/soffice"
     IMAGEMAGICK_PATH = "/usr/local/bin/convert"
+    UNRAR_PATH = "/usr/bin/unrar"
 
 
 # ##### TELEGRAM SETTINGS ##### #
@@ -36,6 +38,7 @@ class Config:
     telegram_bot_owner_id: int
 
     mail_server: str
+    mail_port: int = 993
     mail_login: str
     mail_passwd: str
     mail_from: str
@@ -44,7 +47,41 @@ class Config:
     site_username: str
     site_passwd: str
 
+    mail_keepalive_interval: float = 60.0
+    mail_connect_timeout: float = 15.0
+    mail_timeout: float = 30.0
+    mail_retries: int = 3
+    mail_retry_backoff: float = 0.5
+    mail_retry_backoff_max: float = 8.0
+    mail_deadline: float = 120.0
+    mail_fetch_mode: str = "full"
+    mail_watch: bool = False
+    mail_idle_timeout: float = 300.0
+    mail_poll_interval: float = 60.0
+    mail_batch: bool = False
+    mail_batch_workers: int = 4
+    mail_async_workers: int = 4
+    mail_state_file: Path | None = None
+    mail_index_file: Path | None = None
+
     rasp_image_format: str = "png"
+    rasp_optimize_png: bool = True
+    image_workers: int | None = None
+    news_image_budget_kb: int = 300
+    news_image_format: str = "jpeg"
+    tool_workers: int | None = None
+
+    archive_max_size_mb: int = 256
+    archive_max_members: int = 100
+    archive_max_ratio: float = 100.0
+
+    cache_folder: Path | None = None
+    cache_size_mb: int = 512
+
+    office_listener: bool = False
+    office_port: int = 2002
+    office_workers: int = 1
+    office_timeout: float = 60.0
 
     web_driver_wait: int = 20
 
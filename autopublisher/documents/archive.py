@@ -0,0 +1,288 @@
+"""Распаковка .zip и .rar из вложений письма.
+
+Из архива достаются только файлы, которые нужны для публикации
+(.docx и картинки), без структуры папок. До распаковки по оглавлению
+архива проверяются лимиты: число файлов, их общий размер и степень
+сжатия каждого (zip-бомба). Данные пишутся на диск кусками,
+и фактический объем тоже считается: размеры в оглавлении могут врать.
+
+.rar распаковывается утилитой unrar одним запуском (unrar x) во временную
+папку: solid-архив при распаковке по одному файлу пришлось бы читать
+с начала для каждого. Оттуда файлы копируются с теми же проверками размера.
+"""
+
+import logging
+import re
+import tempfile
+import zipfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO
+
+from autopublisher.config import UNRAR_PATH, config
+from autopublisher.utils.process import ProcessError, run
+
+
+log = logging.getLogger(__name__)
+
+
+ARCHIVE_EXTENSIONS = (".zip", ".rar")
+EXTRACT_EXTENSIONS = (".docx", ".jpg", ".jpeg", ".png")
+
+CHUNK_SIZE = 1024 * 1024
+MB = 1024 * 1024
+
+UNRAR_TIMEOUT = 60.0
+# -p-: не спрашивать пароль, -cfg-: без настроек из ~/.rarrc
+UNRAR_OPTIONS = ("-p-", "-cfg-")
+UNRAR_FIELD_RE = re.compile(r"^\s*([A-Za-z][A-Za-z ]*): (.*)$")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ExtractLimits:
+    max_size: int
+    max_members: int
+    max_ratio: float
+
+    @classmethod
+    def from_config(cls) -> "ExtractLimits":
+        return cls(
+            max_size=config.archive_max_size_mb * MB,
+            max_members=config.archive_max_members,
+            max_ratio=config.archive_max_ratio,
+        )
+
+
+@dataclass(frozen=True)
+class ArchiveMember:
+    name: str
+    size: int
+    compress_size: int
+
+    @property
+    def filename(self) -> str:
+        return Path(self.name).name
+
+    @property
+    def ratio(self) -> float:
+        return self.size / max(self.compress_size, 1)
+
+
+MemberSourcesT = Iterator[tuple[ArchiveMember, IO[bytes]]]
+
+
+@dataclass
+class ExtractResult:
+    files: list[Path] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def select_members(
+        members: list[ArchiveMember], extensions: tuple[str, ...],
+) -> tuple[list[ArchiveMember], list[str]]:
+    """Файлы с нужными расширениями и имена остальных"""
+    selected, skipped = [], []
+    for member in members:
+        if member.filename.lower().endswith(extensions):
+            selected.append(member)
+        else:
+            skipped.append(member.name)
+    return selected, skipped
+
+
+def check_limits(members: list[ArchiveMember], limits: ExtractLimits) -> None:
+    """Проверка по оглавлению, до распаковки"""
+    if len(members) > limits.max_members:
+        raise ArchiveError(
+            f"Too many files: {len(members)} > {limits.max_members}",
+        )
+    size = sum(member.size for member in members)
+    if size > limits.max_size:
+        raise ArchiveError(
+            f"Too large: {size} > {limits.max_size} bytes uncompressed",
+        )
+    for member in members:
+        if member.ratio > limits.max_ratio:
+            raise ArchiveError(
+                f"Suspicious compression ratio {member.ratio:.0f} "
+                f"of {member.name}",
+            )
+
+
+def copy_chunks(source: IO[bytes], target: IO[bytes], budget: int) -> int:
+    """Копирует source в target кусками, не больше budget байт,
+    возвращает число записанных байт
+    """
+    written = 0
+    while chunk := source.read(CHUNK_SIZE):
+        written += len(chunk)
+        if written > budget:
+            raise ArchiveError("File is larger than its listed size")
+        target.write(chunk)
+    return written
+
+
+def copy_limited(source: IO[bytes], target: Path, budget: int) -> int:
+    """copy_chunks в файл target, который при ошибке удаляется"""
+    try:
+        with target.open("wb") as file:
+            return copy_chunks(source, file, budget)
+    except BaseException:
+        target.unlink(missing_ok=True)
+        raise
+
+
+def zip_members(archive: Path) -> list[ArchiveMember]:
+    with zipfile.ZipFile(archive) as zip_ref:
+        return [
+            ArchiveMember(info.filename, info.file_size, info.compress_size)
+            for info in zip_ref.infolist()
+            if not info.is_dir()
+        ]
+
+
+def read_zip_members(
+        zip_ref: zipfile.ZipFile, members: list[ArchiveMember],
+) -> MemberSourcesT:
+    for member in members:
+        with zip_ref.open(member.name) as source:
+            yield member, source
+
+
+@contextmanager
+def open_zip_members(
+        archive: Path, members: list[ArchiveMember], folder: Path,  # noqa:ARG001
+) -> Iterator[MemberSourcesT]:
+    with zipfile.ZipFile(archive) as zip_ref:
+        yield read_zip_members(zip_ref, members)
+
+
+def rar_members(archive: Path) -> list[ArchiveMember]:
+    """Оглавление из технического листинга unrar lt"""
+    output = run(
+        [UNRAR_PATH, "lt", *UNRAR_OPTIONS, "--", str(archive)],
+        timeout=UNRAR_TIMEOUT,
+    ).decode(errors="replace")
+    members = []
+    # поля архива до первого Name нам не нужны
+    fields: dict[str, str] = {}
+    for line in [*output.splitlines(), "Name: "]:
+        match = UNRAR_FIELD_RE.match(line)
+        if match is None:
+            continue
+        key, value = match.groups()
+        if key == "Name":
+            if fields.get("Type") == "File":
+                members.append(ArchiveMember(
+                    fields["Name"],
+                    int(fields.get("Size", 0)),
+                    int(fields.get("Packed size", 0)),
+                ))
+            fields = {}
+        fields[key] = value.strip()
+    return members
+
+
+def read_rar_members(
+        folder: Path, members: list[ArchiveMember],
+) -> MemberSourcesT:
+    # unrar -ep кладет одноименные файлы из разных папок в один,
+    # остается последний из архива
+    last = {member.filename: member for member in members}
+    for member in last.values():
+        with (folder / member.filename).open("rb") as source:
+            yield member, source
+
+
+@contextmanager
+def open_rar_members(
+        archive: Path, members: list[ArchiveMember], folder: Path,
+) -> Iterator[MemberSourcesT]:
+    """Распаковывает members одним запуском unrar x во временную
+    папку внутри folder, которая удаляется после копирования
+    """
+    with tempfile.TemporaryDirectory(prefix=".unrar-", dir=folder) as tmp:
+        if members:
+            # -ep: без папок из архива, -o+: перезаписывать одноименные
+            run(
+                [
+                    UNRAR_PATH, "x", "-inul", "-ep", "-o+", *UNRAR_OPTIONS,
+                    "--", str(archive), *(m.name for m in members),
+                    f"{tmp}/",
+                ],
+                timeout=UNRAR_TIMEOUT,
+            )
+        yield read_rar_members(Path(tmp), members)
+
+
+ARCHIVE_READERS = {
+    ".zip": (zip_members, open_zip_members),
+    ".rar": (rar_members, open_rar_members),
+}
+
+
+def extract_archive(
+        archive: Path,
+        folder: Path,
+        *,
+        extensions: tuple[str, ...] = EXTRACT_EXTENSIONS,
+        limits: ExtractLimits | None = None,
+) -> ExtractResult:
+    """Распаковывает из archive в folder без структуры папок
+    только файлы с расширениями extensions.
+    ArchiveError -- если архив испорчен или не проходит по лимитам,
+    тогда из архива в folder ничего не остается
+    """
+    limits = limits or ExtractLimits.from_config()
+    list_members, open_members = ARCHIVE_READERS[archive.suffix.lower()]
+    try:
+        members, skipped = select_members(list_members(archive), extensions)
+    except (zipfile.BadZipFile, ProcessError, ValueError) as e:
+        raise ArchiveError(f"Can't read {archive.name}: {e}") from e
+    check_limits(members, limits)
+
+    result = ExtractResult(skipped=skipped)
+    # при ошибке удаляются только файлы, которых в folder до нас не было
+    created: list[Path] = []
+    budget = limits.max_size
+    try:
+        with open_members(archive, members, folder) as sources:
+            for member, source in sources:
+                target = folder / member.filename
+                if target not in result.files:
+                    if not target.exists():
+                        created.append(target)
+                    result.files.append(target)
+                budget -= copy_limited(
+                    source, target, min(member.size, budget),
+                )
+    except (
+        zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError,
+        ProcessError,
+    ) as e:
+        remove_files(created)
+        raise ArchiveError(f"Can't extract {archive.name}: {e}") from e
+    except ArchiveError:
+        remove_files(created)
+        raise
+    log.info(
+        "Extracted %d files (%d bytes) from %s, skipped %d",
+        len(result.files), limits.max_size - budget, archive.name,
+        len(skipped),
+    )
+    return result
+
+
+def remove_files(files: list[Path]) -> None:
+    for file in files:
+        file.unlink(missing_ok=True)
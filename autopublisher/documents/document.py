@@ -1,25 +1,34 @@
-import logging
+import copy
 import os
-import re
-import shutil
+import struct
 import zipfile
-from io import BytesIO
+from collections.abc import Callable
 from pathlib import Path
-from subprocess import PIPE, Popen, call
 from types import TracebackType
-from xml.etree import ElementTree
+from typing import IO
 
-import html2text
 import mammoth
-from PIL import Image
+from PIL import Image, ImageOps
 
-from autopublisher.config import IMAGEMAGICK_PATH
+from autopublisher.documents.docx_xml import (
+    CantSplitTableRows,
+    ReplaceFont,
+    transform_docx_xml,
+)
 
 
-WORD_TMP_DIR = Path("word_tmp")
 FORMATTED_FILE = "tmp_new_rasp.docx"
 
-XML_NAME = WORD_TMP_DIR / "word" / "document.xml"
+DOCUMENT_XML = "word/document.xml"
+
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+LOCAL_HEADER_SIZE = 30
+DATA_DESCRIPTOR_FLAG = 0x08
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# как convert -quality 100: без прореживания цвета (4:4:4)
+JPEG_QUALITY = 100
+JPEG_SUBSAMPLING = 0
 
 OLD_FONT = "Izhitsa"
 NEW_FONT = "Times New Roman"
@@ -46,129 +55,90 @@ class cd:  # noqa:N801
         os.chdir(self.saved_path)
 
 
-def zipdir(path: Path, ziph: zipfile.ZipFile) -> None:
-    # ziph is zipfile handle
-    for root, _dirs, files in os.walk(path):
-        for file in files:
-            ziph.write(Path(root) / file)
-
-
-def unzip_without_structure(zip_name: Path, folder: Path) -> None:
-    with zipfile.ZipFile(zip_name, "r") as zip_ref:
-        for member in zip_ref.namelist():
-            filename = Path(member).name
-            # skip directories
-            if not filename:
-                continue
-
-            # copy file (taken from zipfile's extract)
-            with (
-                zip_ref.open(member) as source,
-                (folder / filename).open("wb") as target,
-            ):
-                shutil.copyfileobj(source, target)
-
-
-def unpack_docx(docx: Path, folder: Path) -> None:
-    if folder.exists():
-        raise ValueError(f"Folder {folder} is already exists")
-
-    folder.mkdir(parents=True)
-    zip_ref = zipfile.ZipFile(docx, "r")
-    zip_ref.extractall(folder)
-    zip_ref.close()
-
-
-def replace_font_in_docx_xml(
-        xml_name: Path, old_font: str, new_font: str,
+def copy_zip_member(
+        source: zipfile.ZipFile,
+        target: zipfile.ZipFile,
+        info: zipfile.ZipInfo,
 ) -> None:
-    with xml_name.open() as f:
-        xml_string = f.read()
-
-    if old_font not in xml_string:
-        raise ValueError(f"Font {old_font} not fount in document")
-
-    xml_string = xml_string.replace(old_font, new_font)
-
-    with xml_name.open("w") as f:
-        f.write(xml_string)
-
-
-def add_cant_split_to_tr(
-        tr: ElementTree.Element,
-        NS: dict[str, str],  # noqa:N803
-        NS_PREFIX: str,  # noqa:N803
+    """Копирует элемент info из архива source в target как есть,
+    без распаковки и повторного сжатия.
+    zipfile так не умеет, поэтому локальный заголовок пишем сами,
+    так же, как это делает ZipFile.writestr.
+    """
+    if source.fp is None or target.fp is None:
+        raise ValueError("Zip file is closed")
+
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(LOCAL_HEADER_SIZE)
+    if header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header: {info.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source.fp.seek(name_length + extra_length, os.SEEK_CUR)
+
+    new_info = copy.copy(info)
+    # размеры известны заранее, data descriptor после данных не нужен
+    new_info.flag_bits &= ~DATA_DESCRIPTOR_FLAG
+    target.fp.seek(target.start_dir)
+    new_info.header_offset = target.fp.tell()
+    target.fp.write(new_info.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        chunk = source.fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated member: {info.filename}")
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+    target.start_dir = target.fp.tell()
+    target.filelist.append(new_info)
+    target.NameToInfo[new_info.filename] = new_info
+
+
+def rewrite_docx(
+        docx: Path,
+        new_docx: Path,
+        transform: Callable[[IO[bytes], IO[bytes]], None],
 ) -> None:
-    """Запрещает перенос строк на другую страницу
-       в таблице в вордовском документе
+    """Собирает new_docx из docx, пропуская word/document.xml
+    через transform(source, target). Остальные файлы (картинки, стили)
+    копируются как есть, без распаковки на диск и повторного сжатия.
     """
-    if tr.tag != f"{NS_PREFIX}tr":
-        raise ValueError(
-            "Function add_cant_split get non-tr tag or broken NAMESPACE",
-        )
-    trpr = tr.find("w:trPr", NS)
-    if trpr is None:
-        logging.warning(
-            "Function add_cant_split can't find trPr element in tr",
-        )
-        trpr = ElementTree.Element("{%s}trPr" % NS["w"])
-        tr.append(trpr)
-    cant_split = trpr.find("w:cantSplit", NS)
-    if cant_split is None:
-        new_cant_split = ElementTree.Element(
-            f"{NS_PREFIX}cantSplit", {f"{NS_PREFIX}val": "true"},
-        )
-        trpr.append(new_cant_split)
-
-
-def disable_table_split_in_docx_xml(xml_name: Path) -> None:
-    tree = ElementTree.parse(xml_name)
-    root = tree.getroot()
-
-    NAMESPACE = re.findall(r"\{(.*?)\}", root.tag)[0]  # noqa: N806
-    NS = {"w": NAMESPACE}  # noqa: N806
-    NS_PREFIX = "{%s}" % NAMESPACE  # noqa: N806
-    body = root.find("w:body", NS)
-    table = body.find("w:tbl", NS)  # type: ignore[union-attr]
-    for tr in table.findall("w:tr", NS):  # type: ignore[union-attr]
-        add_cant_split_to_tr(tr, NS, NS_PREFIX)
-    tree.write(xml_name)
-
+    if new_docx.exists():
+        raise ValueError(f"Docx file is already exists: {new_docx}")
+
+    with (
+        zipfile.ZipFile(docx, "r") as source,
+        zipfile.ZipFile(new_docx, "w") as target,
+    ):
+        for info in source.infolist():
+            if info.filename != DOCUMENT_XML:
+                copy_zip_member(source, target, info)
+                continue
+            new_info = copy.copy(info)
+            new_info.compress_type = zipfile.ZIP_DEFLATED
+            with (
+                source.open(info) as xml,
+                target.open(new_info, "w") as new_xml,
+            ):
+                transform(xml, new_xml)
 
-def pack_docx(docx_name: Path, folder_from: Path) -> None:
-    if not folder_from.exists():
-        raise ValueError(f"Can't found docx folder: {folder_from}")
-    if docx_name.exists():
-        raise ValueError(f"Docx file is already exists: {docx_name}")
 
-    zipf = zipfile.ZipFile(docx_name, "w", zipfile.ZIP_DEFLATED)
-    with cd(folder_from):
-        for item in Path().iterdir():
-            if not item.is_file():
-                zipdir(item, zipf)
-            else:
-                zipf.write(item)
-    zipf.close()
+def format_rasp_xml(source: IO[bytes], target: IO[bytes]) -> None:
+    transform_docx_xml(source, target, [
+        ReplaceFont(OLD_FONT, NEW_FONT),
+        CantSplitTableRows(),
+    ])
 
 
 def format_rasp_docx(docx: Path, mail_folder: Path) -> Path:
-    word_tmp_dir = mail_folder / WORD_TMP_DIR
-    unpack_docx(docx, word_tmp_dir)
-    xml_full_name = mail_folder / XML_NAME
     formatted_filename = mail_folder / FORMATTED_FILE
-    replace_font_in_docx_xml(xml_full_name, OLD_FONT, NEW_FONT)
-    disable_table_split_in_docx_xml(xml_full_name)
-    pack_docx(formatted_filename, word_tmp_dir)
-    shutil.rmtree(word_tmp_dir)
+    rewrite_docx(docx, formatted_filename, format_rasp_xml)
     return formatted_filename
 
 
 def get_image_size(image_filename: Path) -> tuple[int, int]:
-    with image_filename.open("rb") as f:
-        image_file = BytesIO(f.read())
-    image = Image.open(image_file)
-    width, height = image.size
-    return width, height
+    # Image.open читает только заголовок, сама картинка не декодируется
+    with Image.open(image_filename) as image:
+        return image.size
 
 
 def get_resized_image_size(
@@ -179,26 +149,57 @@ def get_resized_image_size(
     return int(width / coef), int(height / coef)
 
 
+def load_image_on_wide_size(
+        path: Path, wide_side_size: int, *, enlarge: bool = True,
+) -> tuple[Image.Image, bytes | None]:
+    """Картинка, повернутая по EXIF, с размером wide_side_size
+    по широкой стороне, и ее ICC-профиль. Большие JPEG уменьшаются
+    уже при декодировании (draft), затем -- LANCZOS до нужного размера.
+    Без enlarge картинки меньше wide_side_size остаются как есть.
+    """
+    with Image.open(path) as source:
+        width, height = source.size
+        # декодер JPEG уменьшает в 2, 4 или 8 раз, но не меньше
+        # нужного размера, дальше уменьшаем уже LANCZOS
+        source.draft(
+            "RGB", get_resized_image_size(width, height, wide_side_size),
+        )
+        icc_profile = source.info.get("icc_profile")
+        ImageOps.exif_transpose(source, in_place=True)
+        if source.mode in ("RGB", "L"):
+            image = source
+        else:
+            # профиль CMYK к RGB-картинке не подходит
+            icc_profile = None
+            image = source.convert("RGB")
+        width, height = image.size
+        if enlarge or max(width, height) > wide_side_size:
+            image = image.resize(
+                get_resized_image_size(width, height, wide_side_size),
+                Image.Resampling.LANCZOS,
+            )
+        elif image is source:
+            image = source.copy()
+    return image, icc_profile
+
+
 def resize_jpeg_on_wide_size(
         jpeg: Path, new_jpeg: Path, wide_side_size: int,
-) -> None:
-    """Ресайз картинки с определенным размером по широкой стороне.
-    Пример bash-команды для аналогичной задачи:
-    `for jpeg in *.jpg; do convert $jpeg -resize 1024 -quality 100 \
-     $(echo ${jpeg%%.*}_1.jpg); done`
+) -> Path:
+    """Ресайз картинки с определенным размером по широкой стороне,
+    см. load_image_on_wide_size. ICC-профиль и остальные EXIF-теги
+    сохраняются.
     """
-    width, height = get_image_size(jpeg)
-    m_width, m_height = get_resized_image_size(
-        width, height, wide_side=wide_side_size,
+    resized, icc_profile = load_image_on_wide_size(jpeg, wide_side_size)
+    resized.save(
+        new_jpeg,
+        "JPEG",
+        quality=JPEG_QUALITY,
+        subsampling=JPEG_SUBSAMPLING,
+        icc_profile=icc_profile,
+        exif=resized.info.get("exif", b""),
     )
-
-    call([  # noqa:S603 (check for execution of untrusted input)
-        IMAGEMAGICK_PATH,
-        str(jpeg),
-        "-resize", str(m_width),
-        "-quality", "100",
-        str(new_jpeg),
-    ])
+    return new_jpeg
 
 
 def docx2html(docx: Path) -> tuple[HtmlT, list[str]]:
@@ -210,40 +211,3 @@ def docx2html(docx: Path) -> tuple[HtmlT, list[str]]:
         messages = result.messages
     return html, messages
 
-
-def get_lines_from_html(html: HtmlT) -> list[str]:
-    h = html2text.HTML2Text()
-    h.ignore_links = True
-    h.bypass_tables = True
-    h.blockquote = -1
-    h.strong_mark = ""
-    text = h.handle(html)
-    # html2text вставляет внутри абзацев переносы строк (видимо, для красоты),
-    # а сами абзацы отделяет четырьмя переносами строк
-    # поэтому разбиваем текст на абзацы,
-    # а переносы строк внутри абзацев убираем.
-    return [
-        line.strip().replace("\n", " ")
-        for line in re.split(r"\n{2,}", text)
-        if line and not re.match(r"^\s+$", line)
-    ]
-
-
-def get_text_from_html(html: HtmlT) -> str:
-    lines = get_lines_from_html(html)
-    return "\n".join(lines)
-
-
-def unrar(rarfile: Path, folder: Path) -> str:
-    # TODO: переписать на новое API subprocess
-    p = Popen(
-        ["/usr/bin/unrar", "x", str(rarfile), str(folder)],  # noqa: S603
-        stdin=PIPE,
-        stdout=PIPE,
-        stderr=PIPE,
-    )
-    output, err = p.communicate()
-    rc = p.returncode
-    output = output.decode()  # type: ignore[assignment]
-    err = err.decode()  # type: ignore[assignment]
-    return f"Output: \n{output}\nErrors: \n{err}\nReturn Code: {rc}"  # type: ignore[str-bytes-safe]
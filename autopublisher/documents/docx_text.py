@@ -0,0 +1,567 @@
+"""Текст новости напрямую из word/document.xml.
+
+Раньше абзацы получались тремя преобразованиями: docx -> HTML
+(mammoth) -> Markdown (html2text) -> строки (split_markdown_lines).
+Здесь document.xml читается потоком expat сразу в абзацы
+с форматированием: повторяем HTML, который дал бы mammoth (слияние
+одинаково оформленных кусков, пустые элементы), и отдаем его
+html_text.MarkdownWriter, который пишет строки так же, как html2text.
+
+Таблицы, списки, картинки, поля, сноски и все остальное, чего здесь
+нет, не разбираются: для таких документов DocxTextError, и их
+по-старому конвертирует mammoth.
+"""
+
+import re
+import zipfile
+from collections.abc import Callable
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from pathlib import Path
+from typing import IO
+from xml.parsers import expat
+
+from html2text.utils import hn
+
+from autopublisher.documents.document import DOCUMENT_XML
+from autopublisher.documents.docx_xml import (
+    CHUNK_SIZE,
+    NAMESPACE_SEPARATOR,
+    W_NAMESPACE,
+)
+from autopublisher.documents.html_text import MarkdownWriter
+
+
+STYLES_XML = "word/styles.xml"
+NUMBERING_XML = "word/numbering.xml"
+
+W_PREFIX = f"{W_NAMESPACE}{NAMESPACE_SEPARATOR}"
+W_VAL = f"{W_PREFIX}val"
+W_TYPE = f"{W_PREFIX}type"
+W_STYLE_ID = f"{W_PREFIX}styleId"
+W_NAME = f"{W_PREFIX}name"
+W_ANCHOR = f"{W_PREFIX}anchor"
+W_TGT_FRAME = f"{W_PREFIX}tgtFrame"
+R_ID = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    f"{NAMESPACE_SEPARATOR}id"
+)
+
+# стили заголовков из стандартной карты стилей mammoth:
+# по id точно, по имени без учета регистра
+HEADING_STYLE_IDS = {f"Heading{level}": level for level in range(1, 7)}
+HEADING_STYLE_IDS["Heading"] = 1
+HEADING_STYLE_NAMES = {f"HEADING {level}": level for level in range(1, 7)}
+HEADING_STYLE_NAMES["HEADING"] = 1
+STRONG_STYLE_NAME = "STRONG"
+# закладка Word "последнее исправление", mammoth ее не выводит
+GO_BACK_BOOKMARK = "_GoBack"
+FALSE_VALUES = ("false", "0")
+
+# элементы, которые mammoth пропускает вместе с содержимым
+SKIPPED_ELEMENTS = frozenset({
+    "bookmarkEnd",
+    "commentRangeEnd",
+    "commentRangeStart",
+    "cr",
+    "customXmlPr",
+    "del",
+    "lastRenderedPageBreak",
+    "moveFrom",
+    "moveFromRangeEnd",
+    "moveFromRangeStart",
+    "moveToRangeEnd",
+    "moveToRangeStart",
+    "proofErr",
+    "sectPr",
+    "smartTagPr",
+})
+# элементы, содержимое которых mammoth читает как содержимое родителя
+TRANSPARENT_ELEMENTS = frozenset({"customXml", "ins", "moveTo", "smartTag"})
+# символы, которые mammoth пишет в HTML сущностями
+ENTITY_CHARS_RE = re.compile(r'([&<>"])')
+VOID_TAGS = frozenset({"br"})
+
+# режим разбора прозрачного элемента: как у родителя
+INHERIT_MODE = "inherit"
+# режимы, в которых элементы чужих пространств имен (расширения Word,
+# вроде w14:ligatures) пропускаются, а не делают документ неподдерживаемым
+PROPERTIES_MODES = frozenset({
+    "root",
+    "document",
+    "paragraph_properties",
+    "paragraph_mark",
+    "run_properties",
+})
+
+
+class DocxTextError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Span:
+    """Кусок абзаца с одним оформлением, переносы строк -- \\n"""
+    text: str
+    bold: bool = False
+    italic: bool = False
+    strike: bool = False
+
+
+@dataclass
+class Element:
+    """Элемент HTML, который сделал бы mammoth"""
+    tag: str
+    children: list["Node"] = field(default_factory=list)
+    # атрибуты, по которым mammoth решает, сливать ли соседние элементы
+    attrs: tuple[str | None, ...] = ()
+    collapsible: bool = False
+    # пишется, даже если пустой (закладка)
+    force: bool = False
+
+
+Node = Element | str
+
+
+@dataclass(frozen=True)
+class DocxParagraph:
+    element: Element
+
+    @property
+    def heading(self) -> int:
+        """Уровень заголовка или 0 для обычного абзаца"""
+        return hn(self.element.tag)
+
+    @property
+    def text(self) -> str:
+        return "".join(iter_text(self.element))
+
+    @cached_property
+    def spans(self) -> list[Span]:
+        spans: list[Span] = []
+        collect_spans(self.element, Span(""), spans)
+        return spans
+
+
+@dataclass(frozen=True)
+class DocxText:
+    nodes: list[Node]
+
+    @cached_property
+    def paragraphs(self) -> list[DocxParagraph]:
+        return [
+            DocxParagraph(node) for node in self.nodes
+            if isinstance(node, Element) and node.tag != "a"
+        ]
+
+    @property
+    def title(self) -> str:
+        """Кандидат в заголовок, как NewsDocument.title:
+        текст первого абзаца <p>
+        """
+        for paragraph in self.paragraphs:
+            if not paragraph.heading:
+                return paragraph.text
+        return ""
+
+    @cached_property
+    def lines(self) -> list[str]:
+        """Абзацы простым текстом, как get_lines_from_html"""
+        writer = MarkdownWriter()
+        write_nodes(writer, self.nodes)
+        return writer.finish()
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def iter_text(node: Node) -> list[str]:
+    if isinstance(node, str):
+        return [node]
+    return [text for child in node.children for text in iter_text(child)]
+
+
+def collect_spans(node: Node, style: Span, spans: list[Span]) -> None:
+    if isinstance(node, str):
+        if spans and replace(spans[-1], text="") == style:
+            spans[-1] = replace(spans[-1], text=spans[-1].text + node)
+        else:
+            spans.append(replace(style, text=node))
+        return
+    if node.tag in VOID_TAGS:
+        collect_spans("\n", style, spans)
+        return
+    if node.tag == "strong":
+        style = replace(style, bold=True)
+    elif node.tag == "em":
+        style = replace(style, italic=True)
+    elif node.tag == "s":
+        style = replace(style, strike=True)
+    for child in node.children:
+        collect_spans(child, style, spans)
+
+
+# ##### HTML как у mammoth ##### #
+
+def strip_empty(nodes: list[Node]) -> list[Node]:
+    stripped: list[Node] = []
+    for node in nodes:
+        if isinstance(node, str):
+            if node:
+                stripped.append(node)
+            continue
+        node.children = strip_empty(node.children)
+        if node.children or node.force or node.tag in VOID_TAGS:
+            stripped.append(node)
+    return stripped
+
+
+def collapse(nodes: list[Node]) -> list[Node]:
+    """Сливает соседние одинаковые элементы: <strong>a</strong>
+    <strong>b</strong> -> <strong>ab</strong>
+    """
+    collapsed: list[Node] = []
+    for node in nodes:
+        add_collapsed(collapsed, node)
+    return collapsed
+
+
+def add_collapsed(collapsed: list[Node], node: Node) -> None:
+    if isinstance(node, Element):
+        node.children = collapse(node.children)
+    last = collapsed[-1] if collapsed else None
+    if (
+            isinstance(last, Element)
+            and isinstance(node, Element)
+            and node.collapsible
+            and last.tag == node.tag
+            and last.attrs == node.attrs
+    ):
+        for child in node.children:
+            add_collapsed(last.children, child)
+    else:
+        collapsed.append(node)
+
+
+def write_nodes(writer: MarkdownWriter, nodes: list[Node]) -> None:
+    text: list[str] = []
+    for node in nodes:
+        if isinstance(node, str):
+            text.append(node)
+            continue
+        write_text(writer, "".join(text))
+        text = []
+        writer.tag(node.tag, {}, start=True)
+        write_nodes(writer, node.children)
+        writer.tag(node.tag, {}, start=False)
+    write_text(writer, "".join(text))
+
+
+def write_text(writer: MarkdownWriter, text: str) -> None:
+    """Текст так, как его отдает html2text парсер HTML:
+    сущности отдельными кусками
+    """
+    for i, part in enumerate(ENTITY_CHARS_RE.split(text)):
+        writer.data(part, entity=bool(i % 2))
+
+
+# ##### Чтение docx ##### #
+
+@dataclass
+class DocxStyles:
+    # имена стилей по (тип стиля, id)
+    names: dict[tuple[str, str], str] = field(default_factory=dict)
+    # стили абзацев, к которым привязана нумерация (списки)
+    numbered: set[str] = field(default_factory=set)
+
+    def name(self, style_type: str, style_id: str) -> str:
+        return self.names.get((style_type, style_id), "").upper()
+
+
+def scan_xml(
+        source: IO[bytes], start: Callable[[str, dict[str, str]], None],
+) -> None:
+    parser = expat.ParserCreate(namespace_separator=NAMESPACE_SEPARATOR)
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.ParseFile(source)
+
+
+def read_styles(docx: zipfile.ZipFile) -> DocxStyles:
+    styles = DocxStyles()
+    members = set(docx.namelist())
+    style: tuple[str, str] | None = None
+
+    def style_start(name: str, attrs: dict[str, str]) -> None:
+        nonlocal style
+        if name == f"{W_PREFIX}style":
+            style = attrs.get(W_TYPE, ""), attrs.get(W_STYLE_ID, "")
+        elif name == f"{W_PREFIX}name" and style is not None:
+            styles.names[style] = attrs.get(W_VAL, "")
+
+    def numbering_start(name: str, attrs: dict[str, str]) -> None:
+        if name == f"{W_PREFIX}pStyle":
+            styles.numbered.add(attrs.get(W_VAL, ""))
+
+    if STYLES_XML in members:
+        with docx.open(STYLES_XML) as source:
+            scan_xml(source, style_start)
+    if NUMBERING_XML in members:
+        with docx.open(NUMBERING_XML) as source:
+            scan_xml(source, numbering_start)
+    return styles
+
+
+@dataclass
+class _Run:
+    bold: bool = False
+    italic: bool = False
+    strike: bool = False
+    vertical_alignment: str | None = None
+    style_id: str | None = None
+    children: list[Node] = field(default_factory=list)
+
+
+class DocxTextReader:
+    """Обработчик событий expat: собирает абзацы document.xml
+    в элементы HTML, как mammoth
+    """
+
+    def __init__(self, styles: DocxStyles):
+        self.styles = styles
+        self.nodes: list[Node] = []
+        # что делать с дочерними элементами: имя метода-обработчика
+        # и открыл ли этот режим сам элемент (у прозрачных -- режим
+        # родителя, и конец элемента его не закрывает)
+        self._modes: list[tuple[str, bool]] = [("root", True)]
+        # глубина внутри пропускаемого элемента
+        self._skip = 0
+        # контейнеры (абзац, ссылка), куда добавляются прогоны
+        self._containers: list[list[Node]] = [self.nodes]
+        self._style_id: str | None = None
+        self._run: _Run | None = None
+        self._text: list[str] | None = None
+
+    def parse(self, source: IO[bytes]) -> list[Node]:
+        parser = expat.ParserCreate(namespace_separator=NAMESPACE_SEPARATOR)
+        parser.buffer_text = True
+        parser.buffer_size = CHUNK_SIZE
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.characters
+        parser.ParseFile(source)
+        return collapse(strip_empty(self.nodes))
+
+    def start_element(self, name: str, attrs: dict[str, str]) -> None:
+        if self._skip:
+            self._skip += 1
+            return
+        current, _ = self._modes[-1]
+        if not name.startswith(W_PREFIX):
+            if current in PROPERTIES_MODES:
+                self._skip = 1
+                return
+            raise DocxTextError(f"Unsupported element {name}")
+        local = name[len(W_PREFIX):]
+        handler = getattr(self, f"_start_{current}")
+        mode = handler(local, attrs)
+        if mode is None:
+            self._skip = 1
+        elif mode == INHERIT_MODE:
+            self._modes.append((current, False))
+        else:
+            self._modes.append((mode, True))
+
+    def end_element(self, _name: str) -> None:
+        if self._skip:
+            self._skip -= 1
+            return
+        mode, opened = self._modes.pop()
+        handler = getattr(self, f"_end_{mode}", None)
+        if opened and handler is not None:
+            handler()
+
+    def characters(self, data: str) -> None:
+        if self._text is not None and not self._skip:
+            self._text.append(data)
+
+    # Обработчики дочерних элементов: возвращают режим для элемента,
+    # INHERIT_MODE или None, если его надо пропустить целиком
+
+    def _start_root(self, local: str, _attrs: dict[str, str]) -> str:
+        if local != "document":
+            raise DocxTextError(f"Unsupported root element {local}")
+        return "document"
+
+    def _start_document(
+            self, local: str, _attrs: dict[str, str],
+    ) -> str | None:
+        return "body" if local == "body" else None
+
+    def _start_body(self, local: str, attrs: dict[str, str]) -> str | None:
+        if local == "p":
+            self._style_id = None
+            self._containers.append([])
+            return "paragraph"
+        return self._start_common(local, attrs)
+
+    def _start_paragraph(
+            self, local: str, attrs: dict[str, str],
+    ) -> str | None:
+        if local == "pPr":
+            return "paragraph_properties"
+        if local == "hyperlink":
+            return self._start_hyperlink(attrs)
+        return self._start_link(local, attrs)
+
+    def _start_link(self, local: str, attrs: dict[str, str]) -> str | None:
+        if local == "r":
+            self._run = _Run()
+            return "run"
+        return self._start_common(local, attrs)
+
+    def _start_common(self, local: str, attrs: dict[str, str]) -> str | None:
+        if local in SKIPPED_ELEMENTS:
+            return None
+        if local in TRANSPARENT_ELEMENTS:
+            return INHERIT_MODE
+        if local == "bookmarkStart":
+            name = attrs.get(W_NAME)
+            if name != GO_BACK_BOOKMARK:
+                self._containers[-1].append(Element(
+                    "a", attrs=(name,), collapsible=True, force=True,
+                ))
+            return None
+        raise DocxTextError(f"Unsupported element w:{local}")
+
+    def _start_hyperlink(self, attrs: dict[str, str]) -> str:
+        key = (attrs.get(R_ID), attrs.get(W_ANCHOR), attrs.get(W_TGT_FRAME))
+        if key == (None, None, None):
+            # mammoth выводит содержимое такой ссылки как есть
+            return INHERIT_MODE
+        link = Element("a", attrs=key, collapsible=True)
+        self._containers[-1].append(link)
+        self._containers.append(link.children)
+        return "link"
+
+    def _start_paragraph_properties(
+            self, local: str, attrs: dict[str, str],
+    ) -> str | None:
+        if local == "pStyle":
+            self._style_id = attrs.get(W_VAL)
+        elif local == "numPr":
+            raise DocxTextError("Numbered paragraphs are not supported")
+        elif local == "rPr":
+            return "paragraph_mark"
+        return None
+
+    def _start_paragraph_mark(
+            self, local: str, _attrs: dict[str, str],
+    ) -> str | None:
+        if local == "del":
+            raise DocxTextError("Deleted paragraphs are not supported")
+        return None
+
+    def _start_run(self, local: str, attrs: dict[str, str]) -> str | None:
+        assert self._run is not None  # noqa:S101
+        if local == "rPr":
+            return "run_properties"
+        if local == "t":
+            self._text = []
+            return "text"
+        if local == "tab":
+            self._run.children.append("\t")
+        elif local == "br":
+            if attrs.get(W_TYPE, "textWrapping") == "textWrapping":
+                self._run.children.append(Element("br"))
+        elif local == "noBreakHyphen":
+            self._run.children.append("\u2011")
+        elif local == "softHyphen":
+            self._run.children.append("\u00ad")
+        elif local not in SKIPPED_ELEMENTS:
+            raise DocxTextError(f"Unsupported run element w:{local}")
+        return None
+
+    def _start_run_properties(
+            self, local: str, attrs: dict[str, str],
+    ) -> str | None:
+        assert self._run is not None  # noqa:S101
+        value = attrs.get(W_VAL)
+        if local == "b":
+            self._run.bold = value not in FALSE_VALUES
+        elif local == "i":
+            self._run.italic = value not in FALSE_VALUES
+        elif local == "strike":
+            self._run.strike = value not in FALSE_VALUES
+        elif local == "vertAlign":
+            self._run.vertical_alignment = value
+        elif local == "rStyle":
+            self._run.style_id = value
+        return None
+
+    def _start_text(self, local: str, _attrs: dict[str, str]) -> None:
+        raise DocxTextError(f"Unsupported text element w:{local}")
+
+    # Обработчики конца элементов по режиму
+
+    def _end_paragraph(self) -> None:
+        children = self._containers.pop()
+        style_id = self._style_id
+        if style_id in self.styles.numbered:
+            raise DocxTextError("Numbered paragraphs are not supported")
+        level = 0
+        if style_id is not None:
+            level = HEADING_STYLE_IDS.get(style_id) or HEADING_STYLE_NAMES.get(
+                self.styles.name("paragraph", style_id), 0,
+            )
+        tag = f"h{level}" if level else "p"
+        self._containers[-1].append(Element(tag, children))
+
+    def _end_link(self) -> None:
+        self._containers.pop()
+
+    def _end_text(self) -> None:
+        assert self._run is not None  # noqa:S101
+        assert self._text is not None  # noqa:S101
+        self._run.children.append("".join(self._text))
+        self._text = None
+
+    def _end_run(self) -> None:
+        run = self._run
+        assert run is not None  # noqa:S101
+        self._run = None
+        # как mammoth: s внутри sup/sub, внутри em, внутри strong,
+        # снаружи стиль Strong
+        nodes = run.children
+        wrappers = [
+            run.strike and "s",
+            run.vertical_alignment == "superscript" and "sup",
+            run.vertical_alignment == "subscript" and "sub",
+            run.italic and "em",
+            run.bold and "strong",
+            (
+                run.style_id is not None
+                and self.styles.name("character", run.style_id)
+                == STRONG_STYLE_NAME
+                and "strong"
+            ),
+        ]
+        for tag in wrappers:
+            if tag:
+                nodes = [Element(tag, nodes, collapsible=True)]
+        self._containers[-1].extend(nodes)
+
+
+def read_docx_text(docx: Path) -> DocxText:
+    """Абзацы новости из docx, DocxTextError -- если в документе
+    есть то, чего этот разбор не умеет
+    """
+    try:
+        with zipfile.ZipFile(docx) as docx_zip:
+            styles = read_styles(docx_zip)
+            with docx_zip.open(DOCUMENT_XML) as source:
+                nodes = DocxTextReader(styles).parse(source)
+    except (KeyError, zipfile.BadZipFile, expat.ExpatError) as e:
+        raise DocxTextError(f"Can't read {docx}: {e}") from e
+    return DocxText(nodes)
@@ -0,0 +1,309 @@
+"""Потоковое преобразование word/document.xml.
+
+Документ читается парсером expat и сразу пишется в выходной поток,
+дерево целиком в памяти не строится. Что менять, решают правила
+(DocxXmlRule): каждое получает события начала и конца элементов,
+может поменять атрибуты элемента и дописать свои элементы.
+Все правила применяются за один проход, поэтому новое исправление
+расписания -- это новое правило, а не еще один разбор документа.
+"""
+
+import logging
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import IO
+from xml.parsers import expat
+
+
+log = logging.getLogger(__name__)
+
+
+W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+NAMESPACE_SEPARATOR = " "
+
+CHUNK_SIZE = 64 * 1024
+# сколько кусков текста копить перед записью в target
+FLUSH_CHUNKS = 4096
+
+# пространство имен и локальное имя
+QName = tuple[str | None, str]
+AttrsT = dict[QName, str]
+
+
+def w(name: str) -> QName:
+    return W_NAMESPACE, name
+
+
+W_TR = w("tr")
+W_TR_PR = w("trPr")
+W_TBL_PR_EX = w("tblPrEx")
+W_CANT_SPLIT = w("cantSplit")
+W_RFONTS = w("rFonts")
+W_VAL = w("val")
+
+
+class DocxXmlRule:
+    """Правило преобразования document.xml.
+
+    start и end вызываются до того, как начало или конец элемента
+    будут записаны. В start можно поменять attrs на месте,
+    а через методы writer дописать элементы перед текущим
+    (в start) или в конец текущего (в end).
+    """
+
+    def start(
+            self, writer: "DocxXmlWriter", name: QName, attrs: AttrsT,
+    ) -> None:
+        pass
+
+    def end(self, writer: "DocxXmlWriter", name: QName) -> None:
+        pass
+
+    def finish(self) -> None:
+        """Вызывается после прохода, например, чтобы проверить,
+        что правило сработало
+        """
+
+
+class DocxXmlWriter:
+    """Обработчик событий expat, который пишет документ в target,
+    применяя правила rules
+    """
+
+    def __init__(self, target: IO[bytes], rules: Sequence[DocxXmlRule]):
+        self.target = target
+        self.rules = rules
+        # элементы, открытые выше текущего
+        self.path: list[QName] = []
+        # префиксы пространств имен, объявленных в документе;
+        # в .docx все они объявлены в корневом элементе
+        self.prefixes: dict[str | None, str] = {None: "", XML_NAMESPACE: "xml"}
+        self._names: dict[str, QName] = {}
+        self._qnames: dict[QName, str] = {}
+        self._declarations: list[str] = []
+        self._chunks: list[str] = []
+        # начало элемента записано без ">", вдруг он пустой
+        self._pending = False
+
+    @property
+    def parent(self) -> QName | None:
+        return self.path[-1] if self.path else None
+
+    def open_element(self, name: QName, attrs: AttrsT | None = None) -> None:
+        """Пишет начало элемента name, правила к нему не применяются"""
+        self._finish_pending()
+        chunks = ["<", self._qname(name), *self._declarations]
+        self._declarations = []
+        if attrs:
+            for key, value in attrs.items():
+                chunks += " ", self._qname(key), '="', escape_attr(value), '"'
+        self._write("".join(chunks))
+        self._pending = True
+
+    def close_element(self, name: QName) -> None:
+        if self._pending:
+            self._pending = False
+            self._write("/>")
+        else:
+            self._write(f"</{self._qname(name)}>")
+
+    def write_element(self, name: QName, attrs: AttrsT | None = None) -> None:
+        """Пишет пустой элемент name"""
+        self.open_element(name, attrs)
+        self.close_element(name)
+
+    def parse(self, source: IO[bytes]) -> None:
+        parser = expat.ParserCreate(namespace_separator=NAMESPACE_SEPARATOR)
+        parser.buffer_text = True
+        parser.buffer_size = CHUNK_SIZE
+        parser.XmlDeclHandler = self.xml_declaration
+        parser.StartNamespaceDeclHandler = self.start_namespace
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.characters
+        parser.CommentHandler = self.comment
+        parser.ProcessingInstructionHandler = self.processing_instruction
+        parser.ParseFile(source)
+        self._flush()
+
+    def xml_declaration(
+            self, version: str, _encoding: str | None, standalone: int,
+    ) -> None:
+        declaration = f'<?xml version="{version}" encoding="UTF-8"'
+        if standalone != -1:
+            declaration += f' standalone="{"yes" if standalone else "no"}"'
+        self._write(declaration + "?>\n")
+
+    def start_namespace(self, prefix: str | None, uri: str) -> None:
+        self.prefixes[uri] = prefix or ""
+        self._qnames.clear()
+        if prefix:
+            self._declarations.append(f' xmlns:{prefix}="{escape_attr(uri)}"')
+        else:
+            self._declarations.append(f' xmlns="{escape_attr(uri)}"')
+
+    def start_element(self, name: str, attributes: dict[str, str]) -> None:
+        element = self._name(name)
+        attrs = {
+            self._name(key): value for key, value in attributes.items()
+        } if attributes else {}
+        for rule in self.rules:
+            rule.start(self, element, attrs)
+        self.open_element(element, attrs)
+        self.path.append(element)
+
+    def end_element(self, _name: str) -> None:
+        element = self.path.pop()
+        for rule in self.rules:
+            rule.end(self, element)
+        self.close_element(element)
+        if len(self._chunks) >= FLUSH_CHUNKS:
+            self._flush()
+
+    def characters(self, data: str) -> None:
+        self._finish_pending()
+        self._write(escape_text(data))
+
+    def comment(self, data: str) -> None:
+        self._finish_pending()
+        self._write(f"<!--{data}-->")
+
+    def processing_instruction(self, target: str, data: str) -> None:
+        self._finish_pending()
+        self._write(f"<?{target} {data}?>")
+
+    def _name(self, name: str) -> QName:
+        try:
+            return self._names[name]
+        except KeyError:
+            uri, _, local = name.rpartition(NAMESPACE_SEPARATOR)
+            qname = self._names[name] = (uri or None, local)
+            return qname
+
+    def _qname(self, name: QName) -> str:
+        try:
+            return self._qnames[name]
+        except KeyError:
+            namespace, local = name
+            prefix = self.prefixes[namespace]
+            qname = self._qnames[name] = f"{prefix}:{local}" if prefix else local
+            return qname
+
+    def _finish_pending(self) -> None:
+        if self._pending:
+            self._pending = False
+            self._write(">")
+
+    def _write(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+
+    def _flush(self) -> None:
+        self.target.write("".join(self._chunks).encode())
+        self._chunks = []
+
+
+def escape_text(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def escape_attr(value: str) -> str:
+    return (
+        escape_text(value)
+        .replace('"', "&quot;")
+        .replace("\n", "&#10;")
+        .replace("\r", "&#13;")
+        .replace("\t", "&#9;")
+    )
+
+
+def transform_docx_xml(
+        source: IO[bytes],
+        target: IO[bytes],
+        rules: Sequence[DocxXmlRule],
+) -> None:
+    """Читает XML из source и пишет в target, применяя rules"""
+    DocxXmlWriter(target, rules).parse(source)
+    for rule in rules:
+        rule.finish()
+
+
+class ReplaceFont(DocxXmlRule):
+    """Заменяет шрифт old_font на new_font в атрибутах w:rFonts"""
+
+    def __init__(self, old_font: str, new_font: str):
+        self.old_font = old_font
+        self.new_font = new_font
+        self.replaced = 0
+
+    def start(
+            self,
+            writer: "DocxXmlWriter",  # noqa:ARG002
+            name: QName,
+            attrs: AttrsT,
+    ) -> None:
+        if name != W_RFONTS:
+            return
+        for key, value in attrs.items():
+            if value == self.old_font:
+                attrs[key] = self.new_font
+                self.replaced += 1
+
+    def finish(self) -> None:
+        if not self.replaced:
+            raise ValueError(f"Font {self.old_font} not fount in document")
+
+
+@dataclass
+class _Row:
+    has_props: bool = False
+    cant_split: bool = False
+
+
+class CantSplitTableRows(DocxXmlRule):
+    """Запрещает перенос строк таблиц на другую страницу:
+    добавляет w:cantSplit в w:trPr каждой строки каждой таблицы,
+    в том числе вложенных
+    """
+
+    def __init__(self) -> None:
+        # строки, открытые выше текущего элемента, для вложенных таблиц
+        self.rows: list[_Row] = []
+        self.count = 0
+
+    def start(
+            self, writer: "DocxXmlWriter", name: QName, attrs: AttrsT,
+    ) -> None:
+        parent = writer.parent
+        if parent == W_TR and not self.rows[-1].has_props:
+            # w:trPr идет первым, после необязательного w:tblPrEx
+            if name == W_TR_PR:
+                self.rows[-1].has_props = True
+            elif name != W_TBL_PR_EX:
+                self._write_props(writer)
+        elif parent == W_TR_PR and name == W_CANT_SPLIT:
+            attrs[W_VAL] = "true"
+            self.rows[-1].cant_split = True
+        if name == W_TR:
+            self.rows.append(_Row())
+
+    def end(self, writer: "DocxXmlWriter", name: QName) -> None:
+        if name == W_TR_PR and writer.parent == W_TR:
+            if not self.rows[-1].cant_split:
+                writer.write_element(W_CANT_SPLIT, {W_VAL: "true"})
+                self.rows[-1].cant_split = True
+        elif name == W_TR:
+            if not self.rows[-1].has_props:
+                self._write_props(writer)
+            self.rows.pop()
+            self.count += 1
+
+    def _write_props(self, writer: "DocxXmlWriter") -> None:
+        row = self.rows[-1]
+        row.has_props = row.cant_split = True
+        writer.open_element(W_TR_PR)
+        writer.write_element(W_CANT_SPLIT, {W_VAL: "true"})
+        writer.close_element(W_TR_PR)
+
+    def finish(self) -> None:
+        log.debug("cantSplit is set for %d table rows", self.count)
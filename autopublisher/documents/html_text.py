@@ -0,0 +1,650 @@
+"""Абзацы простым текстом из HTML писем.
+
+Раньше каждый вызов get_lines_from_html создавал html2text.HTML2Text,
+получал Markdown целиком и потом резал его на абзацы. Здесь тот же
+результат собирается за один проход: HTML делится на теги,
+сущности и текст своими регулярными выражениями, повторяющими
+html.parser из Python 3.11 (чтобы куски текста были такими же,
+как у html2text), MarkdownWriter повторяет
+html2text с настройками make_html2text, а MarkdownLines сразу
+переносит готовые строки Markdown (optwrap) и собирает из них
+абзацы. В памяти, кроме результата, только текущий абзац.
+По сравнению с html2text это в 1.5-2 раза быстрее и в 3-4 раза
+меньше памяти на больших рассылках (benchmarks/bench_html_text).
+
+Разбираются только теги, которые бывают в письмах с новостями
+и в HTML из docx_text: абзацы, переносы, линии (Outlook отделяет
+ими пересланное письмо), выделение, цитаты, картинки, таблицы
+и заголовки. Списков, кода, зачеркивания <del> и <strike>
+и испорченной разметки здесь нет:
+на них HtmlTextError, и такие письма по-прежнему разбирает html2text.
+Повторяется html2text версии HTML2TEXT_VERSION, после обновления
+html2text нужно прогнать tests/test_html_text.py.
+"""
+
+import html
+import html.entities
+import logging
+import re
+from textwrap import TextWrapper
+
+import html2text
+from html2text import config as html2text_config
+from html2text.utils import (
+    escape_md,
+    escape_md_section,
+    hn,
+    skipwrap,
+    unifiable_n,
+)
+
+from autopublisher.documents.document import HtmlT
+
+
+log = logging.getLogger(__name__)
+
+
+# версия html2text, которую повторяет MarkdownWriter
+HTML2TEXT_VERSION = (2020, 1, 16)
+
+PARAGRAPHS_SEPARATOR_RE = re.compile(r"\n{2,}")
+BLANK_LINE_RE = re.compile(r"\s+")
+NEWLINES_RE = re.compile(r"(\n+)")
+WHITESPACE_RE = re.compile(r"\s+")
+# текст, который WHITESPACE_RE меняет, и текст, в котором
+# escape_md_section есть что экранировать: без них обе замены
+# ничего не делают, а проверка дешевле
+COLLAPSIBLE_RE = re.compile(r"\s\s|[^\S ]")
+MD_SPECIAL_RE = re.compile(r"[\\.+-]")
+# пробельные символы, которые textwrap заменяет пробелами
+WRAP_WHITESPACE_RE = re.compile(r"[\t\x0b\x0c\r]")
+# после выделения html2text добавляет пробел перед таким символом
+STRESSED_SPACE_RE = re.compile(r"[^\s.!?]")
+
+# Разбор HTML как у html.parser.HTMLParser. Его регулярные выражения
+# не входят в публичный интерфейс модуля, поэтому здесь свои копии;
+# если они разойдутся с html.parser, на котором работает html2text,
+# это покажут тесты tests/test_html_text.py
+INTERESTING_RE = re.compile(r"[&<]")
+START_TAG_OPEN_RE = re.compile(r"<[a-zA-Z]")
+TAG_NAME_RE = re.compile(r"([a-zA-Z][^\t\n\r\f />\x00]*)(?:\s|/(?!>))*")
+START_TAG_END_RE = re.compile(
+    r"""
+    <[a-zA-Z][^\t\n\r\f />\x00]*      # имя тега
+    (?:[\s/]*                         # пробелы перед атрибутом
+      (?:(?<=['"\s/])[^\s/>][^\s/=>]*  # имя атрибута
+        (?:\s*=+\s*                   # значение
+          (?:'[^']*'                   # в одинарных кавычках
+            |"[^"]*"                   # в двойных кавычках
+            |(?!['"])[^>\s]*           # без кавычек
+          )
+          \s*
+        )?(?:\s|/(?!>))*
+      )*
+    )?
+    \s*
+    """,
+    re.VERBOSE,
+)
+ATTR_RE = re.compile(
+    r"""((?<=['"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*"""
+    r"""('[^']*'|"[^"]*"|(?!['"])[^>\s]*))?(?:\s|/(?!>))*""",
+)
+END_TAG_RE = re.compile(r"</\s*([a-zA-Z][-.a-zA-Z0-9:_]*)\s*>")
+COMMENT_CLOSE_RE = re.compile(r"--\s*>")
+PI_CLOSE_RE = re.compile(r">")
+CHARREF_RE = re.compile(r"&#(?:[0-9]+|[xX][0-9a-fA-F]+)[^0-9a-fA-F]")
+ENTITYREF_RE = re.compile(r"&([a-zA-Z][-.a-zA-Z0-9]*)[^a-zA-Z0-9]")
+INCOMPLETE_REF_RE = re.compile(r"&[a-zA-Z#]")
+MARKED_SECTION_RE = re.compile(r"<!\[([a-zA-Z][-_.a-zA-Z0-9]*)")
+MS_MARKED_SECTION_CLOSE_RE = re.compile(r"]\s*>")
+CDATA_END_RES = {
+    tag: re.compile(rf"</\s*{tag}\s*>", re.IGNORECASE)
+    for tag in ("script", "style")
+}
+# условные комментарии Outlook: <![if !supportLists]>...<![endif]>
+MS_MARKED_SECTIONS = frozenset({"if", "else", "endif"})
+DOCTYPE = "<!doctype"
+
+# make_html2text ставит blockquote = -1
+BLOCKQUOTE = -1
+STRONG_MARK = ""
+EMPHASIS_MARKS = {
+    "em": "_", "i": "_", "u": "_",
+    "strong": STRONG_MARK, "b": STRONG_MARK,
+    # <s> -- зачеркивание из docx_text
+    "s": "~~",
+}
+TABLE_CELL_TAGS = frozenset({"td", "th"})
+# обработчики тегов MarkdownWriter, остальные теги html2text пропускает
+TAG_HANDLERS = {
+    **dict.fromkeys((f"h{level}" for level in range(1, 10)), "heading"),
+    "p": "paragraph",
+    "div": "paragraph",
+    "br": "br",
+    "hr": "hr",
+    "head": "quiet",
+    "style": "quiet",
+    "script": "quiet",
+    "body": "body",
+    "blockquote": "blockquote",
+    **dict.fromkeys(EMPHASIS_MARKS, "emphasis"),
+    "img": "img",
+    **dict.fromkeys(("table", "tr", "td", "th"), "table"),
+}
+# теги, для которых html2text делает то, что здесь не повторяется
+UNSUPPORTED_TAGS = frozenset({
+    "abbr", "code", "dd", "del", "dl", "dt", "kbd", "li", "ol", "pre", "q",
+    "strike", "tt", "ul",
+})
+NO_STRESSED_SPACE_TAGS = frozenset({"a", "code", "pre"})
+
+# html2text пишет вместо &nbsp; заглушку, чтобы пробел не схлопнулся
+# с соседними, и в конце заменяет ее обычным пробелом
+NBSP_PLACEHOLDER = "&nbsp_place_holder;"
+NBSP = " "
+
+WRAP_WIDTH = html2text_config.BODY_WIDTH
+WRAPPERS = {
+    indent: TextWrapper(
+        width=WRAP_WIDTH,
+        break_long_words=False,
+        subsequent_indent=indent,
+    )
+    for indent in ("", "    ", "> ")
+}
+
+
+AttrsT = dict[str, str | None]
+
+
+class HtmlTextError(Exception):
+    pass
+
+
+def make_html2text() -> html2text.HTML2Text:
+    h = html2text.HTML2Text()
+    h.ignore_links = True
+    h.bypass_tables = True
+    h.blockquote = BLOCKQUOTE
+    h.strong_mark = STRONG_MARK
+    return h
+
+
+def is_blank(line: str) -> bool:
+    return not line or BLANK_LINE_RE.fullmatch(line) is not None
+
+
+def clean_line(line: str) -> str:
+    return line.strip().replace("\n", " ")
+
+
+def split_markdown_lines(text: str) -> list[str]:
+    # html2text вставляет внутри абзацев переносы строк (видимо, для красоты),
+    # а сами абзацы отделяет четырьмя переносами строк
+    # поэтому разбиваем текст на абзацы,
+    # а переносы строк внутри абзацев убираем.
+    return [
+        clean_line(line)
+        for line in PARAGRAPHS_SEPARATOR_RE.split(text)
+        if not is_blank(line)
+    ]
+
+
+class MarkdownLines:
+    """HTML2Text.optwrap и split_markdown_lines по мере записи Markdown"""
+
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+        # строка Markdown, для которой еще не было \n
+        self._para: list[str] = []
+        # сколько переносов optwrap написал в конце
+        self._newlines = 0
+        # текущий абзац результата и переносы строк после него
+        self._block: list[str] = []
+        self._breaks = 0
+
+    def feed(self, chunk: str) -> None:
+        if "\n" not in chunk:
+            self._para.append(chunk)
+            return
+        *paras, rest = chunk.split("\n")
+        if paras:
+            self._para.append(paras[0])
+            self._wrap("".join(self._para))
+            for para in paras[1:]:
+                self._wrap(para)
+            self._para = []
+        if rest:
+            self._para.append(rest)
+
+    def close(self) -> list[str]:
+        self._wrap("".join(self._para))
+        self._para = []
+        self._flush()
+        return self.lines
+
+    def _wrap(self, para: str) -> None:
+        if not para:
+            if self._newlines < 2:  # noqa:PLR2004
+                self._emit("\n")
+                self._newlines += 1
+            return
+        if skipwrap(
+                para,
+                html2text_config.WRAP_LINKS,
+                html2text_config.WRAP_LIST_ITEMS,
+        ):
+            if not html2text_config.RE_SPACE.match(para):
+                self._emit(para + "\n")
+                self._newlines = 1
+            return
+        indent = ""
+        if para.startswith("  *"):
+            indent = "    "
+        elif para.startswith("> "):
+            indent = "> "
+        if len(para) <= WRAP_WIDTH and not WRAP_WHITESPACE_RE.search(para):
+            # короткая строка: textwrap только срезал бы пробелы в конце
+            self._emit(para.rstrip(" "))
+        else:
+            self._emit("\n".join(WRAPPERS[indent].wrap(para)))
+        if para.endswith("  "):
+            self._emit("  \n")
+            self._newlines = 1
+        elif indent:
+            self._emit("\n")
+            self._newlines = 1
+        else:
+            self._emit("\n\n")
+            self._newlines = 2
+
+    def _emit(self, text: str) -> None:
+        for part in NEWLINES_RE.split(text):
+            if part.startswith("\n"):
+                self._breaks += len(part)
+            elif part:
+                if self._breaks >= 2:  # noqa:PLR2004
+                    self._flush()
+                elif self._breaks:
+                    self._block.append("\n")
+                self._breaks = 0
+                self._block.append(part)
+
+    def _flush(self) -> None:
+        line = "".join(self._block)
+        self._block = []
+        if not is_blank(line):
+            self.lines.append(clean_line(line))
+
+
+class MarkdownWriter:
+    """Повторяет html2text.HTML2Text с настройками make_html2text:
+    получает теги и текст, пишет Markdown в MarkdownLines
+    """
+
+    def __init__(self) -> None:
+        self.lines = MarkdownLines()
+        self.quiet = 0
+        # сколько переносов абзаца написать перед следующим текстом
+        self.p_p = 0
+        self.start = True
+        self.space = False
+        self.last_was_nl = False
+        self.blockquote = BLOCKQUOTE
+        self.br_toggle = ""
+        self.stressed = False
+        self.preceding_stressed = False
+        self.preceding_data = ""
+        self.current_tag = ""
+
+    def tag(self, tag: str, attrs: AttrsT, *, start: bool) -> None:
+        self.current_tag = tag
+        if tag in UNSUPPORTED_TAGS:
+            raise HtmlTextError(f"Unsupported tag {tag}")
+        handler = TAG_HANDLERS.get(tag)
+        if handler is not None:
+            getattr(self, f"_tag_{handler}")(tag, attrs, start=start)
+
+    # Обработчики тегов, как в HTML2Text.handle_tag
+
+    def _tag_heading(self, tag: str, _attrs: AttrsT, *, start: bool) -> None:
+        self.p_p = 2
+        if start:
+            self.o("#" * hn(tag) + " ")
+
+    def _tag_paragraph(
+            self, _tag: str, _attrs: AttrsT, *, start: bool,  # noqa:ARG002
+    ) -> None:
+        self.p_p = 2
+
+    def _tag_br(self, _tag: str, _attrs: AttrsT, *, start: bool) -> None:
+        if start:
+            self.o("  \n> " if self.blockquote > 0 else "  \n")
+
+    def _tag_hr(self, _tag: str, _attrs: AttrsT, *, start: bool) -> None:
+        if start:
+            self.p_p = 2
+            self.o("* * *")
+            self.p_p = 2
+
+    def _tag_quiet(self, _tag: str, _attrs: AttrsT, *, start: bool) -> None:
+        self.quiet += 1 if start else -1
+
+    def _tag_body(
+            self, _tag: str, _attrs: AttrsT, *, start: bool,  # noqa:ARG002
+    ) -> None:
+        self.quiet = 0
+
+    def _tag_blockquote(self, _tag: str, _attrs: AttrsT, *, start: bool) -> None:
+        if start:
+            self.p_p = 2
+            self.o("> ", force=True)
+            self.start = True
+            self.blockquote += 1
+        else:
+            self.blockquote -= 1
+            self.p_p = 2
+
+    def _tag_emphasis(self, tag: str, _attrs: AttrsT, *, start: bool) -> None:
+        mark = EMPHASIS_MARKS[tag]
+        if start and self.no_preceding_space():
+            mark = " " + mark
+        self.o(mark)
+        if start:
+            self.stressed = True
+
+    def _tag_img(self, _tag: str, attrs: AttrsT, *, start: bool) -> None:
+        if not start or "src" not in attrs:
+            return
+        src = attrs["src"]
+        if src is None:
+            raise HtmlTextError("Image without src value")
+        alt = attrs.get("alt") or ""
+        self.o("![" + escape_md(alt) + "]")
+        self.o("(" + escape_md(src) + ")")
+
+    def _tag_table(self, tag: str, _attrs: AttrsT, *, start: bool) -> None:
+        # bypass_tables: таблицы остаются тегами
+        if start:
+            if not self.p_p:
+                self.p_p = 1
+            self.br_toggle = "  "
+        if tag in TABLE_CELL_TAGS:
+            self.o(f"<{tag}>\n\n" if start else f"\n</{tag}>")
+        else:
+            self.o(f"<{tag}>" if start else f"</{tag}>")
+
+    def data(self, data: str, *, entity: bool = False) -> None:
+        if not data:
+            return
+        if self.stressed:
+            data = data.strip()
+            self.stressed = False
+            self.preceding_stressed = True
+        elif self.preceding_stressed:
+            if (
+                    STRESSED_SPACE_RE.match(data[0])
+                    and not hn(self.current_tag)
+                    and self.current_tag not in NO_STRESSED_SPACE_TAGS
+            ):
+                data = " " + data
+            self.preceding_stressed = False
+        if not entity and MD_SPECIAL_RE.search(data):
+            data = escape_md_section(data)
+        self.preceding_data = data
+        self.o(data, pure=True)
+
+    def entity(self, name: str) -> None:
+        """&name; как HTML2Text.entityref без unicode_snob"""
+        if name == "nbsp":
+            data = NBSP_PLACEHOLDER
+        elif name in html2text_config.UNIFIABLE:
+            data = html2text_config.UNIFIABLE[name]
+        else:
+            data = html.entities.html5.get(f"{name};", f"&{name};")
+        self.data(data, entity=True)
+
+    def charref(self, name: str) -> None:
+        """&#name; как HTML2Text.charref без unicode_snob"""
+        code = int(name[1:], 16) if name[0] in "xX" else int(name)
+        if code in unifiable_n:
+            data = unifiable_n[code]
+        else:
+            try:
+                data = chr(code)
+            except ValueError:
+                data = ""
+        self.data(data, entity=True)
+
+    def finish(self) -> list[str]:
+        if not self.p_p:
+            self.p_p = 1
+        self.o("", end=True)
+        return self.lines.close()
+
+    def no_preceding_space(self) -> bool:
+        return bool(
+            self.preceding_data and not self.preceding_data[-1].isspace(),
+        )
+
+    def o(
+            self,
+            data: str,
+            *,
+            pure: bool = False,
+            force: bool = False,
+            end: bool = False,
+    ) -> None:
+        if self.quiet:
+            return
+        if pure:
+            data = self.collapse_whitespace(data)
+        if not data and not (force or end):
+            return
+        bq = ">" * self.blockquote
+        if not (force and data and data[0] == ">") and self.blockquote:
+            bq += " "
+        if self.start:
+            self.space = False
+            self.p_p = 0
+            self.start = False
+        if end:
+            self.p_p = 0
+            self.out("\n")
+            self.space = False
+        self.separate(bq)
+        self.out(data)
+
+    def collapse_whitespace(self, data: str) -> str:
+        if COLLAPSIBLE_RE.search(data):
+            data = WHITESPACE_RE.sub(" ", data)
+        if data and data[0] == " ":
+            self.space = True
+            data = data[1:]
+        return data
+
+    def separate(self, bq: str) -> None:
+        """Переносы абзаца или пробел перед следующим выводом"""
+        if self.p_p:
+            self.out((self.br_toggle + "\n" + bq) * self.p_p)
+            self.space = False
+            self.br_toggle = ""
+        if self.space:
+            if not self.last_was_nl:
+                self.out(" ")
+            self.space = False
+        self.p_p = 0
+
+    def out(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self.last_was_nl = chunk[-1] == "\n"
+        self.lines.feed(chunk.replace(NBSP_PLACEHOLDER, NBSP))
+
+
+# ##### Разбор HTML как у html.parser.HTMLParser ##### #
+
+def read_start_tag(writer: MarkdownWriter, source: str, i: int) -> int:
+    """Открывающий тег с i, возвращает позицию после него"""
+    tag_end = START_TAG_END_RE.match(source, i)
+    assert tag_end is not None  # noqa:S101
+    j = tag_end.end()
+    if source.startswith(">", j):
+        end_pos = j + 1
+    elif source.startswith("/>", j):
+        end_pos = j + 2
+    else:
+        raise HtmlTextError(f"Malformed start tag at {i}")
+    match = TAG_NAME_RE.match(source, i + 1)
+    assert match is not None  # noqa:S101
+    tag = match.group(1).lower()
+    attrs, k = read_attrs(source, tag, match.end(), end_pos)
+    end = source[k:end_pos].strip()
+    if end == "/>":
+        writer.tag(tag, attrs, start=True)
+        writer.tag(tag, {}, start=False)
+    elif end == ">":
+        writer.tag(tag, attrs, start=True)
+        if tag in CDATA_END_RES:
+            return read_cdata(writer, source, end_pos, tag)
+    else:
+        raise HtmlTextError(f"Malformed start tag at {i}")
+    return end_pos
+
+
+def read_attrs(
+        source: str, tag: str, k: int, end_pos: int,
+) -> tuple[AttrsT, int]:
+    """Атрибуты тега с позиции k, возвращает их и позицию после них"""
+    attrs: AttrsT = {}
+    while k < end_pos:
+        attr = ATTR_RE.match(source, k)
+        if not attr:
+            break
+        name, rest, value = attr.group(1, 2, 3)
+        if not rest:
+            value = None
+        elif value[:1] == "'" == value[-1:] or value[:1] == '"' == value[-1:]:
+            value = value[1:-1]
+        if value and tag == "img":
+            value = html.unescape(value)
+        attrs[name.lower()] = value
+        k = attr.end()
+    return attrs, k
+
+
+def read_cdata(writer: MarkdownWriter, source: str, i: int, tag: str) -> int:
+    """Содержимое <script> или <style> до закрывающего тега"""
+    match = CDATA_END_RES[tag].search(source, i)
+    if match is None:
+        raise HtmlTextError(f"Unclosed {tag}")
+    if i < match.start():
+        writer.data(source[i:match.start()])
+    writer.tag(tag, {}, start=False)
+    return match.end()
+
+
+def find_end(pattern: re.Pattern[str], source: str, i: int) -> int:
+    match = pattern.search(source, i)
+    if match is None:
+        raise HtmlTextError(f"Unclosed markup at {i}")
+    return match.end()
+
+
+def find_gt(source: str, i: int) -> int:
+    gt = source.find(">", i)
+    if gt < 0:
+        raise HtmlTextError(f"Unclosed markup at {i}")
+    return gt + 1
+
+
+def read_markup(writer: MarkdownWriter, source: str, i: int) -> int:
+    """Тег, комментарий или объявление с "<" в позиции i"""
+    if START_TAG_OPEN_RE.match(source, i):
+        return read_start_tag(writer, source, i)
+    if source.startswith("</", i):
+        match = END_TAG_RE.match(source, i)
+        if match is None:
+            raise HtmlTextError(f"Malformed end tag at {i}")
+        writer.tag(match.group(1).lower(), {}, start=False)
+        return find_gt(source, i + 1)
+    if source.startswith("<?", i):
+        return find_end(PI_CLOSE_RE, source, i + 2)
+    if source.startswith("<!", i):
+        return read_declaration(source, i)
+    writer.data("<")
+    return i + 1
+
+
+def read_declaration(source: str, i: int) -> int:
+    """Комментарий, секция или объявление с "<!" в позиции i,
+    в текст они не попадают
+    """
+    if source.startswith("<!--", i):
+        return find_end(COMMENT_CLOSE_RE, source, i + 4)
+    if source.startswith("<![", i):
+        match = MARKED_SECTION_RE.match(source, i)
+        if match is None or match.group(1).lower() not in MS_MARKED_SECTIONS:
+            raise HtmlTextError(f"Unsupported marked section at {i}")
+        return find_end(MS_MARKED_SECTION_CLOSE_RE, source, i + 3)
+    if source[i:i + len(DOCTYPE)].lower() == DOCTYPE:
+        return find_gt(source, i + len(DOCTYPE))
+    return find_gt(source, i + 2)
+
+
+def read_reference(writer: MarkdownWriter, source: str, i: int) -> int:
+    """Сущность или ссылка на символ с "&" в позиции i"""
+    match = CHARREF_RE.match(source, i) or ENTITYREF_RE.match(source, i)
+    if match is None:
+        if INCOMPLETE_REF_RE.match(source, i):
+            raise HtmlTextError(f"Incomplete reference at {i}")
+        writer.data("&")
+        return i + 1
+    name = match.group()[1:-1]
+    if name.startswith("#"):
+        writer.charref(name[1:])
+    else:
+        writer.entity(name)
+    k = match.end()
+    return k if source.startswith(";", k - 1) else k - 1
+
+
+def read_html_lines(source: HtmlT) -> list[str]:
+    """Абзацы простым текстом, как у get_lines_from_html через html2text,
+    HtmlTextError -- если такой HTML здесь не разобрать
+    """
+    # как HTML2Text.feed
+    source = source.replace("</' + 'script>", "</ignore>")
+    writer = MarkdownWriter()
+    i = 0
+    n = len(source)
+    while i < n:
+        match = INTERESTING_RE.search(source, i)
+        j = match.start() if match else n
+        if i < j:
+            writer.data(source[i:j])
+        if j == n:
+            break
+        if source[j] == "<":
+            i = read_markup(writer, source, j)
+        else:
+            i = read_reference(writer, source, j)
+    return writer.finish()
+
+
+def html2text_lines(html: HtmlT) -> list[str]:
+    return split_markdown_lines(make_html2text().handle(html))
+
+
+def get_lines_from_html(html: HtmlT) -> list[str]:
+    try:
+        return read_html_lines(html)
+    except HtmlTextError as e:
+        log.debug("Fallback to html2text: %s", e)
+        return html2text_lines(html)
+
+
+def get_text_from_html(html: HtmlT) -> str:
+    lines = get_lines_from_html(html)
+    return "\n".join(lines)
@@ -1,3 +1,5 @@
+import hashlib
+import io
 import logging
 import random
 import shutil
@@ -5,10 +7,13 @@ import string
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Self
+from types import TracebackType
+from typing import IO, Self
 
 import pytz
 import telegram
+from PIL import Image as PILImage
+from PIL import UnidentifiedImageError
 
 from autopublisher.config import config
 from autopublisher.utils.file import format_img_name
@@ -35,6 +40,9 @@ except ImportError as e:
 
 DEFAULT_TZ = pytz.timezone("Europe/Moscow")
 
+# столько байт с начала файла libmagic смотрит по умолчанию
+MAGIC_BUFFER_SIZE = 1024 * 1024
+
 
 def get_salt(size: int = 8) -> str:
     chars = string.ascii_uppercase + string.digits
@@ -50,11 +58,6 @@ def get_img_name() -> str:
     return format_img_name(f"mainpage_image_{iso_fmt_time}")
 
 
-def get_img_download_name(img_name: str) -> str:
-    img_name = img_name or get_img_name()
-    return f"{img_name}.download"
-
-
 def get_img_full_name(*, img_name: str, img_type: str = "") -> str:
     img_type = img_type.lower() if img_type else ""
     return f"{img_name}.{img_type}"
@@ -69,35 +72,133 @@ def get_image_tmp_folder() -> Path:
     return folder
 
 
-def get_magic_text(image_path: Path) -> str:
-    return magic.from_file(image_path)
-
-
 def get_possible_type_from_magic_text(magic_text: str) -> str:
     return magic_text.split(" ", 1)[0]
 
 
+def read_image_size(head: bytes) -> tuple[int, int] | None:
+    """Размер картинки по началу файла, Pillow читает только заголовок"""
+    try:
+        with PILImage.open(io.BytesIO(head)) as image:
+            return image.size
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    name: str
+    magic_text: str
+    size: tuple[int, int] | None
+    sha256: str
+
+
+class ImageWriter(io.RawIOBase):
+    """Файл, в который скачивается картинка. Первые байты копятся
+    в памяти, пока их не хватит libmagic, по ним определяются тип
+    и размер картинки, и сразу открывается файл с нужным расширением.
+    sha256 считается по ходу записи. Если загрузка внутри with
+    упала, недописанный файл удаляется.
+    """
+
+    def __init__(self, folder: Path, img_name: str):
+        super().__init__()
+        self.folder = folder
+        self.img_name = img_name
+        self.magic_text = ""
+        self.image_size: tuple[int, int] | None = None
+        self.path: Path | None = None
+        self._file: IO[bytes] | None = None
+        self._head: list[bytes] = []
+        self._head_size = 0
+        self._digest = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:  # type: ignore[override]
+        self._digest.update(data)
+        if self._file is not None:
+            return self._file.write(data)
+        self._head.append(bytes(data))
+        self._head_size += len(data)
+        if self._head_size >= MAGIC_BUFFER_SIZE:
+            self._open()
+        return len(data)
+
+    def _open(self) -> None:
+        head = self._head[0] if len(self._head) == 1 else b"".join(self._head)
+        self.magic_text = magic.from_buffer(head[:MAGIC_BUFFER_SIZE])
+        self.image_size = read_image_size(head[:MAGIC_BUFFER_SIZE])
+        self.path = self.folder / get_img_full_name(
+            img_name=self.img_name,
+            img_type=get_possible_type_from_magic_text(self.magic_text),
+        )
+        self._file = self.path.open("wb")
+        self._file.write(head)
+        self._head = []
+
+    def close(self) -> None:
+        if not self.closed:
+            if self._file is None:
+                self._open()
+            if self._file is not None:
+                self._file.close()
+        super().close()
+
+    def abort(self) -> None:
+        """Закрывает без записи начала файла и удаляет то,
+        что уже записано
+        """
+        if not self.closed:
+            self._head = []
+            if self._file is not None:
+                self._file.close()
+            if self.path is not None:
+                self.path.unlink(missing_ok=True)
+                self.path = None
+        super().close()
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def info(self) -> ImageInfo:
+        if self.path is None:
+            raise ValueError("Image is not written yet")
+        return ImageInfo(
+            name=self.path.name,
+            magic_text=self.magic_text,
+            size=self.image_size,
+            sha256=self._digest.hexdigest(),
+        )
+
+
 def get_start_date(tz: pytz.timezone = DEFAULT_TZ) -> datetime.date:  # type: ignore[valid-type]
     return datetime.now(tz=tz).date()
 
 
-async def download_image(image_file: telegram.File) -> tuple[Path, str]:
+async def download_image(
+        image_file: telegram.File,
+) -> tuple[Path, ImageInfo]:
+    """Скачивает картинку сразу в файл с расширением по ее типу"""
     image_tmp_folder = get_image_tmp_folder()
-    img_name = get_img_name()
-    image_download_path = image_tmp_folder / get_img_download_name(img_name)
-    await image_file.download_to_drive(image_download_path)
-    log.info("Loaded image to: %s", image_download_path)
-    magic_text = get_magic_text(image_download_path)
-    log.info("Magic text: %s", magic_text)
-    possible_type = get_possible_type_from_magic_text(magic_text)
-    log.info("Possible type: %s", possible_type)
-    image_full_name = get_img_full_name(
-        img_name=img_name, img_type=possible_type,
+    with ImageWriter(image_tmp_folder, get_img_name()) as writer:
+        await image_file.download_to_memory(writer)  # type: ignore[arg-type]
+    info = writer.info
+    log.info(
+        "Saved to: %s, magic text: %s, size: %s, sha256: %s",
+        writer.path, info.magic_text, info.size, info.sha256,
     )
-    image_path = image_tmp_folder / image_full_name
-    shutil.move(image_download_path, image_path)
-    log.info("Saved to: %s", image_path)
-    return image_tmp_folder, image_full_name
+    return image_tmp_folder, info
 
 
 @dataclass
@@ -106,6 +207,10 @@ class Image:
     folder: Path
     start_date: datetime.date  # type: ignore[valid-type]
     end_date: "datetime.date | None" = None  # type: ignore[valid-type]
+    # заполняются при загрузке, см. ImageWriter
+    magic_text: str = ""
+    size: tuple[int, int] | None = None
+    sha256: str = ""
 
     @property
     def path(self) -> Path:
@@ -115,10 +220,6 @@ class Image:
     def ext(self) -> str | None:
         return self.path.suffix
 
-    @property
-    def magic_text(self) -> str:
-        return magic.from_file(self.path)
-
     @property
     def type(self) -> str:
         return get_possible_type_from_magic_text(self.magic_text)
@@ -135,11 +236,14 @@ class Image:
 
     @classmethod
     async def from_telegram_file(cls, image_file: telegram.File) -> Self:
-        image_folder, image_name = await download_image(image_file)
+        image_folder, info = await download_image(image_file)
         return Image(  # type: ignore[return-value]
-            name=image_name,
+            name=info.name,
             folder=image_folder,
             start_date=get_start_date(),
+            magic_text=info.magic_text,
+            size=info.size,
+            sha256=info.sha256,
         )
 
     def clear(self) -> None:
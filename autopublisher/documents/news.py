@@ -0,0 +1,95 @@
+"""Разобранный docx новости.
+
+docx разбирается один раз на письмо, а абзацы, заголовок и текст
+считаются по первому обращению и запоминаются. Все этапы подготовки
+новости (текст для бота, HTML для сайта) читают их отсюда, а не
+разбирают файл заново.
+
+Текст и заголовок читаются напрямую из document.xml
+(documents.docx_text), mammoth запускается, только когда нужен HTML
+или в документе есть то, чего прямой разбор не умеет.
+"""
+
+import logging
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from autopublisher.documents.document import HtmlT, docx2html
+from autopublisher.documents.docx_text import (
+    DocxText,
+    DocxTextError,
+    read_docx_text,
+)
+from autopublisher.documents.html_text import get_lines_from_html
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Paragraph:
+    text: str
+    html: HtmlT
+
+
+class NewsDocument:
+    def __init__(self, path: Path):
+        self.path = path
+
+    @classmethod
+    def from_docx(cls, docx: Path) -> "NewsDocument":
+        return cls(docx)
+
+    @cached_property
+    def _converted(self) -> tuple[HtmlT, list[str]]:
+        log.info("Convert %s to html", self.path)
+        return docx2html(self.path)
+
+    @property
+    def html(self) -> HtmlT:
+        """Результат mammoth"""
+        return self._converted[0]
+
+    @property
+    def messages(self) -> list[str]:
+        return self._converted[1]
+
+    @cached_property
+    def docx_text(self) -> DocxText | None:
+        """Прямой разбор document.xml или None, если документ
+        ему не по силам
+        """
+        try:
+            return read_docx_text(self.path)
+        except DocxTextError as e:
+            log.info("Fallback to mammoth for %s: %s", self.path, e)
+            return None
+
+    @cached_property
+    def paragraphs(self) -> list[Paragraph]:
+        """Абзацы <p> из HTML mammoth"""
+        soup = BeautifulSoup(self.html, "html.parser")
+        return [Paragraph(p.text, str(p)) for p in soup.find_all("p")]
+
+    @cached_property
+    def title(self) -> str:
+        """Кандидат в заголовок: первый абзац"""
+        if self.docx_text is not None:
+            return self.docx_text.title
+        if not self.paragraphs:
+            return ""
+        return self.paragraphs[0].text
+
+    @cached_property
+    def lines(self) -> list[str]:
+        """Абзацы простым текстом, как из HTML mammoth через html2text"""
+        if self.docx_text is not None:
+            return self.docx_text.lines
+        return get_lines_from_html(self.html)
+
+    @cached_property
+    def text(self) -> str:
+        return "\n".join(self.lines)
@@ -0,0 +1,312 @@
+"""Конвертация документов в PDF через LibreOffice.
+
+Запуск soffice на каждый документ -- это холодный старт LibreOffice:
+несколько секунд и сотни мегабайт. Поэтому бот может держать
+запущенным один экземпляр (OfficeService), который слушает
+UNO-сокет на 127.0.0.1, и отдавать документы ему.
+
+Документы передаются экземпляру через модуль uno (пакет python3-uno),
+без него OfficeService не запускается: бот с --office-listener
+отказывается стартовать.
+"""
+
+import logging
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from autopublisher.config import SOFFICE_PATH, config
+from autopublisher.utils.process import ProcessError, run, terminate
+
+
+log = logging.getLogger(__name__)
+
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+
+HOST = "127.0.0.1"
+PDF_FILTER = "writer_pdf_Export"
+HEALTH_CHECK_TIMEOUT = 1.0
+START_POLL_INTERVAL = 0.1
+
+
+class OfficeError(Exception):
+    pass
+
+
+def soffice_command(*args: str, profile: Path | None = None) -> list[str]:
+    command = [
+        SOFFICE_PATH,
+        "--headless",
+        "--invisible",
+        "--nologo",
+        "--nodefault",
+        "--norestore",
+        "--nolockcheck",
+    ]
+    if profile is not None:
+        command.append(f"-env:UserInstallation={profile.as_uri()}")
+    return [*command, *args]
+
+
+def run_soffice(*args: str, timeout: float) -> None:
+    """Запускает soffice и ждет его завершения не дольше timeout секунд"""
+    try:
+        run(soffice_command(*args), timeout=timeout)
+    except ProcessError as e:
+        raise OfficeError(str(e)) from e
+
+
+def get_pdf_path(docx: Path, outdir: Path) -> Path:
+    return outdir / f"{docx.stem}.pdf"
+
+
+def check_pdf(pdf: Path) -> Path:
+    if not pdf.exists():
+        raise OfficeError(f"Can't find converted pdf: {pdf}")
+    return pdf
+
+
+def convert_to_pdf_once(
+        docx: Path, outdir: Path, *, timeout: float | None = None,
+) -> Path:
+    """Конвертирует docx в PDF отдельным процессом soffice"""
+    run_soffice(
+        "--convert-to", "pdf", "--outdir", str(outdir), str(docx),
+        timeout=timeout or config.office_timeout,
+    )
+    return check_pdf(get_pdf_path(docx, outdir))
+
+
+def check_uno() -> None:
+    """OfficeError, если модуля uno нет и OfficeService не сможет работать"""
+    if uno is None:
+        raise OfficeError(
+            "--office-listener requires the uno module (python3-uno)",
+        )
+
+
+def make_property(name: str, value: Any) -> Any:
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class OfficeService:
+    """Запущенный в фоне LibreOffice для конвертации документов.
+
+    Перед каждой конвертацией проверяет, что процесс жив и принимает
+    соединения, и перезапускает его, если нет. Одновременно
+    выполняется не больше workers конвертаций.
+    """
+
+    def __init__(
+            self,
+            *,
+            port: int | None = None,
+            workers: int | None = None,
+            timeout: float | None = None,
+            profile: Path | None = None,
+    ):
+        self._port = port
+        self._workers = workers
+        self._timeout = timeout
+        self._profile = profile
+        self._process: subprocess.Popen[bytes] | None = None
+        self._desktop: Any = None
+        self._lock = threading.Lock()
+        self._slots: threading.BoundedSemaphore | None = None
+        self.restarts = 0
+
+    @property
+    def port(self) -> int:
+        return self._port or config.office_port
+
+    @property
+    def workers(self) -> int:
+        return self._workers or config.office_workers
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout or config.office_timeout
+
+    @property
+    def profile(self) -> Path:
+        if self._profile is not None:
+            return self._profile
+        return config.tmp_folder / f"{config.tmp_folder_prefix}office"
+
+    @property
+    def slots(self) -> threading.BoundedSemaphore:
+        with self._lock:
+            if self._slots is None:
+                self._slots = threading.BoundedSemaphore(self.workers)
+            return self._slots
+
+    @property
+    def uno_url(self) -> str:
+        return f"socket,host={HOST},port={self.port};urp;"
+
+    def start(self) -> None:
+        """Запускает LibreOffice, не дожидаясь готовности"""
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._spawn()
+
+    def stop(self) -> None:
+        with self._lock:
+            process, self._process = self._process, None
+            self._desktop = None
+        if process is not None:
+            terminate(process)
+            log.info("LibreOffice stopped")
+
+    def is_healthy(self) -> bool:
+        """Процесс жив и принимает соединения"""
+        process = self._process
+        if process is None or process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(
+                    (HOST, self.port), timeout=HEALTH_CHECK_TIMEOUT,
+            ):
+                return True
+        except OSError:
+            return False
+
+    def ensure_running(self) -> None:
+        """Запускает LibreOffice, если он не запущен или упал,
+        и ждет, пока он начнет принимать соединения
+        """
+        with self._lock:
+            process = self._process
+            if process is None or process.poll() is not None:
+                if process is not None:
+                    log.warning(
+                        "LibreOffice exited with code %s, restarting",
+                        process.returncode,
+                    )
+                    self.restarts += 1
+                self._spawn()
+            try:
+                self._wait_ready()
+            except OfficeError:
+                log.warning("LibreOffice is not responding, restarting")
+                self._restart()
+                self._wait_ready()
+
+    def convert_to_pdf(self, docx: Path, outdir: Path) -> Path:
+        """Конвертирует docx в PDF в outdir и возвращает путь к PDF"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OfficeError(
+                f"LibreOffice is busy for more than {self.timeout:.1f}s",
+            )
+        try:
+            pdf = get_pdf_path(docx, outdir)
+            self.ensure_running()
+            try:
+                self._convert(docx, pdf)
+            except OfficeError:
+                if self.is_healthy():
+                    raise
+                # LibreOffice упал во время конвертации, пробуем еще раз
+                log.warning("LibreOffice crashed while converting %s", docx)
+                self.ensure_running()
+                self._convert(docx, pdf)
+            return check_pdf(pdf)
+        finally:
+            self.slots.release()
+
+    def _spawn(self) -> None:
+        check_uno()
+        self._desktop = None
+        command = soffice_command(
+            f"--accept={self.uno_url}StarOffice.ComponentContext",
+            profile=self.profile,
+        )
+        log.info("Start LibreOffice: %s", " ".join(command))
+        self._process = subprocess.Popen(  # noqa:S603
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def _restart(self) -> None:
+        if self._process is not None:
+            terminate(self._process)
+        self.restarts += 1
+        self._spawn()
+
+    def _wait_ready(self) -> None:
+        deadline = time.monotonic() + self.timeout
+        while not self.is_healthy():
+            process = self._process
+            if process is None or process.poll() is not None:
+                raise OfficeError(
+                    "LibreOffice exited with code "
+                    f"{process and process.returncode} on start",
+                )
+            if time.monotonic() > deadline:
+                raise OfficeError(
+                    f"LibreOffice did not start in {self.timeout:.1f}s",
+                )
+            time.sleep(START_POLL_INTERVAL)
+
+    def _convert(self, docx: Path, pdf: Path) -> None:
+        try:
+            self._convert_uno(docx, pdf)
+        except Exception as e:
+            self._desktop = None
+            raise OfficeError(f"Can't convert {docx}: {e}") from e
+
+    def _get_desktop(self) -> Any:
+        if self._desktop is None:
+            local = uno.getComponentContext()
+            resolver = local.ServiceManager.createInstanceWithContext(
+                "com.sun.star.bridge.UnoUrlResolver", local,
+            )
+            context = resolver.resolve(
+                f"uno:{self.uno_url}StarOffice.ComponentContext",
+            )
+            self._desktop = context.ServiceManager.createInstanceWithContext(
+                "com.sun.star.frame.Desktop", context,
+            )
+        return self._desktop
+
+    def _convert_uno(self, docx: Path, pdf: Path) -> None:
+        document = self._get_desktop().loadComponentFromURL(
+            docx.absolute().as_uri(),
+            "_blank",
+            0,
+            (make_property("Hidden", True),),  # noqa:FBT003
+        )
+        try:
+            document.storeToURL(
+                pdf.absolute().as_uri(),
+                (make_property("FilterName", PDF_FILTER),),
+            )
+        finally:
+            document.close(True)  # noqa:FBT003
+
+
+office_service = OfficeService()
+
+
+def convert_to_pdf(docx: Path, outdir: Path) -> Path:
+    """Конвертирует docx в PDF через office_service, если он включен
+    (--office-listener), иначе отдельным процессом soffice
+    """
+    if config.office_listener:
+        return office_service.convert_to_pdf(docx, outdir)
+    return convert_to_pdf_once(docx, outdir)
@@ -0,0 +1,164 @@
+"""Растеризация страниц PDF через ImageMagick (Ghostscript).
+
+Каждая страница рендерится отдельным процессом convert,
+страницы обрабатываются параллельно, по процессу на ядро.
+Плотность (dpi) подбирается по ширине каждой страницы так, чтобы
+картинка сразу получалась нужной ширины в пикселях.
+"""
+
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from autopublisher.config import IMAGEMAGICK_PATH
+from autopublisher.utils.process import ProcessError, run
+
+
+log = logging.getLogger(__name__)
+
+
+POINTS_PER_INCH = 72
+RENDER_TIMEOUT = 120.0
+
+PAGE_RE = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+END_OBJ = b"endobj"
+MEDIA_BOX_RE = re.compile(
+    rb"/MediaBox\s*\[\s*([-\d.]+)\s+[-\d.]+\s+([-\d.]+)\s+[-\d.]+\s*\]",
+)
+
+
+class PdfError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class PdfInfo:
+    # ширина каждой страницы в пунктах (1/72 дюйма), по порядку
+    widths: tuple[float, ...]
+
+    @property
+    def pages(self) -> int:
+        return len(self.widths)
+
+
+def identify_pdf(pdf: Path) -> PdfInfo:
+    """Число и ширина страниц по данным ImageMagick:
+    при плотности 72 dpi ширина в пикселях равна ширине в пунктах
+    """
+    try:
+        output = run([
+            IMAGEMAGICK_PATH,
+            "-density", str(POINTS_PER_INCH),
+            str(pdf),
+            "-format", "%w\n",
+            "info:",
+        ], timeout=RENDER_TIMEOUT)
+    except ProcessError as e:
+        raise PdfError(f"Can't identify {pdf}: {e}") from e
+    widths = output.split()
+    if not widths:
+        raise PdfError(f"No pages found in {pdf}")
+    return PdfInfo(widths=tuple(map(float, widths)))
+
+
+def find_page_widths(data: bytes) -> list[float] | None:
+    """Ширины страниц по MediaBox в их словарях, в порядке объектов
+    в файле. None -- если у какой-то страницы своего MediaBox нет
+    """
+    widths = []
+    for page in PAGE_RE.finditer(data):
+        # словарь страницы -- между соседними endobj, MediaBox в нем
+        # может стоять и до /Type
+        start = max(data.rfind(END_OBJ, 0, page.start()), 0)
+        end = data.find(END_OBJ, page.end())
+        media_box = MEDIA_BOX_RE.search(
+            data, start, end if end >= 0 else len(data),
+        )
+        if media_box is None:
+            return None
+        left, right = map(float, media_box.groups())
+        widths.append(right - left)
+    return widths
+
+
+def read_pdf_info(pdf: Path) -> PdfInfo:
+    """Число и ширина страниц.
+    В PDF от LibreOffice словари страниц не сжаты, и их достаточно
+    найти в файле. Порядок объектов в файле не обязан совпадать
+    с порядком страниц, поэтому ему верим, только если все страницы
+    одной ширины, иначе (и для других PDF) спрашиваем ImageMagick.
+    """
+    widths = find_page_widths(pdf.read_bytes())
+    if not widths or len(set(widths)) > 1:
+        return identify_pdf(pdf)
+    return PdfInfo(widths=tuple(widths))
+
+
+def get_density(page_width: float, width: int) -> float:
+    """dpi, при котором страница шириной page_width пунктов
+    станет картинкой шириной width пикселей
+    """
+    return width * POINTS_PER_INCH / page_width
+
+
+def get_page_paths(target: Path, pages: int) -> list[Path]:
+    """Имена картинок, как у ImageMagick: target для одной страницы,
+    target-0, target-1, ... для нескольких
+    """
+    if pages == 1:
+        return [target]
+    return [
+        target.with_name(f"{target.stem}-{page}{target.suffix}")
+        for page in range(pages)
+    ]
+
+
+def render_page(pdf: Path, page: int, density: float, target: Path) -> Path:
+    try:
+        run([
+            IMAGEMAGICK_PATH,
+            "-density", f"{density:.2f}",
+            f"{pdf}[{page}]",
+            "-alpha", "remove",
+            "-colorspace", "sRGB",
+            "-quality", "100",
+            str(target),
+        ], timeout=RENDER_TIMEOUT)
+    except ProcessError as e:
+        raise PdfError(f"Can't render page {page} of {pdf}: {e}") from e
+    if not target.exists():
+        raise PdfError(f"Can't find rendered page: {target}")
+    return target
+
+
+def rasterize_pdf(
+        pdf: Path,
+        target: Path,
+        *,
+        width: int,
+        workers: int | None = None,
+) -> list[Path]:
+    """Рендерит страницы pdf в картинки шириной width пикселей
+    с именами по образцу target и возвращает их по порядку страниц
+    """
+    info = read_pdf_info(pdf)
+    densities = [get_density(page_width, width) for page_width in info.widths]
+    targets = get_page_paths(target, info.pages)
+    workers = min(info.pages, workers or os.cpu_count() or 1)
+    log.info(
+        "Render %d pages of %s at %.2f-%.2f dpi in %d processes",
+        info.pages, pdf, min(densities), max(densities), workers,
+    )
+    with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pdf-render",
+    ) as executor:
+        return list(executor.map(
+            render_page,
+            [pdf] * info.pages,
+            range(info.pages),
+            densities,
+            targets,
+        ))
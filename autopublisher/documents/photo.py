@@ -0,0 +1,111 @@
+"""Фотографии для новости под бюджет по размеру файла.
+
+Фотография уменьшается до нужного размера по широкой стороне,
+поворачивается по EXIF (document.load_image_on_wide_size)
+и кодируется заново: прогрессивный JPEG с оптимизированными
+таблицами Хаффмана или, если включено, WebP. Качество подбирается
+двоичным поиском -- наибольшее, при котором файл не больше бюджета.
+EXIF, превью и комментарии в результат не попадают, остается только
+цветовой профиль (ICC).
+"""
+
+import io
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image
+
+from autopublisher.documents.document import load_image_on_wide_size
+
+
+log = logging.getLogger(__name__)
+
+
+JPEG_FORMAT = "jpeg"
+WEBP_FORMAT = "webp"
+PHOTO_SUFFIXES = {JPEG_FORMAT: ".jpg", WEBP_FORMAT: ".webp"}
+
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+# скорость/сжатие WebP: 6 -- лучшее сжатие, но заметно медленнее
+WEBP_METHOD = 4
+
+
+@dataclass(frozen=True)
+class PhotoEncoding:
+    wide_side: int
+    # бюджет на файл в байтах
+    budget: int
+    format: str = JPEG_FORMAT
+
+    @property
+    def suffix(self) -> str:
+        return PHOTO_SUFFIXES[self.format]
+
+
+def encode_photo(
+        image: Image.Image,
+        image_format: str,
+        quality: int,
+        icc_profile: bytes | None,
+) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == WEBP_FORMAT:
+        image.save(
+            buffer, "WEBP",
+            quality=quality, method=WEBP_METHOD, icc_profile=icc_profile,
+        )
+    else:
+        image.save(
+            buffer, "JPEG",
+            quality=quality, optimize=True, progressive=True,
+            icc_profile=icc_profile,
+        )
+    return buffer.getvalue()
+
+
+def encode_to_budget(
+        image: Image.Image,
+        encoding: PhotoEncoding,
+        icc_profile: bytes | None = None,
+) -> tuple[bytes, int]:
+    """Файл с наибольшим качеством, который не больше бюджета,
+    и это качество. Если бюджет не достижим, то MIN_QUALITY.
+    """
+    low, high = MIN_QUALITY, MAX_QUALITY
+    best: tuple[bytes, int] | None = None
+    smallest = b""
+    # сначала MAX_QUALITY: небольшие фотографии в бюджет и так влезают
+    quality = MAX_QUALITY
+    while low <= high:
+        data = encode_photo(image, encoding.format, quality, icc_profile)
+        if len(data) <= encoding.budget:
+            best = data, quality
+            low = quality + 1
+        else:
+            high = quality - 1
+            smallest = data
+        quality = (low + high + 1) // 2
+    if best is None:
+        log.warning(
+            "Can't fit photo into %d bytes, got %d at quality %d",
+            encoding.budget, len(smallest), MIN_QUALITY,
+        )
+        return smallest, MIN_QUALITY
+    return best
+
+
+def prepare_photo(photo: Path, target: Path, encoding: PhotoEncoding) -> Path:
+    """Фотография photo для новости в файле target"""
+    image, icc_profile = load_image_on_wide_size(
+        photo, encoding.wide_side, enlarge=False,
+    )
+    data, quality = encode_to_budget(image, encoding, icc_profile)
+    target.write_bytes(data)
+    log.info(
+        "%s: %dx%d %s, quality %d, %d -> %d bytes",
+        photo.name, image.width, image.height, encoding.format, quality,
+        photo.stat().st_size, len(data),
+    )
+    return target
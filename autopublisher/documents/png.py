@@ -0,0 +1,99 @@
+"""Сжатие PNG страниц расписания.
+
+Страница расписания -- это черный текст и линии таблицы на белом
+поле, поэтому после рендера PDF ее можно заметно уменьшить:
+обрезать поля, перевести в палитру из нескольких цветов, если
+картинка от этого почти не меняется, и сохранить с максимальным
+сжатием zlib.
+"""
+
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageStat
+
+
+log = logging.getLogger(__name__)
+
+
+WHITE = (255, 255, 255)
+# насколько пиксель может отличаться от белого, чтобы считаться полем
+TRIM_FUZZ = 16
+TRIM_PADDING = 10
+# палитры по возрастанию: меньше цветов -- меньше бит на пиксель
+PALETTE_SIZES = (16, 64, 256)
+# средняя ошибка на канал, при которой палитра еще допустима
+MAX_PALETTE_ERROR = 1.5
+
+
+@dataclass(frozen=True)
+class PngSaving:
+    path: Path
+    size_before: int
+    size_after: int
+
+    @property
+    def saved(self) -> int:
+        return self.size_before - self.size_after
+
+
+def trim_margins(image: Image.Image) -> Image.Image:
+    """Обрезает белые поля, оставляя TRIM_PADDING пикселей"""
+    background = Image.new("RGB", image.size, WHITE)
+    mask = ImageChops.difference(image, background).convert("L").point(
+        lambda value: 255 if value > TRIM_FUZZ else 0,
+    )
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(left - TRIM_PADDING, 0),
+        max(top - TRIM_PADDING, 0),
+        min(right + TRIM_PADDING, image.width),
+        min(bottom + TRIM_PADDING, image.height),
+    ))
+
+
+def palette_error(image: Image.Image, quantized: Image.Image) -> float:
+    difference = ImageChops.difference(image, quantized.convert("RGB"))
+    return max(ImageStat.Stat(difference).mean)
+
+
+def to_palette(image: Image.Image) -> Image.Image:
+    """Картинка с самой маленькой палитрой, которая почти ее
+    не меняет, или image как есть
+    """
+    for size in PALETTE_SIZES:
+        quantized = image.quantize(size, dither=Image.Dither.NONE)
+        if palette_error(image, quantized) <= MAX_PALETTE_ERROR:
+            return quantized
+    return image
+
+
+def optimize_png(png: Path) -> PngSaving:
+    """Сжимает страницу расписания png на месте"""
+    size_before = png.stat().st_size
+    with Image.open(png) as source:
+        image = source.convert("RGB")
+    image = to_palette(trim_margins(image))
+    image.save(png, "PNG", optimize=True)
+    saving = PngSaving(png, size_before, png.stat().st_size)
+    log.info(
+        "%s: %dx%d %s, %d -> %d bytes, saved %d",
+        png.name, image.width, image.height, image.mode,
+        saving.size_before, saving.size_after, saving.saved,
+    )
+    return saving
+
+
+def optimize_pngs(pngs: list[Path]) -> list[PngSaving]:
+    savings = [optimize_png(png) for png in pngs]
+    before = sum(saving.size_before for saving in savings)
+    after = sum(saving.size_after for saving in savings)
+    log.info(
+        "%d pages: %d -> %d bytes, saved %d",
+        len(savings), before, after, before - after,
+    )
+    return savings
@@ -1,6 +1,8 @@
+import asyncio
 import logging
 import traceback
-from contextvars import ContextVar
+from collections.abc import Awaitable
+from typing import Any
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
@@ -14,8 +16,13 @@ from telegram.ext import (
 
 from autopublisher.config import TELEGRAM_API_MESSAGE_LIMIT, config
 from autopublisher.mail import maildriver
+from autopublisher.mail.aio import async_mail_client
 from autopublisher.publish import prepare, publish
-from autopublisher.utils.telegram import owner_only
+from autopublisher.utils.telegram import (
+    Progress,
+    owner_only,
+    wait_with_progress,
+)
 
 
 log = logging.getLogger(__name__)
@@ -27,29 +34,49 @@ SEARCH, TEXT, TITLE, PUBLISH, RASPLOAD = range(5)
 NEWS, RASP, CANCEL, YES, NO, EDIT, EDIT_TITLE = range(7)
 
 
-CurrentMailT = ContextVar[maildriver.CurrentMail | None]
-current_mail: CurrentMailT = ContextVar("current_mail", default=None)
+# Обработчики диалога выполняются как отдельные задачи (block=False),
+# поэтому текущее письмо хранится в chat_data, а не в ContextVar
+CURRENT_MAIL = "current_mail"
+
+# Сообщение, если почтовый сервер долго не отвечает
+MAIL_PROGRESS_TEXT = "Все еще жду почтовый сервер..."
+IMAGES_PROGRESS_TEXT = "Все еще готовлю фотографии"
+IMAGES_PROGRESS_INTERVAL = 10.0
+RASP_PROGRESS_TEXT = "Все еще готовлю расписание"
+PUBLISH_PROGRESS_TEXT = "Все еще публикую"
+
+
+def _chat_data(context: ContextTypes.DEFAULT_TYPE) -> dict[str, Any]:
+    if context.chat_data is None:
+        raise RuntimeError("Chat data is None")
+    return context.chat_data
+
+
+def get_current_mail(
+        context: ContextTypes.DEFAULT_TYPE,
+) -> maildriver.CurrentMail | None:
+    return _chat_data(context).get(CURRENT_MAIL)
 
 
-def get_unwrapped_current_mail() -> maildriver.CurrentMail:
-    mail = current_mail.get()
+def get_unwrapped_current_mail(
+        context: ContextTypes.DEFAULT_TYPE,
+) -> maildriver.CurrentMail:
+    mail = get_current_mail(context)
     if mail is None:
         raise RuntimeError("Current Mail is None")
     return mail
 
 
-def current_mail_clear() -> None:
-    mail = current_mail.get()
+def current_mail_clear(context: ContextTypes.DEFAULT_TYPE) -> None:
+    mail = _chat_data(context).pop(CURRENT_MAIL, None)
     if mail:
         mail.clear()
-    current_mail.set(None)
 
 
-def current_mail_rollback() -> None:
-    mail = current_mail.get()
+async def current_mail_rollback(context: ContextTypes.DEFAULT_TYPE) -> None:
+    mail = _chat_data(context).pop(CURRENT_MAIL, None)
     if mail:
-        mail.rollback()
-    current_mail.set(None)
+        await async_mail_client.call(mail.rollback)
 
 
 async def catch_error(
@@ -66,9 +93,7 @@ async def catch_error(
     if len(tbc) > TELEGRAM_API_MESSAGE_LIMIT:
         tbc = tbc[-TELEGRAM_API_MESSAGE_LIMIT:]
     await context.bot.send_message(chat_id=update.effective_chat.id, text=tbc)
-    mail = current_mail.get()
-    if mail:
-        mail.rollback()
+    await current_mail_rollback(context)
     return ConversationHandler.END
 
 
@@ -90,38 +115,29 @@ async def check_mail(
     await context.bot.send_message(
         chat_id=update.effective_chat.id, text="Проверяю почту...",
     )
-    mail_id, mail_folder, mail_metadata = maildriver.load_most_old_mail_from(
-        mail_from,
-    )
     logging.info("Sending request to get mail from %s", mail_from)
-    if mail_id is None:
+    mail = await wait_with_progress(
+        async_mail_client.call(maildriver.mail_prefetcher.take, mail_from),
+        update,
+        context,
+        text=MAIL_PROGRESS_TEXT,
+    )
+    if mail is None:
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=f"Новых писем от {name_for_msg} нет!",
         )
         return ConversationHandler.END
 
-    if not mail_folder or not mail_metadata:
-        log.error(
-            "Письмо было загружено, "
-            "однако mail_folder или mail_metadata отсутствуют."  # noqa:COM812
-        )
-        log.error("Mail folder: %r", mail_folder)
-        log.error("Mail metadata: %r", mail_metadata)
-
-        raise RuntimeError(
-            "Письмо было загружено, "
-            "однако mail_folder или mail_metadata отсутствуют."  # noqa:COM812
-        )
-
-    mail = maildriver.CurrentMail(
-        mail_id=mail_id,
-        mail_folder=mail_folder,
-        mail_metadata=mail_metadata,
+    _chat_data(context)[CURRENT_MAIL] = mail
+    text = "Есть письмо"
+    pending = await async_mail_client.call(
+        maildriver.mail_prefetcher.pending, mail_from,
     )
-    current_mail.set(mail)
+    if pending:
+        text += f", еще {pending} в очереди"
     await context.bot.send_message(
-        chat_id=update.effective_chat.id, text="Есть письмо",
+        chat_id=update.effective_chat.id, text=text,
     )
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
@@ -152,9 +168,14 @@ async def from_me_check_mail(
 
 
 async def news(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    mail = get_unwrapped_current_mail()
+    mail = get_unwrapped_current_mail(context)
     if not mail.sentences:
-        title, news_sentences = maildriver.get_text_for_news(mail)
+        title, news_sentences = await wait_with_progress(
+            async_mail_client.call(maildriver.get_text_for_news, mail),
+            update,
+            context,
+            text=MAIL_PROGRESS_TEXT,
+        )
         mail.title, mail.sentences = title, news_sentences
     text_to_show = "<" + ">\n<".join(mail.sentences) + ">"
     await context.bot.send_message(
@@ -180,8 +201,18 @@ async def news(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def news_prepare(
         update: Update, context: ContextTypes.DEFAULT_TYPE,
 ) -> int:
-    mail = get_unwrapped_current_mail()
-    mail.images = maildriver.get_images_for_news(mail)
+    mail = get_unwrapped_current_mail(context)
+    if not mail.images_prepared:
+        progress = Progress(IMAGES_PROGRESS_TEXT)
+        mail.images = await wait_with_progress(
+            async_mail_client.call(
+                maildriver.get_images_for_news, mail, progress,
+            ),
+            update,
+            context,
+            text=progress,
+            interval=IMAGES_PROGRESS_INTERVAL,
+        )
     if mail.images:
         imgs = "\n".join(
             f"{i+1}) {img}"
@@ -220,7 +251,7 @@ async def edit_save(
         line.replace("\n", " ")
         for line in text[1:-1].split(">\n<")
     ]
-    mail = get_unwrapped_current_mail()
+    mail = get_unwrapped_current_mail(context)
     mail.sentences = sentences
     return await news(update, context)
 
@@ -239,45 +270,73 @@ async def edit_title_save(
 ) -> int:
     text = update.message.text
     text = text.strip()
-    mail = get_unwrapped_current_mail()
+    mail = get_unwrapped_current_mail(context)
     mail.title = text
     return await news(update, context)
 
 
+async def publish_with_progress(
+        publishing: Awaitable[str],
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+) -> str:
+    # Selenium открывает браузер и ждет сайт, event loop ждать его не должен
+    return await wait_with_progress(
+        publishing, update, context, text=PUBLISH_PROGRESS_TEXT,
+    )
+
+
 async def rasp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="Подготовка...",
     )
-    mail = get_unwrapped_current_mail()
-    rasp_images = prepare.rasp(mail.folder)
+    mail = get_unwrapped_current_mail(context)
+    await wait_with_progress(
+        async_mail_client.call(
+            mail.fetch_attachments, ".docx", ".jpg", ".png",
+        ),
+        update,
+        context,
+        text=MAIL_PROGRESS_TEXT,
+    )
+    # convert и soffice работают долго, event loop ждать их не должен
+    rasp_images = await wait_with_progress(
+        asyncio.to_thread(prepare.rasp, mail.folder),
+        update,
+        context,
+        text=RASP_PROGRESS_TEXT,
+    )
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="Публикуем расписание",
     )
     try:
-        url = publish.rasp(rasp_images)
+        url = await publish_with_progress(
+            asyncio.to_thread(publish.rasp, rasp_images), update, context,
+        )
     except Exception as e:
         return await catch_error(update=update, context=context, exc=e)
+    await async_mail_client.call(mail.mark_published, url)
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="Опубликовано!",
     )
     await context.bot.send_message(chat_id=update.effective_chat.id, text=url)
-    current_mail_clear()
+    current_mail_clear(context)
     return ConversationHandler.END
 
 
 async def publish_news(
         update: Update, context: ContextTypes.DEFAULT_TYPE,
 ) -> int:
-    mail = get_unwrapped_current_mail()
+    mail = get_unwrapped_current_mail(context)
     if not mail.title:
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text="Ошибка: заголовок новости отсутствует",
         )
-        current_mail_clear()
+        current_mail_clear(context)
         return ConversationHandler.END
 
     html = prepare.html_from_sentences(mail.sentences)
@@ -286,20 +345,25 @@ async def publish_news(
         text="Публикуем",
     )
     try:
-        url = publish.news(mail.title, html, mail.images)
+        url = await publish_with_progress(
+            asyncio.to_thread(publish.news, mail.title, html, mail.images),
+            update,
+            context,
+        )
     except Exception as e:
         return await catch_error(update=update, context=context, exc=e)
+    await async_mail_client.call(mail.mark_published, url)
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="Опубликовано!",
     )
     await context.bot.send_message(chat_id=update.effective_chat.id, text=url)
-    current_mail_clear()
+    current_mail_clear(context)
     return ConversationHandler.END
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    current_mail_rollback()
+    await current_mail_rollback(context)
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="Отмена",
@@ -333,4 +397,6 @@ mail_handler = ConversationHandler(
                   CallbackQueryHandler(cancel, pattern=f"^{NO}$")],
     },
     fallbacks=[CommandHandler("echo", echo)],
+    # почта не должна задерживать обработку других сообщений боту
+    block=False,
 )
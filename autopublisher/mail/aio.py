@@ -0,0 +1,71 @@
+"""Асинхронный интерфейс к почте для обработчиков бота.
+
+imaplib блокирующий, поэтому почтовые операции выполняются
+в отдельном пуле из config.mail_async_workers потоков, а обработчики
+ждут их через await и не останавливают event loop бота.
+IMAP-команды по-прежнему идут по одному общему соединению
+mail.client.mail_client.
+Обработчики вызывают через async_mail_client.call функции maildriver,
+а не mail: только они учитывают mailbox_sync и mail_index.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import ParamSpec, TypeVar
+
+from autopublisher.config import config
+
+
+log = logging.getLogger(__name__)
+
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class AsyncMailClient:
+    """Мост между asyncio и блокирующим mail_client"""
+
+    def __init__(self, *, max_workers: int | None = None):
+        self._max_workers = max_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers or config.mail_async_workers
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="mail-async",
+                )
+            return self._executor
+
+    async def call(
+            self,
+            func: Callable[P, T],
+            *args: P.args,
+            **kwargs: P.kwargs,
+    ) -> T:
+        """Выполняет блокирующую func(...) в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+async_mail_client = AsyncMailClient()
@@ -0,0 +1,250 @@
+import imaplib
+import logging
+import random
+import ssl
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Concatenate, ParamSpec, TypeVar
+
+from autopublisher.config import config
+from autopublisher.mail import mail
+from autopublisher.mail.mail import MailTimeoutError
+
+
+log = logging.getLogger(__name__)
+
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+MailOperationT = Callable[Concatenate[imaplib.IMAP4_SSL, P], T]
+
+# Ошибки, после которых соединение считаем потерянным
+CONNECTION_ERRORS = (
+    imaplib.IMAP4.abort, ConnectionError, TimeoutError, ssl.SSLError,
+)
+
+
+# Таймаут операции, даже если до общего срока осталось меньше
+MIN_TIMEOUT = 1.0
+
+
+class MailDeadlineError(TimeoutError):
+    """Операция не уложилась в общий срок с учетом повторов"""
+
+    def __init__(self, phase: str, deadline: float, attempts: int):
+        self.phase = phase
+        self.deadline = deadline
+        self.attempts = attempts
+        super().__init__(
+            f"IMAP {phase} did not complete within the {deadline:.1f}s "
+            f"deadline ({attempts} attempts)",
+        )
+
+
+def backoff_delay(attempt: int) -> float:
+    """Пауза перед повтором номер attempt: экспоненциальная,
+    со случайным разбросом (full jitter)
+    """
+    ceiling = min(
+        config.mail_retry_backoff_max,
+        config.mail_retry_backoff * 2 ** (attempt - 1),
+    )
+    return random.uniform(0, ceiling)
+
+
+class MailClient:
+    """Долгоживущее IMAP-соединение, общее для всех почтовых операций.
+
+    Соединение открывается при первой операции, поддерживается
+    командой NOOP из фонового потока и переоткрывается,
+    если сервер его разорвал.
+
+    Каждая операция ограничена таймаутом config.mail_timeout,
+    при обрыве соединения повторяется до config.mail_retries раз
+    с нарастающей паузой, но не дольше общего срока config.mail_deadline
+    или срока, заданного через deadline().
+    """
+
+    def __init__(self, *, keepalive_interval: float | None = None):
+        self._keepalive_interval = keepalive_interval
+        self._connection: imaplib.IMAP4_SSL | None = None
+        self._last_used: float = 0.0
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+        self._keepalive_thread: threading.Thread | None = None
+        # срок, заданный deadline() в текущем потоке
+        self._local = threading.local()
+
+    @property
+    def keepalive_interval(self) -> float:
+        if self._keepalive_interval is not None:
+            return self._keepalive_interval
+        return config.mail_keepalive_interval
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None
+
+    @contextmanager
+    def deadline(self, seconds: float | None = None) -> Iterator[None]:
+        """Общий срок для всех операций внутри блока,
+        например для одной проверки почты
+        """
+        previous = getattr(self._local, "deadline", None)
+        deadline = time.monotonic() + (seconds or config.mail_deadline)
+        if previous is not None:
+            deadline = min(deadline, previous)
+        self._local.deadline = deadline
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    def _get_deadline(self) -> float:
+        deadline = time.monotonic() + config.mail_deadline
+        outer = getattr(self._local, "deadline", None)
+        return deadline if outer is None else min(deadline, outer)
+
+    def run(
+            self,
+            operation: MailOperationT[P, T],
+            *args: P.args,
+            **kwargs: P.kwargs,
+    ) -> T:
+        """Выполняет operation(connection, ...) на общем соединении.
+
+        Если соединение оборвалось или сервер не ответил вовремя,
+        соединение переоткрывается и операция повторяется.
+        """
+        phase = getattr(operation, "__name__", "operation")
+        started = time.monotonic()
+        deadline = self._get_deadline()
+        attempt = 1
+        while True:
+            try:
+                return self._run(deadline, phase, operation, *args, **kwargs)
+            except CONNECTION_ERRORS as e:
+                if attempt >= config.mail_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise MailDeadlineError(
+                        phase, deadline - started, attempt,
+                    ) from e
+                log.warning(
+                    "Mail %s failed: %s, retry in %.1fs", phase, e, delay,
+                )
+                time.sleep(delay)
+            attempt += 1
+
+    def _run(
+            self,
+            deadline: float,
+            phase: str,
+            operation: MailOperationT[P, T],
+            *args: P.args,
+            **kwargs: P.kwargs,
+    ) -> T:
+        remaining = max(deadline - time.monotonic(), 0)
+        if not self._lock.acquire(timeout=remaining):
+            raise MailTimeoutError(f"{phase}: wait for connection", remaining)
+        try:
+            timeout = max(
+                min(config.mail_timeout, deadline - time.monotonic()),
+                MIN_TIMEOUT,
+            )
+            connection = self._acquire(timeout)
+            mail.set_timeout(connection, timeout)
+            with mail.imap_phase(phase, timeout, connection):
+                return operation(connection, *args, **kwargs)
+        except CONNECTION_ERRORS:
+            self._drop(logout=False)
+            raise
+        finally:
+            self._last_used = time.monotonic()
+            self._lock.release()
+
+    def _acquire(self, timeout: float) -> imaplib.IMAP4_SSL:
+        connection = self._connection
+        idle = time.monotonic() - self._last_used
+        if connection is not None and idle >= self.keepalive_interval:
+            mail.set_timeout(connection, timeout)
+            if self._is_alive(connection):
+                return connection
+            log.info("Mail connection is dead, reconnecting...")
+            self._drop(logout=False)
+            connection = None
+
+        if connection is None:
+            log.info("Connecting to mail server...")
+            connection = mail.get_connection(timeout=timeout)
+            self._connection = connection
+            self._start_keepalive()
+        return connection
+
+    @staticmethod
+    def _is_alive(connection: imaplib.IMAP4_SSL) -> bool:
+        try:
+            status, _ = connection.noop()
+        except CONNECTION_ERRORS:
+            return False
+        return status == "OK"
+
+    def _drop(self, *, logout: bool = True) -> None:
+        """logout=False: соединение сломано, закрываем его без LOGOUT,
+        чтобы не ждать ответа от сервера, который уже не отвечает
+        """
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            if logout:
+                mail.close_connection(connection)
+            else:
+                connection.shutdown()
+        except (imaplib.IMAP4.error, OSError):
+            log.debug("Error while closing mail connection", exc_info=True)
+
+    def keepalive(self) -> None:
+        """Отправляет NOOP, если соединение простаивает дольше интервала"""
+        with self._lock:
+            connection = self._connection
+            if connection is None:
+                return
+            if time.monotonic() - self._last_used < self.keepalive_interval:
+                return
+            if not self._is_alive(connection):
+                log.info("Mail connection is dead, it will be reopened")
+                self._drop(logout=False)
+                return
+            self._last_used = time.monotonic()
+
+    def _keepalive_loop(self) -> None:
+        while not self._stopping.wait(self.keepalive_interval):
+            self.keepalive()
+
+    def _start_keepalive(self) -> None:
+        thread = self._keepalive_thread
+        if thread is not None and thread.is_alive():
+            return
+        self._stopping.clear()
+        self._keepalive_thread = threading.Thread(
+            target=self._keepalive_loop,
+            name="mail-keepalive",
+            daemon=True,
+        )
+        self._keepalive_thread.start()
+
+    def close(self) -> None:
+        self._stopping.set()
+        with self._lock:
+            self._drop()
+        thread, self._keepalive_thread = self._keepalive_thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+mail_client = MailClient()
@@ -0,0 +1,81 @@
+import imaplib
+import logging
+import select
+import ssl
+
+
+log = logging.getLogger(__name__)
+
+
+class IdleError(imaplib.IMAP4.error):
+    pass
+
+
+def supports_idle(connection: imaplib.IMAP4_SSL) -> bool:
+    return "IDLE" in connection.capabilities
+
+
+def _has_buffered(connection: imaplib.IMAP4_SSL) -> bool:
+    """Есть ли в буфере connection.file непрочитанные данные.
+    readline() читает сокет блоками, и уведомление, пришедшее вместе
+    с "+ idling", уже лежит в буфере, а select о нем не знает.
+    peek на пустом буфере читает сокет, поэтому на время проверки
+    сокет неблокирующий.
+    """
+    sock = connection.sock
+    timeout = sock.gettimeout()
+    sock.setblocking(False)  # noqa:FBT003
+    try:
+        return bool(connection.file.peek(1))  # type: ignore[attr-defined]
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+
+def _wait_readable(connection: imaplib.IMAP4_SSL, timeout: float) -> bool:
+    # imaplib читает через буферизованный файл, таймаут на сокете
+    # ломает его состояние, поэтому ждем данные через select.
+    if _has_buffered(connection):
+        return True
+    sock = connection.sock
+    if isinstance(sock, ssl.SSLSocket) and sock.pending():
+        return True
+    readable, _, _ = select.select([sock], [], [], timeout)
+    return bool(readable)
+
+
+def idle(connection: imaplib.IMAP4_SSL, timeout: float) -> bool:
+    """Ждет изменений в выбранном ящике в режиме IDLE (RFC 2177).
+
+    Возвращает True, если сервер сообщил об изменениях,
+    и False, если за timeout секунд ничего не произошло.
+    """
+    tag = connection._new_tag()  # noqa:SLF001
+    connection.send(tag + b" IDLE\r\n")
+    response = connection.readline()
+    if not response.startswith(b"+"):
+        connection.tagged_commands.pop(tag, None)
+        raise IdleError(f"IDLE is rejected: {response!r}")
+
+    changed = False
+    if _wait_readable(connection, timeout):
+        line = connection.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("socket error: EOF during IDLE")
+        log.debug("IDLE notification: %r", line)
+        changed = True
+
+    connection.send(b"DONE\r\n")
+    while True:
+        line = connection.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("socket error: EOF during IDLE")
+        if line.startswith(tag):
+            break
+        changed = True
+
+    connection.tagged_commands.pop(tag, None)
+    if not line.startswith(tag + b" OK"):
+        raise IdleError(f"IDLE is failed: {line!r}")
+    return changed
@@ -0,0 +1,181 @@
+"""Локальный индекс обработанных писем (SQLite).
+
+Для каждого письма хранит Message-ID, хеши вложений, стадию
+обработки и адрес опубликованной страницы. Перед загрузкой письма
+проверяем по Message-ID, не опубликовано ли оно уже, после загрузки --
+по хешам вложений (письмо переслали еще раз или отправили заново
+с теми же файлами). Повторы пропускаются без распаковки, soffice,
+ImageMagick и Selenium.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from autopublisher.config import config
+from autopublisher.utils.file import file_hash
+
+
+log = logging.getLogger(__name__)
+
+
+# Стадии обработки письма
+LOADED = "loaded"
+PUBLISHED = "published"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mails (
+    message_id TEXT PRIMARY KEY,
+    attachments_key TEXT,
+    stage TEXT NOT NULL,
+    url TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mails_attachments_key
+    ON mails (attachments_key);
+CREATE TABLE IF NOT EXISTS attachments (
+    message_id TEXT NOT NULL REFERENCES mails (message_id),
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (message_id, filename)
+);
+"""
+
+
+def attachment_hashes(folder: Path, filenames: list[str]) -> dict[str, str]:
+    """Хеши вложений, которые уже сохранены в папке письма"""
+    return {
+        filename: file_hash(folder / filename)
+        for filename in filenames
+        if (folder / filename).is_file()
+    }
+
+
+def attachments_key(hashes: Iterable[str]) -> str | None:
+    """Общий хеш набора вложений, не зависит от их имен и порядка"""
+    hashes = sorted(set(hashes))
+    if not hashes:
+        return None
+    return hashlib.sha256("\n".join(hashes).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class IndexedMail:
+    message_id: str
+    stage: str
+    url: str | None
+
+    @property
+    def published(self) -> bool:
+        return self.stage == PUBLISHED
+
+
+class MailIndex:
+    """Индекс обработанных писем.
+
+    Включается, если задан config.mail_index_file.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self._path = path
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path | None:
+        return self._path or config.mail_index_file
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            if self.path is None:
+                raise RuntimeError("Mail index file is not configured")
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Индексом пользуются и фоновые потоки, доступ под self._lock
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get(self, message_id: str) -> IndexedMail | None:
+        with self._lock:
+            row = self.db.execute(
+                "SELECT message_id, stage, url FROM mails "
+                "WHERE message_id = ?",
+                (message_id,),
+            ).fetchone()
+        return IndexedMail(*row) if row else None
+
+    def find_published_copy(
+            self, message_id: str, hashes: Iterable[str],
+    ) -> IndexedMail | None:
+        """Другое опубликованное письмо с теми же вложениями"""
+        key = attachments_key(hashes)
+        if key is None:
+            return None
+        with self._lock:
+            row = self.db.execute(
+                "SELECT message_id, stage, url FROM mails "
+                "WHERE attachments_key = ? AND stage = ? "
+                "AND message_id != ? LIMIT 1",
+                (key, PUBLISHED, message_id),
+            ).fetchone()
+        return IndexedMail(*row) if row else None
+
+    def record(
+            self,
+            message_id: str,
+            stage: str,
+            *,
+            attachments: dict[str, str] | None = None,
+            url: str | None = None,
+    ) -> None:
+        """Сохраняет стадию обработки письма.
+
+        attachments: {имя файла: sha256}, если известны
+        """
+        with self._lock, self.db as db:
+            db.execute(
+                "INSERT INTO mails (message_id, stage, url, updated_at) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (message_id) DO UPDATE SET "
+                "stage = excluded.stage, "
+                "url = coalesce(excluded.url, url), "
+                "updated_at = excluded.updated_at",
+                (message_id, stage, url, time.time()),
+            )
+            if attachments is None:
+                return
+            db.execute(
+                "DELETE FROM attachments WHERE message_id = ?",
+                (message_id,),
+            )
+            db.executemany(
+                "INSERT INTO attachments (message_id, filename, sha256) "
+                "VALUES (?, ?, ?)",
+                [
+                    (message_id, filename, sha256)
+                    for filename, sha256 in attachments.items()
+                ],
+            )
+            db.execute(
+                "UPDATE mails SET attachments_key = ? WHERE message_id = ?",
+                (attachments_key(attachments.values()), message_id),
+            )
+
+
+mail_index = MailIndex()
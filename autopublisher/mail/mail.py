@@ -3,20 +3,85 @@ import imaplib
 import logging
 import mimetypes
 import shutil
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
 from email.header import decode_header
 from pathlib import Path
-from typing import Any
+from typing import IO, Any
 
 from autopublisher.config import config
+from autopublisher.mail.streaming import StreamedMail, save_parts
+from autopublisher.mail.structure import (
+    MailPart,
+    MessageStructure,
+    decode_filename,
+    decode_transfer_encoding,
+    fetch_items,
+    fetch_responses,
+    parse_bodystructure,
+)
 
 
-# TODO: сделать MailClient
-def get_connection() -> imaplib.IMAP4_SSL:
-    imap = imaplib.IMAP4_SSL(config.mail_server)
-    status, response = imap.login(config.mail_login, config.mail_passwd)
+class MailTimeoutError(TimeoutError):
+    """IMAP-сервер не ответил за отведенное время"""
+
+    def __init__(self, phase: str, timeout: float | None):
+        self.phase = phase
+        self.timeout = timeout
+        after = f" after {timeout:.1f}s" if timeout is not None else ""
+        super().__init__(f"IMAP {phase} timed out{after}")
+
+
+class MailConnection(imaplib.IMAP4_SSL):
+    """IMAP4_SSL, который помнит последнюю отправленную команду"""
+
+    command: str = "CONNECT"
+
+    def _simple_command(self, name: str, *args: Any) -> tuple[str, list[Any]]:
+        self.command = f"{name} {args[0]}" if name == "UID" and args else name
+        return super()._simple_command(name, *args)  # type: ignore[misc]
+
+
+@contextmanager
+def imap_phase(
+        phase: str,
+        timeout: float | None,
+        connection: imaplib.IMAP4_SSL | None = None,
+) -> Iterator[None]:
+    """Превращает таймаут сокета в MailTimeoutError с названием
+    этапа и IMAP-команды, на которой сервер перестал отвечать
+    """
+    try:
+        yield
+    except MailTimeoutError:
+        raise
+    except TimeoutError as e:
+        if isinstance(connection, MailConnection):
+            phase = f"{connection.command} in {phase}"
+        raise MailTimeoutError(phase, timeout) from e
+
+
+def set_timeout(connection: imaplib.IMAP4_SSL, timeout: float | None) -> None:
+    """Таймаут на каждое чтение и запись в сокет соединения"""
+    connection.sock.settimeout(timeout)
+
+
+def get_connection(*, timeout: float | None = None) -> imaplib.IMAP4_SSL:
+    """timeout: ограничивает таймауты подключения и команд сверху"""
+    connect_timeout = min(config.mail_connect_timeout, timeout or float("inf"))
+    command_timeout = min(config.mail_timeout, timeout or float("inf"))
+    with imap_phase("connect", connect_timeout):
+        imap = MailConnection(
+            config.mail_server, config.mail_port, timeout=connect_timeout,
+        )
+    set_timeout(imap, command_timeout)
+    with imap_phase("login", command_timeout):
+        status, response = imap.login(config.mail_login, config.mail_passwd)
     if status != "OK":
         raise ConnectionError(f"Error logged in email box. Status: {status}")
-    imap.select("INBOX")
+    with imap_phase("select", command_timeout):
+        imap.select("INBOX")
     return imap
 
 
@@ -24,13 +89,36 @@ def get_new_mails_from(
         connection: imaplib.IMAP4_SSL,
         from_email: str,
 ) -> list[str]:
-    status, unseen_mails = connection.search(
-        None, f"(FROM {from_email} UNSEEN)",
-    )
-    new_mails_ids = [
-        uid for uid in unseen_mails[0].decode().split(" ") if uid
-    ]
-    return new_mails_ids  # noqa:RET504
+    """UID непрочитанных писем от from_email"""
+    unseen_mails = search_uids(connection, f"(FROM {from_email} UNSEEN)")
+    return [str(uid) for uid in unseen_mails]
+
+
+def search_uids(connection: imaplib.IMAP4_SSL, criteria: str) -> list[int]:
+    response, data = connection.uid("SEARCH", None, criteria)  # type: ignore[arg-type]
+    if response != "OK":
+        raise ValueError(f"Response status is not OK: `{response}`")
+    return [int(uid) for uid in data[0].split()]
+
+
+def get_mailbox_status(
+        connection: imaplib.IMAP4_SSL,
+        *,
+        condstore: bool = False,
+) -> dict[str, int]:
+    """UIDVALIDITY, UIDNEXT, MESSAGES и, если сервер
+    поддерживает CONDSTORE, HIGHESTMODSEQ для INBOX
+    """
+    names = "UIDVALIDITY UIDNEXT MESSAGES"
+    if condstore:
+        names += " HIGHESTMODSEQ"
+    response, data = connection.status("INBOX", f"({names})")
+    if response != "OK":
+        raise ValueError(f"Response status is not OK: `{response}`")
+    return {
+        key: int(value)  # type: ignore[arg-type]
+        for key, value in fetch_items(data).items()
+    }
 
 
 def decode_mail_field(message: email.message.Message, field: str) -> str:
@@ -51,17 +139,48 @@ def get_attachments_list(message: email.message.Message) -> list[str]:
 
         filename = part.get_filename()
         if filename:
-            bts, encoding = decode_header(filename)[0]
-            if encoding:
-                filename = bts.decode(encoding)
+            attachments.append(decode_filename(filename))
+    return attachments
+
 
-            attachments.append(filename)
-    return attachments  # type: ignore[return-value]
+def get_message_id(message: email.message.Message) -> str | None:
+    message_id = message["Message-ID"]
+    return str(message_id).strip() if message_id else None
+
+
+def get_message_ids(
+        connection: imaplib.IMAP4_SSL,
+        mail_ids: list[str],
+) -> dict[str, str | None]:
+    """Загружает только заголовок Message-ID писем, не помечая
+    их прочитанными
+    """
+    response, data = connection.uid(
+        "FETCH", ",".join(mail_ids), "(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])",
+    )
+    if response != "OK":
+        raise ValueError(f"Response status is not OK: `{response}`")
+    message_ids: dict[str, str | None] = {}
+    for mail_id, items in fetch_responses(data).items():
+        header = next(
+            (
+                value for key, value in items.items()
+                if key.startswith("BODY[HEADER.FIELDS")
+            ),
+            None,
+        )
+        if not isinstance(header, bytes):
+            continue
+        message_ids[mail_id] = get_message_id(
+            email.message_from_bytes(header),
+        )
+    return message_ids
 
 
 def get_mail_metadata(message: email.message.Message) -> dict[str, Any]:
     mail_metadata = {
         "Date": message["Date"],
+        "Message-ID": get_message_id(message),
         "From": decode_mail_field(message, "From"),
         "Subject": decode_mail_field(message, "Subject"),
     }
@@ -80,20 +199,196 @@ def get_mail_metadata(message: email.message.Message) -> dict[str, Any]:
 def get_message(
         connection: imaplib.IMAP4_SSL,
         mail_id: str,
+        *,
+        peek: bool = False,
 ) -> email.message.Message:
-    # TODO: добавить retry
-    response, mail_binary_data = connection.fetch(mail_id, "(RFC822)")
+    """peek: загрузить письмо, не помечая его прочитанным"""
+    message_parts = "(BODY.PEEK[])" if peek else "(RFC822)"
+    response, mail_binary_data = connection.uid(
+        "FETCH", mail_id, message_parts,
+    )
     if response != "OK":
         raise ValueError(f"Response status is not OK: `{response}`")
-    return email.message_from_bytes(mail_binary_data[0][1])  # type: ignore[arg-type,index]
+    return email.message_from_bytes(mail_binary_data[0][1])
 
 
-def save_email(message: email.message.Message, mail_folder: Path) -> None:
+def get_messages(
+        connection: imaplib.IMAP4_SSL,
+        mail_ids: list[str],
+        *,
+        peek: bool = False,
+) -> dict[str, email.message.Message]:
+    """Загружает несколько писем одной командой FETCH"""
+    message_parts = "(BODY.PEEK[])" if peek else "(RFC822)"
+    response, data = connection.uid(
+        "FETCH", ",".join(mail_ids), message_parts,
+    )
+    if response != "OK":
+        raise ValueError(f"Response status is not OK: `{response}`")
+    key = "BODY[]" if peek else "RFC822"
+    return {
+        mail_id: email.message_from_bytes(items[key])  # type: ignore[arg-type]
+        for mail_id, items in fetch_responses(data).items()
+        if key in items
+    }
+
+
+# Размер куска, которым письмо загружается в stream режиме
+FETCH_CHUNK_SIZE = 1024 * 1024
+# Письма больше этого размера SpooledTemporaryFile сбрасывает на диск
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+
+def _fetch_message_chunk(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        offset: int,
+) -> bytes:
+    response, data = connection.uid(
+        "FETCH", mail_id, f"(BODY.PEEK[]<{offset}.{FETCH_CHUNK_SIZE}>)",
+    )
+    if response != "OK":
+        raise ValueError(f"Response status is not OK: `{response}`")
+    return fetch_items(data)[f"BODY[]<{offset}>"] or b""  # type: ignore[return-value]
+
+
+def spool_message(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        *,
+        peek: bool = False,
+) -> IO[bytes]:
+    """Загружает письмо кусками по FETCH_CHUNK_SIZE во временный файл.
+
+    В памяти одновременно находится не больше одного куска,
+    файл возвращается открытым и перемотанным на начало.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)  # noqa:SIM115
+    try:
+        offset = 0
+        while True:
+            chunk = _fetch_message_chunk(connection, mail_id, offset)
+            spool.write(chunk)
+            offset += len(chunk)
+            if len(chunk) < FETCH_CHUNK_SIZE:
+                break
+        if not peek:
+            mark_as_read(connection, mail_id)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def get_message_structure(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        *,
+        peek: bool = False,
+) -> MessageStructure:
+    """Загружает только заголовки и BODYSTRUCTURE письма"""
+    return get_message_structures(connection, [mail_id], peek=peek)[mail_id]
+
+
+def get_message_structures(
+        connection: imaplib.IMAP4_SSL,
+        mail_ids: list[str],
+        *,
+        peek: bool = False,
+) -> dict[str, MessageStructure]:
+    """То же, что get_message_structure, для нескольких писем сразу"""
+    header = "BODY.PEEK[HEADER]" if peek else "BODY[HEADER]"
+    response, data = connection.uid(
+        "FETCH", ",".join(mail_ids), f"(BODYSTRUCTURE {header})",
+    )
+    if response != "OK":
+        raise ValueError(f"Response status is not OK: `{response}`")
+    return {
+        mail_id: MessageStructure(
+            headers=items["BODY[HEADER]"] or b"",  # type: ignore[arg-type]
+            body=parse_bodystructure(items["BODYSTRUCTURE"]),  # type: ignore[arg-type]
+        )
+        for mail_id, items in fetch_responses(data).items()
+        if "BODYSTRUCTURE" in items
+    }
+
+
+def get_message_part(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        part: MailPart,
+) -> bytes:
+    section = part.section or "TEXT"
+    response, data = connection.uid(
+        "FETCH", mail_id, f"(BODY.PEEK[{section}])",
+    )
+    if response != "OK":
+        raise ValueError(f"Response status is not OK: `{response}`")
+    payload = fetch_items(data)[f"BODY[{section}]"] or b""
+    return decode_transfer_encoding(payload, part.encoding)  # type: ignore[arg-type]
+
+
+def get_structure_metadata(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        structure: MessageStructure,
+) -> dict[str, Any]:
+    """То же, что get_mail_metadata, но загружает только текст письма"""
+    message = email.message_from_bytes(structure.headers)
+    text_part = structure.text_part
+    mail_body = (
+        get_message_part(connection, mail_id, text_part) if text_part else b""
+    )
+    return {
+        "Date": message["Date"],
+        "Message-ID": get_message_id(message),
+        "From": decode_mail_field(message, "From"),
+        "Subject": decode_mail_field(message, "Subject"),
+        "Body": mail_body.decode() if mail_body else "",
+        "Attachments": structure.attachments,
+    }
+
+
+def prepare_mail_folder(mail_folder: Path) -> None:
     if mail_folder.exists():
         shutil.rmtree(mail_folder)
 
     mail_folder.mkdir(parents=True)
 
+
+def save_message_parts(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        structure: MessageStructure,
+        mail_folder: Path,
+        extensions: tuple[str, ...],
+) -> list[Path]:
+    """Загружает в mail_folder части письма с указанными расширениями.
+
+    Файлы называются так же, как их называет save_email.
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    # из одноименных частей save_email оставляет последнюю
+    parts = {
+        saved_part.filename: saved_part
+        for saved_part in structure.saved_parts()
+        if saved_part.suffix in extensions
+    }
+    saved = []
+    for saved_part in parts.values():
+        file_path = mail_folder / saved_part.filename
+        if not file_path.exists():
+            file_path.write_bytes(
+                get_message_part(connection, mail_id, saved_part.part),
+            )
+        saved.append(file_path)
+    return saved
+
+
+def save_email(message: email.message.Message, mail_folder: Path) -> None:
+    prepare_mail_folder(mail_folder)
+
     # The code below was copied from example
     counter = 1
     for part in message.walk():
@@ -110,11 +405,9 @@ def save_email(message: email.message.Message, mail_folder: Path) -> None:
                 ext = ".bin"
             filename = "part-%03d%s" % (counter, ext)
         else:
-            bts, encoding = decode_header(filename)[0]
-            if encoding:
-                filename = bts.decode(encoding)
+            filename = decode_filename(filename)
         counter += 1
-        file_path = mail_folder / filename  # type: ignore[operator]
+        file_path = mail_folder / filename
         with file_path.open("wb") as fp:
             # Сломано письмом Кошелева от 3 марта 2020
             # во вложениях неопознанный .txt (читается)
@@ -133,12 +426,36 @@ def save_email(message: email.message.Message, mail_folder: Path) -> None:
                 fp.write(b"\n")
 
 
+def save_email_stream(source: IO[bytes], mail_folder: Path) -> StreamedMail:
+    """То же, что save_email, но не держит письмо в памяти"""
+    prepare_mail_folder(mail_folder)
+    return save_parts(source, mail_folder)
+
+
+def get_streamed_metadata(streamed: StreamedMail) -> dict[str, Any]:
+    text_part = streamed.text_part
+    mail_body = text_part.path.read_bytes() if text_part else b""
+    return {
+        "Date": streamed.headers["Date"],
+        "Message-ID": get_message_id(streamed.headers),
+        "From": decode_mail_field(streamed.headers, "From"),
+        "Subject": decode_mail_field(streamed.headers, "Subject"),
+        "Body": mail_body.decode() if mail_body else "",
+        "Attachments": streamed.attachments,
+    }
+
+
 def mark_as_unread(connection: imaplib.IMAP4_SSL, mail_id: str) -> None:
-    connection.store(mail_id, "-FLAGS", "(\Seen)")  # noqa:W605
+    connection.uid("STORE", mail_id, "-FLAGS", "(\Seen)")  # noqa:W605
+
+
+def mark_as_read(connection: imaplib.IMAP4_SSL, mail_id: str) -> None:
+    connection.uid("STORE", mail_id, "+FLAGS", "(\Seen)")  # noqa:W605
 
 
 def close_connection(connection: imaplib.IMAP4_SSL) -> None:
-    # TODO: добавить retry
-    status, response = connection.logout()
+    # Повторять LOGOUT незачем: соединение закрывается в любом случае
+    with imap_phase("logout", connection.sock.gettimeout()):
+        status, response = connection.logout()
     if status != "BYE":
         raise ConnectionError(f"Error logged out email box. Status: {status}")
@@ -1,16 +1,33 @@
+import email.message
+import imaplib
 import logging
 import shutil
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
 from autopublisher.config import config
-from autopublisher.documents.document import (
-    docx2html,
-    get_text_from_html,
-    unrar,
-    unzip_without_structure,
+from autopublisher.documents.archive import (
+    ARCHIVE_EXTENSIONS,
+    ArchiveError,
+    extract_archive,
+    is_archive,
 )
+from autopublisher.documents.html_text import get_text_from_html
+from autopublisher.documents.news import NewsDocument
 from autopublisher.mail import mail
+from autopublisher.mail.client import CONNECTION_ERRORS, mail_client
+from autopublisher.mail.index import (
+    LOADED,
+    PUBLISHED,
+    attachment_hashes,
+    mail_index,
+)
+from autopublisher.mail.structure import MessageStructure
+from autopublisher.mail.sync import mailbox_sync
 from autopublisher.publish import prepare
 from autopublisher.utils.spelling import spell_line
 
@@ -24,34 +41,41 @@ class CurrentMail:
             mail_id: str,
             mail_folder: Path,
             mail_metadata: dict[str, Any],
+            structure: MessageStructure | None = None,
     ):
         self.mail_id: str = mail_id
         self.folder: Path = mail_folder
         self.metadata: dict[str, Any] = mail_metadata
+        # Структура письма, если вложения еще не загружены (lazy mode)
+        self.structure: MessageStructure | None = structure
         self.text: str = get_text_from_html(mail_metadata["Body"])
         self.about: str = get_mail_about(mail_metadata, self.text)
         self.attachments: list[str] = self.metadata["Attachments"]
         self.title: str | None = None
         self.sentences: list[str] = []
         self.images: list[Path] = []
+        # картинки уже подготовлены заранее (batch mode)
+        self.images_prepared: bool = False
+        # docx новости, разбирается один раз, см. get_document
+        self._document: NewsDocument | None = None
         self._prepare_attachments()
 
     def _prepare_attachments(self) -> None:
-        if len(self.attachments) != 1:
+        if len(self.attachments) != 1 or not is_archive(self.attachments[0]):
             return
 
-        if self.attachments[0].endswith(".zip"):
-            unzip_without_structure(
-                self.folder / self.attachments[0], self.folder,
-            )
-        elif self.attachments[0].endswith(".rar"):
-            self.about += f"\nUnpack {self.attachments[0]} to {self.folder}\n"
-            response = unrar(
+        self.fetch_attachments(*ARCHIVE_EXTENSIONS)
+        self.about += f"\nUnpack {self.attachments[0]} to {self.folder}\n"
+        try:
+            result = extract_archive(
                 self.folder / self.attachments[0], self.folder,
             )
-            self.about += f"{response}\n"
-        else:
+        except ArchiveError as e:
+            log.warning("Can't unpack %s: %s", self.attachments[0], e)
+            self.about += f"Can't unpack: {e}\n"
             return
+        if result.skipped:
+            self.about += f"Skipped: {', '.join(result.skipped)}\n"
         self._add_attachments_to_about()
 
     def _add_attachments_to_about(self) -> None:
@@ -63,6 +87,47 @@ class CurrentMail:
         for i, att in enumerate(attach_files):
             self.about += f"{i+1}) {att}\n"
 
+    def fetch_attachments(self, *extensions: str) -> None:
+        """Загружает вложения с указанными расширениями, если письмо
+        было загружено без них
+        """
+        if self.structure is None:
+            return
+        mail_client.run(
+            mail.save_message_parts,
+            self.mail_id,
+            self.structure,
+            self.folder,
+            extensions,
+        )
+
+    def get_document(self) -> NewsDocument | None:
+        """docx новости, разобранный при первом вызове,
+        или None, если docx в письме нет
+        """
+        if self._document is not None:
+            return self._document
+        self.fetch_attachments(".docx")
+        docxs = prepare.get_files_for_extension(self.folder, ".docx")
+        if not docxs:
+            return None
+        if len(docxs) > 1:
+            raise prepare.PrepareError("Found many docx for one news")
+        self._document = NewsDocument.from_docx(docxs[0])
+        return self._document
+
+    def mark_published(self, url: str) -> None:
+        """Записывает в индекс, что письмо опубликовано по адресу url"""
+        message_id = self.metadata.get("Message-ID")
+        if not mail_index.enabled or not message_id:
+            return
+        mail_index.record(
+            message_id,
+            PUBLISHED,
+            attachments=attachment_hashes(self.folder, self.attachments),
+            url=url,
+        )
+
     def clear(self) -> None:
         if self.folder:
             shutil.rmtree(self.folder)
@@ -74,46 +139,450 @@ class CurrentMail:
 
 
 def load_one_mail_rollback(mail_id: str, mail_folder: Path) -> None:
-    connection = mail.get_connection()
-    mail.mark_as_unread(connection, mail_id)
-    mail.close_connection(connection)
+    mark_mail_as_unread(mail_id)
     shutil.rmtree(mail_folder)
 
 
-def load_most_old_mail_from(
+def get_mail_folder(mail_id: str) -> Path:
+    mail_folder_name = config.tmp_folder_prefix + mail_id
+    return config.tmp_folder / mail_folder_name
+
+
+@dataclass(frozen=True)
+class LoadedMail:
+    mail_id: str
+    folder: Path
+    metadata: dict[str, Any]
+    structure: MessageStructure | None = None
+
+    def to_current_mail(self) -> CurrentMail:
+        return CurrentMail(
+            mail_id=self.mail_id,
+            mail_folder=self.folder,
+            mail_metadata=self.metadata,
+            structure=self.structure,
+        )
+
+
+def _save_message(
+        mail_id: str,
+        message: email.message.Message,
+) -> LoadedMail:
+    mail_folder = get_mail_folder(mail_id)
+    mail_metadata = mail.get_mail_metadata(message)
+    mail.save_email(message, mail_folder)
+    return LoadedMail(mail_id, mail_folder, mail_metadata)
+
+
+def _save_structure(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        structure: MessageStructure,
+) -> LoadedMail:
+    mail_folder = get_mail_folder(mail_id)
+    mail_metadata = mail.get_structure_metadata(connection, mail_id, structure)
+    mail.prepare_mail_folder(mail_folder)
+    return LoadedMail(mail_id, mail_folder, mail_metadata, structure)
+
+
+def _load_mail(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+        *,
+        peek: bool = False,
+) -> LoadedMail:
+    if config.mail_fetch_mode == "lazy":
+        structure = mail.get_message_structure(connection, mail_id, peek=peek)
+        return _save_structure(connection, mail_id, structure)
+
+    if config.mail_fetch_mode == "stream":
+        mail_folder = get_mail_folder(mail_id)
+        with mail.spool_message(connection, mail_id, peek=peek) as spool:
+            streamed = mail.save_email_stream(spool, mail_folder)
+        mail_metadata = mail.get_streamed_metadata(streamed)
+        return LoadedMail(mail_id, mail_folder, mail_metadata)
+
+    message = mail.get_message(connection, mail_id, peek=peek)
+    return _save_message(mail_id, message)
+
+
+def _load_mails(
+        connection: imaplib.IMAP4_SSL,
+        mail_ids: list[str],
+        *,
+        peek: bool = False,
+) -> dict[str, LoadedMail]:
+    """Загружает несколько писем одной командой FETCH.
+
+    В stream режиме письма загружаются по одному, чтобы не держать
+    их в памяти. Письма, которые не удалось сохранить, пропускаются.
+    """
+    if config.mail_fetch_mode == "full":
+        messages = mail.get_messages(connection, mail_ids, peek=peek)
+
+        def load(mail_id: str) -> LoadedMail:
+            return _save_message(mail_id, messages.pop(mail_id))
+    elif config.mail_fetch_mode == "lazy":
+        structures = mail.get_message_structures(
+            connection, mail_ids, peek=peek,
+        )
+
+        def load(mail_id: str) -> LoadedMail:
+            return _save_structure(connection, mail_id, structures[mail_id])
+    else:
+        def load(mail_id: str) -> LoadedMail:
+            return _load_mail(connection, mail_id, peek=peek)
+
+    loaded = {}
+    for mail_id in mail_ids:
+        try:
+            loaded_mail = _skip_published_copy(connection, load(mail_id))
+        except CONNECTION_ERRORS:
+            raise
+        except Exception:
+            log.exception("Unable to load mail %s", mail_id)
+            shutil.rmtree(get_mail_folder(mail_id), ignore_errors=True)
+            continue
+        if loaded_mail is not None:
+            loaded[mail_id] = loaded_mail
+    return loaded
+
+
+def _mark_as_read(connection: imaplib.IMAP4_SSL, mail_id: str) -> None:
+    if mailbox_sync.enabled:
+        mailbox_sync.mark_as_read(mail_id)
+    else:
+        mail.mark_as_read(connection, mail_id)
+
+
+def _skip_published(
+        connection: imaplib.IMAP4_SSL,
+        mail_ids: list[str],
+) -> list[str]:
+    """Убирает из mail_ids письма, которые уже опубликованы,
+    и отмечает их прочитанными. Проверяет только Message-ID,
+    сами письма не загружаются.
+    """
+    if not mail_ids:
+        return mail_ids
+    message_ids = mail.get_message_ids(connection, mail_ids)
+    new_mail_ids = []
+    for mail_id in mail_ids:
+        message_id = message_ids.get(mail_id)
+        indexed = mail_index.get(message_id) if message_id else None
+        if indexed is not None and indexed.published:
+            log.info(
+                "Mail %s is already published at %s, skip it",
+                mail_id, indexed.url,
+            )
+            _mark_as_read(connection, mail_id)
+        else:
+            new_mail_ids.append(mail_id)
+    return new_mail_ids
+
+
+def _skip_published_copy(
+        connection: imaplib.IMAP4_SSL,
+        loaded: LoadedMail,
+) -> LoadedMail | None:
+    """Записывает загруженное письмо в индекс.
+
+    Если такие же вложения уже были опубликованы из другого
+    письма, удаляет письмо из папки, отмечает его прочитанным
+    и возвращает None.
+    """
+    message_id = loaded.metadata["Message-ID"]
+    if not mail_index.enabled or not message_id:
+        return loaded
+    # В lazy mode вложения еще не загружены, их хеши запишем
+    # при публикации
+    hashes = attachment_hashes(loaded.folder, loaded.metadata["Attachments"])
+    published = mail_index.find_published_copy(message_id, hashes.values())
+    if published is not None:
+        log.info(
+            "Mail %s has the same attachments as published mail %s (%s), "
+            "skip it",
+            loaded.mail_id, published.message_id, published.url,
+        )
+        shutil.rmtree(loaded.folder, ignore_errors=True)
+        _mark_as_read(connection, loaded.mail_id)
+        return None
+    mail_index.record(message_id, LOADED, attachments=hashes or None)
+    return loaded
+
+
+def _get_new_mails_from(
+        connection: imaplib.IMAP4_SSL,
         mail_from: str,
-) -> tuple[str | None, Path | None, dict[str, Any] | None]:
-    mail_id, mail_folder, mail_metadata = None, None, None
-    log.info("Connecting to mail server...")
-    connection = mail.get_connection()
-    try:
-        log.info("Success, load new mails...")
+) -> list[str]:
+    if mailbox_sync.enabled:
+        new_mails_ids = mailbox_sync.get_new_mails_from(connection, mail_from)
+    else:
         new_mails_ids = mail.get_new_mails_from(connection, mail_from)
-        if new_mails_ids:
-            mail_id = new_mails_ids[0]
-            mail_folder_name = config.tmp_folder_prefix + mail_id
-            mail_folder = config.tmp_folder / mail_folder_name
-            message = mail.get_message(connection, mail_id)
-            mail_metadata = mail.get_mail_metadata(message)
-            mail.save_email(message, mail_folder)
-    except Exception:
-        if mail_id:
-            mail.mark_as_unread(connection, mail_id)
-        raise
+    if mail_index.enabled:
+        return _skip_published(connection, new_mails_ids)
+    return new_mails_ids
+
+
+def _load_new_mail(
+        connection: imaplib.IMAP4_SSL,
+        mail_id: str,
+) -> LoadedMail | None:
+    loaded = _load_mail(connection, mail_id, peek=True)
+    return _skip_published_copy(connection, loaded)
 
-    finally:
-        mail.close_connection(connection)
 
-    return mail_id, mail_folder, mail_metadata
+def _load_most_old_mail_from(
+        connection: imaplib.IMAP4_SSL,
+        mail_from: str,
+) -> LoadedMail | None:
+    log.info("Load new mails...")
+    new_mails_ids = _get_new_mails_from(connection, mail_from)
+    for mail_id in new_mails_ids:
+        loaded = _load_new_mail(connection, mail_id)
+        if loaded is not None:
+            return loaded
+    return None
+
+
+def load_most_old_mail_from(mail_from: str) -> LoadedMail | None:
+    # Вся проверка почты, с повторами, укладывается в config.mail_deadline
+    with mail_client.deadline():
+        loaded = mail_client.run(_load_most_old_mail_from, mail_from)
+        if loaded is not None:
+            mark_mail_as_read(loaded.mail_id)
+    return loaded
+
+
+def mark_mail_as_read(mail_id: str) -> None:
+    if mailbox_sync.enabled:
+        mailbox_sync.mark_as_read(mail_id)
+    else:
+        mail_client.run(mail.mark_as_read, mail_id)
 
 
 def mark_mail_as_unread(mail_id: str) -> None:
-    connection = mail.get_connection()
+    if not mail_id:
+        return
+    if mailbox_sync.enabled:
+        mailbox_sync.mark_as_unread(mail_id)
+    else:
+        mail_client.run(mail.mark_as_unread, mail_id)
+
+
+class MailPrefetcher:
+    """Письма, заранее загруженные и распакованные в фоне.
+
+    Письма загружаются без флага \\Seen, флаг ставится,
+    когда письмо забирают на обработку. Блокировка держится, только
+    пока меняются словари писем: загрузка идет без нее, и take отдает
+    уже готовое письмо, не дожидаясь загрузки следующих.
+    """
+
+    def __init__(self) -> None:
+        # готовые письма
+        self._mails: dict[str, dict[str, CurrentMail]] = {}
+        # письма, которые сейчас загружаются
+        self._loading: dict[str, set[str]] = {}
+        # письма, которые уже забрали на обработку: их не загружаем
+        # заново, пока они в списке новых
+        self._taken: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self._loaded = threading.Condition(self._lock)
+
+    def prefetch(self, mail_from: str) -> list[str]:
+        """Загружает новые письма от mail_from, возвращает их id"""
+        new_mails_ids = mail_client.run(_get_new_mails_from, mail_from)
+        mail_ids, stale = self._start_loading(mail_from, new_mails_ids)
+        for current_mail in stale:
+            current_mail.clear()
+        if not mail_ids:
+            return []
+        prefetched: list[str] = []
+        try:
+            for mail_id, current_mail in self._load(mail_ids):
+                if self._publish(mail_from, mail_id, current_mail):
+                    prefetched.append(mail_id)
+        finally:
+            with self._loaded:
+                self._loading[mail_from].difference_update(mail_ids)
+                self._loaded.notify_all()
+        return prefetched
+
+    def _start_loading(
+            self, mail_from: str, new_mails_ids: list[str],
+    ) -> tuple[list[str], list[CurrentMail]]:
+        """Отмечает, какие из новых писем загрузить, и забирает
+        письма, которые больше не новые
+        """
+        with self._lock:
+            prefetched = self._mails.setdefault(mail_from, {})
+            loading = self._loading.setdefault(mail_from, set())
+            taken = self._taken.setdefault(mail_from, set())
+            taken.intersection_update(new_mails_ids)
+            stale = []
+            for mail_id in set(prefetched) - set(new_mails_ids):
+                log.info("Mail %s is not new anymore, drop it", mail_id)
+                stale.append(prefetched.pop(mail_id))
+            mail_ids = [
+                mail_id for mail_id in new_mails_ids
+                if mail_id not in prefetched
+                and mail_id not in loading
+                and mail_id not in taken
+            ]
+            loading.update(mail_ids)
+        return mail_ids, stale
+
+    def _publish(
+            self, mail_from: str, mail_id: str, current_mail: CurrentMail,
+    ) -> bool:
+        """Отдает загруженное письмо take, не дожидаясь остальных.
+        False -- если письмо уже забрали, пока оно загружалось
+        """
+        with self._loaded:
+            self._loading[mail_from].discard(mail_id)
+            late = mail_id in self._taken[mail_from]
+            if not late:
+                self._mails[mail_from][mail_id] = current_mail
+            self._loaded.notify_all()
+        if late:
+            current_mail.clear()
+        return not late
+
+    def _load(
+            self, mail_ids: list[str],
+    ) -> Iterator[tuple[str, CurrentMail]]:
+        """Письма по мере того, как они готовы"""
+        if config.mail_batch:
+            yield from self._prepare_batch(mail_ids)
+            return
+        for mail_id in mail_ids:
+            try:
+                current_mail = self._prepare(mail_id)
+            except Exception:
+                log.exception("Unable to prefetch mail %s", mail_id)
+                shutil.rmtree(get_mail_folder(mail_id), ignore_errors=True)
+                continue
+            if current_mail is not None:
+                yield mail_id, current_mail
+
+    @staticmethod
+    def _prepare(mail_id: str) -> CurrentMail | None:
+        log.info("Prefetch mail %s", mail_id)
+        loaded = mail_client.run(_load_new_mail, mail_id)
+        if loaded is None:
+            return None
+        return loaded.to_current_mail()
+
+    @staticmethod
+    def _prepare_batch(
+            mail_ids: list[str],
+    ) -> Iterator[tuple[str, CurrentMail]]:
+        """Загружает письма одной командой FETCH и параллельно
+        готовит из них новости
+        """
+        log.info("Prefetch %d mails in batch", len(mail_ids))
+        loaded = mail_client.run(_load_mails, mail_ids, peek=True)
+        with ThreadPoolExecutor(
+            max_workers=config.mail_batch_workers,
+            thread_name_prefix="mail-batch",
+        ) as executor:
+            futures = {
+                executor.submit(_prepare_batch_mail, loaded_mail): mail_id
+                for mail_id, loaded_mail in loaded.items()
+            }
+            for future in as_completed(futures):
+                mail_id = futures[future]
+                try:
+                    current_mail = future.result()
+                except Exception:
+                    log.exception("Unable to prefetch mail %s", mail_id)
+                    shutil.rmtree(get_mail_folder(mail_id), ignore_errors=True)
+                    continue
+                yield mail_id, current_mail
+
+    def _pop_oldest(self, mail_from: str) -> CurrentMail | None:
+        """Самое старое готовое письмо от mail_from. Если готовых
+        нет, но письма еще загружаются, ждет первое из них,
+        не дольше config.mail_deadline
+        """
+        with self._loaded:
+            self._loaded.wait_for(
+                lambda: self._mails.get(mail_from)
+                or not self._loading.get(mail_from),
+                timeout=config.mail_deadline,
+            )
+            prefetched = self._mails.get(mail_from)
+            if not prefetched:
+                return None
+            mail_id = min(prefetched, key=int)
+            self._taken.setdefault(mail_from, set()).add(mail_id)
+            return prefetched.pop(mail_id)
+
+    def take(self, mail_from: str) -> CurrentMail | None:
+        """Отдает самое старое из готовых новых писем от mail_from.
+
+        Если готовых писем нет, загружает письмо сейчас,
+        в batch mode -- вместе со всеми остальными новыми письмами.
+        """
+        current_mail = self._pop_oldest(mail_from)
+        if current_mail is None and config.mail_batch:
+            self.prefetch(mail_from)
+            current_mail = self._pop_oldest(mail_from)
+        if current_mail is not None:
+            log.info("Take prefetched mail %s", current_mail.mail_id)
+            mark_mail_as_read(current_mail.mail_id)
+            return current_mail
+
+        loaded = load_most_old_mail_from(mail_from)
+        if loaded is None:
+            return None
+        with self._lock:
+            self._taken.setdefault(mail_from, set()).add(loaded.mail_id)
+        return loaded.to_current_mail()
+
+    def pending(self, mail_from: str) -> int:
+        """Сколько загруженных писем от mail_from ждут обработки"""
+        with self._lock:
+            return len(self._mails.get(mail_from, {}))
+
+    def clear(self) -> None:
+        with self._lock:
+            mails = [
+                current_mail
+                for prefetched in self._mails.values()
+                for current_mail in prefetched.values()
+            ]
+            self._mails.clear()
+        for current_mail in mails:
+            current_mail.clear()
+
+
+mail_prefetcher = MailPrefetcher()
+
+
+def _prepare_batch_mail(loaded: LoadedMail) -> CurrentMail:
+    current_mail = loaded.to_current_mail()
+    prepare_news(current_mail)
+    return current_mail
+
+
+def prepare_news(mail: CurrentMail) -> None:
+    """Заранее готовит текст и картинки новости, пока письмо
+    ждет в очереди. Если не получилось, все будет подготовлено
+    как обычно, когда письмо откроют.
+    """
     try:
-        if mail_id:
-            mail.mark_as_unread(connection, mail_id)
-    finally:
-        mail.close_connection(connection)
+        mail.title, mail.sentences = get_text_for_news(mail)
+        mail.images = get_images_for_news(mail)
+    except Exception:
+        log.exception("Unable to prepare news from mail %s", mail.mail_id)
+        mail.title, mail.sentences, mail.images = None, [], []
+        shutil.rmtree(
+            mail.folder / prepare.IMG_FOR_NEWS_FOLDER, ignore_errors=True,
+        )
+        return
+    mail.images_prepared = True
 
 
 def get_mail_about(
@@ -133,20 +602,12 @@ Attachments:
     return about
 
 
-def get_text_from_docx(docx: Path) -> str:
-    html, messages = docx2html(docx)
-    return get_text_from_html(html)
-
-
 def get_text_for_news(mail: CurrentMail) -> tuple[str, list[str]]:
-    docxs = prepare.get_files_for_extension(mail.folder, ".docx")
-    if not docxs:
+    document = mail.get_document()
+    if document is None:
         text = prepare.get_text_from_mail_body(mail.metadata)
-    elif len(docxs) > 1:
-        raise prepare.PrepareError("Found many docx for one news")
     else:
-        docx = docxs[0]
-        text = get_text_from_docx(docx)
+        text = document.text
     # Сломано письмом Кошелева от 29.01.2020
     # Причина: тело письма не содержит заголовка новости,
     # заголовок новости только в заголовке письма.
@@ -168,7 +629,10 @@ def get_text_for_news(mail: CurrentMail) -> tuple[str, list[str]]:
     return title, spelled_sentences
 
 
-def get_images_for_news(mail: CurrentMail) -> list[Path]:
+def get_images_for_news(
+        mail: CurrentMail, progress: prepare.ProgressT | None = None,
+) -> list[Path]:
+    mail.fetch_attachments(".jpg", ".jpeg")
     jpegs = prepare.get_files_for_extension(mail.folder, ".jpg") + \
             prepare.get_files_for_extension(mail.folder, ".jpeg")
     if not jpegs:
@@ -177,5 +641,6 @@ def get_images_for_news(mail: CurrentMail) -> list[Path]:
     jpegs_for_news = prepare.prepare_jpegs_for_news(
         jpegs=jpegs,
         jpegs_folder=mail.folder / prepare.IMG_FOR_NEWS_FOLDER,
+        progress=progress,
     )
     return jpegs_for_news  # noqa:RET504
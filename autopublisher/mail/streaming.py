@@ -0,0 +1,324 @@
+"""Потоковое сохранение частей письма.
+
+Письмо читается из файла построчно (обычно это SpooledTemporaryFile,
+в который письмо было загружено частями), а содержимое каждой части
+декодируется и пишется в свой файл небольшими кусками. Поэтому
+расход памяти не зависит от размера вложений, а имена файлов
+совпадают с теми, что дает mail.save_email.
+"""
+
+import binascii
+import email.parser
+import mimetypes
+import string
+from dataclasses import dataclass
+from email.message import Message
+from pathlib import Path
+from typing import IO, Protocol
+
+from autopublisher.mail.structure import decode_filename
+
+
+# Длинные строки (например, в 8bit и binary частях) читаются кусками
+LINE_LIMIT = 64 * 1024
+
+BASE64_ALPHABET = (string.ascii_letters + string.digits + "+/=").encode()
+BASE64_JUNK = bytes(set(range(256)) - set(BASE64_ALPHABET))
+
+BoundaryT = tuple[bytes, bool]
+
+
+class Decoder(Protocol):
+    def decode(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class IdentityDecoder:
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class Base64Decoder:
+    """Декодирует base64 кусками, кратными 4 символам"""
+
+    def __init__(self) -> None:
+        self._rest = b""
+
+    def decode(self, data: bytes) -> bytes:
+        data = self._rest + data.translate(None, BASE64_JUNK)
+        size = len(data) - len(data) % 4
+        self._rest = data[size:]
+        return self._decode(data[:size])
+
+    def flush(self) -> bytes:
+        rest, self._rest = self._rest, b""
+        if not rest:
+            return b""
+        # как и email, терпим потерянное выравнивание
+        return self._decode(rest + b"=" * (-len(rest) % 4))
+
+    @staticmethod
+    def _decode(data: bytes) -> bytes:
+        try:
+            return binascii.a2b_base64(data)
+        except binascii.Error:
+            return b""
+
+
+class QuotedPrintableDecoder:
+    """Декодирует quoted-printable по целым строкам"""
+
+    def __init__(self) -> None:
+        self._rest = b""
+
+    def decode(self, data: bytes) -> bytes:
+        data = self._rest + data
+        end = data.rfind(b"\n") + 1
+        self._rest = data[end:]
+        return binascii.a2b_qp(data[:end]) if end else b""
+
+    def flush(self) -> bytes:
+        rest, self._rest = self._rest, b""
+        return binascii.a2b_qp(rest)
+
+
+def get_decoder(encoding: str) -> Decoder:
+    encoding = encoding.strip().lower()
+    if encoding == "base64":
+        return Base64Decoder()
+    if encoding == "quoted-printable":
+        return QuotedPrintableDecoder()
+    return IdentityDecoder()
+
+
+def _split_eol(line: bytes) -> tuple[bytes, bytes]:
+    if line.endswith(b"\r\n"):
+        return line[:-2], b"\r\n"
+    if line.endswith(b"\n"):
+        return line[:-1], b"\n"
+    return line, b""
+
+
+def _section(prefix: str, number: int) -> str:
+    return f"{prefix}.{number}" if prefix else str(number)
+
+
+class LineReader:
+    def __init__(self, source: IO[bytes]):
+        self._source = source
+        self._pushed: list[bytes] = []
+        self._line_start = True
+        # начинается ли последняя прочитанная строка с начала строки
+        self.line_start = True
+
+    def readline(self) -> bytes:
+        if self._pushed:
+            self.line_start = True
+            return self._pushed.pop()
+        line = self._source.readline(LINE_LIMIT)
+        self.line_start = self._line_start
+        self._line_start = line.endswith(b"\n")
+        return line
+
+    def unread(self, line: bytes) -> None:
+        """Возвращает строку с разделителем частей обратно"""
+        self._pushed.append(line)
+
+    def boundary(
+            self,
+            line: bytes,
+            boundaries: list[bytes],
+    ) -> BoundaryT | None:
+        """Разделитель частей из boundaries, если line -- разделитель.
+
+        Возвращает (boundary, is_closing).
+        """
+        if not self.line_start or not line.startswith(b"--"):
+            return None
+        stripped = line.rstrip(b" \t\r\n")
+        for boundary in reversed(boundaries):
+            if stripped == b"--" + boundary:
+                return boundary, False
+            if stripped == b"--" + boundary + b"--":
+                return boundary, True
+        return None
+
+
+@dataclass
+class StreamedPart:
+    section: str
+    headers: Message
+    path: Path
+    # message/rfc822: само вложенное письмо разбирается на части
+    is_container: bool = False
+
+
+@dataclass
+class StreamedMail:
+    headers: Message
+    parts: list[StreamedPart]
+
+    @property
+    def attachments(self) -> list[str]:
+        return [
+            decode_filename(filename)
+            for part in self.parts
+            if (filename := part.headers.get_filename())
+        ]
+
+    @property
+    def text_part(self) -> StreamedPart | None:
+        """Часть, из которой get_mail_metadata берет тело письма"""
+        for part in self.parts:
+            if part.section == "1" and not part.is_container:
+                return part
+        return None
+
+
+class MailSaver:
+    """Разбирает MIME письмо из файла и сохраняет каждую часть
+    в mail_folder так же, как это делает mail.save_email.
+    """
+
+    def __init__(self, source: IO[bytes], mail_folder: Path):
+        self._reader = LineReader(source)
+        self._folder = mail_folder
+        self._counter = 0
+        self._parts: list[StreamedPart] = []
+
+    def save(self) -> StreamedMail:
+        headers = self._message([], "")
+        return StreamedMail(headers=headers, parts=self._parts)
+
+    def _message(self, boundaries: list[bytes], prefix: str) -> Message:
+        headers = self._headers(boundaries)
+        is_multipart = headers.get_content_maintype() == "multipart"
+        section = prefix if is_multipart else _section(prefix, 1)
+        self._body(headers, boundaries, section)
+        return headers
+
+    def _headers(
+            self,
+            boundaries: list[bytes],
+            default_type: str = "text/plain",
+    ) -> Message:
+        lines = []
+        while line := self._reader.readline():
+            if self._reader.boundary(line, boundaries):
+                self._reader.unread(line)
+                break
+            if self._reader.line_start and line in (b"\r\n", b"\n"):
+                break
+            lines.append(line)
+        headers = email.parser.BytesHeaderParser().parsebytes(b"".join(lines))
+        headers.set_default_type(default_type)
+        return headers
+
+    def _body(
+            self,
+            headers: Message,
+            boundaries: list[bytes],
+            section: str,
+    ) -> None:
+        if headers.get_content_maintype() == "multipart":
+            self._multipart(headers, boundaries, section)
+        elif headers.get_content_type() == "message/rfc822":
+            self._leaf(headers, boundaries, section, is_container=True)
+            self._message(boundaries, section)
+        else:
+            self._leaf(headers, boundaries, section)
+
+    def _multipart(
+            self,
+            headers: Message,
+            boundaries: list[bytes],
+            section: str,
+    ) -> None:
+        boundary = headers.get_boundary()
+        if not boundary:
+            # email считает такую часть контейнером без частей
+            self._skip(boundaries)
+            return
+
+        default_type = (
+            "message/rfc822" if headers.get_content_subtype() == "digest"
+            else "text/plain"
+        )
+        inner = [*boundaries, boundary.encode()]
+        number = 0
+        match = self._skip(inner)  # preamble
+        while match is not None and match[0] == inner[-1]:
+            self._reader.readline()
+            if match[1]:
+                self._skip(boundaries)  # epilogue
+                return
+            number += 1
+            part_section = _section(section, number)
+            part = self._headers(inner, default_type)
+            self._body(part, inner, part_section)
+            match = self._skip(inner)
+
+    def _skip(self, boundaries: list[bytes]) -> BoundaryT | None:
+        """Пропускает строки до разделителя частей"""
+        while line := self._reader.readline():
+            match = self._reader.boundary(line, boundaries)
+            if match:
+                self._reader.unread(line)
+                return match
+        return None
+
+    def _filename(self, headers: Message) -> str:
+        filename = headers.get_filename()
+        if filename:
+            return decode_filename(filename)
+        ext = mimetypes.guess_extension(headers.get_content_type()) or ".bin"
+        return "part-%03d%s" % (self._counter, ext)  # noqa:UP031
+
+    def _leaf(
+            self,
+            headers: Message,
+            boundaries: list[bytes],
+            section: str,
+            *,
+            is_container: bool = False,
+    ) -> None:
+        self._counter += 1
+        file_path = self._folder / self._filename(headers)
+        self._parts.append(
+            StreamedPart(section, headers, file_path, is_container),
+        )
+        with file_path.open("wb") as fp:
+            if is_container:
+                # save_email пишет пустую строку вместо вложенного письма
+                fp.write(b"\n")
+                return
+
+            decoder = get_decoder(headers.get("content-transfer-encoding", ""))
+            buffer: list[bytes] = []
+            buffered = 0
+            # перевод строки перед разделителем относится к разделителю
+            eol = b""
+            while line := self._reader.readline():
+                if self._reader.boundary(line, boundaries):
+                    self._reader.unread(line)
+                    eol = b""
+                    break
+                data, next_eol = _split_eol(line)
+                buffer += (eol, data)
+                buffered += len(line)
+                eol = next_eol
+                if buffered >= LINE_LIMIT:
+                    fp.write(decoder.decode(b"".join(buffer)))
+                    buffer.clear()
+                    buffered = 0
+            buffer.append(eol)
+            fp.write(decoder.decode(b"".join(buffer)))
+            fp.write(decoder.flush())
+
+
+def save_parts(source: IO[bytes], mail_folder: Path) -> StreamedMail:
+    return MailSaver(source, mail_folder).save()
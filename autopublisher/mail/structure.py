@@ -0,0 +1,274 @@
+"""Разбор ответа FETCH с BODYSTRUCTURE (RFC 3501, раздел 7.4.2).
+
+Позволяет узнать структуру письма и список вложений, не загружая
+само письмо, и затем загружать только нужные части через
+BODY.PEEK[<section>].
+"""
+
+import binascii
+import email.utils
+import itertools
+import mimetypes
+import quopri
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from email.header import decode_header
+from pathlib import Path
+from typing import Any
+
+
+TOKEN_RE = re.compile(
+    rb"\(|\)"
+    rb'|"(?:[^"\\]|\\.)*"'
+    rb"|\{\d+\}$"
+    rb"|[^\s()\[\"]+(?:\[[^\]]*\](?:<\d+>)?)?",
+)
+
+# Элемент разобранного ответа: атом или строка -- str, литерал -- bytes
+ItemT = str | bytes | None | list["ItemT"]
+
+
+def _tokenize(data: bytes) -> Iterator[bytes]:
+    for match in TOKEN_RE.finditer(data):
+        yield match.group()
+
+
+def parse_response(data: list[Any]) -> list[ItemT]:
+    """Собирает ответ imaplib (байты и кортежи с литералами)
+    во вложенные списки.
+    """
+    stack: list[list[ItemT]] = [[]]
+    for item in data:
+        chunk, literal = item if isinstance(item, tuple) else (item, None)
+        for token in _tokenize(chunk):
+            if token == b"(":
+                stack.append([])
+            elif token == b")":
+                inner = stack.pop()
+                stack[-1].append(inner)
+            elif token.startswith(b"{"):
+                stack[-1].append(literal)
+            elif token.startswith(b'"'):
+                value = re.sub(rb"\\(.)", rb"\1", token[1:-1])
+                stack[-1].append(value.decode("utf-8", "replace"))
+            elif token.upper() == b"NIL":
+                stack[-1].append(None)
+            else:
+                stack[-1].append(token.decode())
+    return stack[0]
+
+
+def fetch_items(data: list[Any]) -> dict[str, ItemT]:
+    """Возвращает элементы ответа FETCH в виде словаря:
+    {"BODYSTRUCTURE": [...], "BODY[HEADER]": b"..."}
+    """
+    parsed = parse_response(data)
+    items = next(item for item in parsed if isinstance(item, list))
+    return _items_dict(items)
+
+
+def fetch_responses(data: list[Any]) -> dict[str, dict[str, ItemT]]:
+    """Разбирает ответ UID FETCH сразу для нескольких писем:
+    {"<uid>": {"UID": "<uid>", "BODY[]": b"..."}, ...}
+    """
+    parsed = parse_response(data)
+    responses: dict[str, dict[str, ItemT]] = {}
+    for number, items in itertools.pairwise(parsed):
+        if isinstance(number, str) and isinstance(items, list):
+            fetched = _items_dict(items)
+            uid = str(fetched.get("UID", number))
+            # сервер может прислать FLAGS отдельным ответом
+            responses.setdefault(uid, {}).update(fetched)
+    return responses
+
+
+def _items_dict(items: list[ItemT]) -> dict[str, ItemT]:
+    return {
+        str(key).upper(): value
+        for key, value in zip(items[::2], items[1::2], strict=True)
+    }
+
+
+def decode_filename(filename: str) -> str:
+    bts, encoding = decode_header(filename)[0]
+    if encoding:
+        return bts.decode(encoding)
+    if isinstance(bts, bytes):
+        return bts.decode()
+    return bts
+
+
+def _params(data: ItemT) -> dict[str, str]:
+    if not isinstance(data, list):
+        return {}
+    pairs = [
+        (str(key).lower(), str(value))
+        for key, value in zip(data[::2], data[1::2], strict=True)
+    ]
+    # RFC 2231: filename*=utf-8''%D0%9F...
+    decoded = email.utils.decode_params([("", ""), *pairs])[1:]
+    return {
+        key: email.utils.collapse_rfc2231_value(value)
+        for key, value in decoded
+    }
+
+
+def decode_transfer_encoding(payload: bytes, encoding: str) -> bytes:
+    encoding = encoding.lower()
+    if encoding == "base64":
+        return binascii.a2b_base64(payload)
+    if encoding == "quoted-printable":
+        return quopri.decodestring(payload)
+    return payload
+
+
+@dataclass
+class MailPart:
+    section: str
+    maintype: str
+    subtype: str
+    params: dict[str, str] = field(default_factory=dict)
+    encoding: str = "7bit"
+    size: int = 0
+    disposition: str | None = None
+    disposition_params: dict[str, str] = field(default_factory=dict)
+    children: list["MailPart"] = field(default_factory=list)
+
+    @property
+    def content_type(self) -> str:
+        return f"{self.maintype}/{self.subtype}"
+
+    @property
+    def is_multipart(self) -> bool:
+        return self.maintype == "multipart"
+
+    @property
+    def filename(self) -> str | None:
+        filename = (
+            self.disposition_params.get("filename")
+            or self.params.get("name")
+        )
+        if not filename:
+            return None
+        return decode_filename(filename)
+
+    def walk(self) -> Iterator["MailPart"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+def _section(prefix: str, number: int) -> str:
+    return f"{prefix}.{number}" if prefix else str(number)
+
+
+def parse_bodystructure(data: list[ItemT], prefix: str = "") -> MailPart:
+    if isinstance(data[0], list):
+        children = []
+        index = 0
+        while isinstance(data[index], list):
+            child = data[index]
+            children.append(
+                parse_bodystructure(child, _section(prefix, index + 1))  # type: ignore[arg-type]
+                if isinstance(child[0], list)  # type: ignore[index]
+                else _parse_single(child, _section(prefix, index + 1)),  # type: ignore[arg-type]
+            )
+            index += 1
+        extension = data[index + 1:]
+        disposition = extension[1] if len(extension) > 1 else None
+        return MailPart(
+            section=prefix,
+            maintype="multipart",
+            subtype=str(data[index]).lower(),
+            params=_params(extension[0] if extension else None),
+            children=children,
+            **_disposition(disposition),
+        )
+    return _parse_single(data, _section(prefix, 1))
+
+
+def _disposition(data: ItemT) -> dict[str, Any]:
+    if not isinstance(data, list) or not data:
+        return {}
+    return {
+        "disposition": str(data[0]).lower(),
+        "disposition_params": _params(data[1] if len(data) > 1 else None),
+    }
+
+
+def _parse_single(data: list[ItemT], section: str) -> MailPart:
+    maintype, subtype, params, _id, _description, encoding, size = data[:7]
+    part = MailPart(
+        section=section,
+        maintype=str(maintype).lower(),
+        subtype=str(subtype).lower(),
+        params=_params(params),
+        encoding=str(encoding or "7bit").lower(),
+        size=int(size or 0),  # type: ignore[arg-type]
+    )
+    extension_start = 7
+    if part.maintype == "text":
+        extension_start = 8
+    elif part.content_type == "message/rfc822":
+        body = data[8]
+        # Части вложенного письма нумеруются от номера самой части
+        part.children.append(
+            parse_bodystructure(body, section),  # type: ignore[arg-type]
+        )
+        extension_start = 10
+
+    extension = data[extension_start:]
+    if len(extension) > 1:
+        for key, value in _disposition(extension[1]).items():
+            setattr(part, key, value)
+    return part
+
+
+@dataclass
+class SavedPart:
+    """Часть письма и имя файла, под которым save_email ее сохраняет"""
+    part: MailPart
+    filename: str
+
+    @property
+    def suffix(self) -> str:
+        return Path(self.filename).suffix.lower()
+
+
+@dataclass
+class MessageStructure:
+    headers: bytes
+    body: MailPart
+
+    def leaves(self) -> Iterator[MailPart]:
+        for part in self.body.walk():
+            if not part.is_multipart:
+                yield part
+
+    @property
+    def attachments(self) -> list[str]:
+        return [
+            part.filename for part in self.leaves() if part.filename
+        ]
+
+    @property
+    def text_part(self) -> MailPart | None:
+        """Часть, из которой get_mail_metadata берет тело письма"""
+        body = self.body
+        if body.is_multipart:
+            body = body.children[0]
+        if body.is_multipart:
+            return None
+        return body
+
+    def saved_parts(self) -> list[SavedPart]:
+        """Повторяет имена файлов, которые дает mail.save_email"""
+        saved = []
+        for counter, part in enumerate(self.leaves(), 1):
+            filename = part.filename
+            if not filename:
+                ext = mimetypes.guess_extension(part.content_type) or ".bin"
+                filename = "part-%03d%s" % (counter, ext)  # noqa:UP031
+            saved.append(SavedPart(part=part, filename=filename))
+        return saved
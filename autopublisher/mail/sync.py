@@ -0,0 +1,185 @@
+"""Инкрементальная синхронизация INBOX по UID.
+
+Вместо SEARCH UNSEEN по всему ящику при каждой проверке храним
+в локальном файле UIDVALIDITY, UIDNEXT, HIGHESTMODSEQ (если сервер
+поддерживает CONDSTORE) и для каждого отправителя -- последний
+просмотренный UID и еще не обработанные письма. Сервер спрашиваем
+только о письмах новее последнего UID.
+
+Обработанные письма отмечаются здесь же, а не флагом \\Seen,
+поэтому откат письма не требует обращения к серверу.
+"""
+
+import imaplib
+import json
+import logging
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from autopublisher.config import config
+from autopublisher.mail import mail
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class SenderState:
+    last_uid: int = 0
+    # UID новых писем, которые еще не забрали на обработку
+    pending: list[int] = field(default_factory=list)
+
+
+@dataclass
+class SyncState:
+    uidvalidity: int | None = None
+    uidnext: int = 1
+    messages: int = 0
+    highestmodseq: int | None = None
+    senders: dict[str, SenderState] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "SyncState":
+        if not path.exists():
+            return cls()
+        data = json.loads(path.read_text())
+        senders = {
+            sender: SenderState(**state)
+            for sender, state in data.pop("senders").items()
+        }
+        return cls(senders=senders, **data)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(asdict(self), indent=2))
+        tmp_path.replace(path)
+
+
+class MailboxSync:
+    """Отслеживает новые письма по UID вместо флага \\Seen.
+
+    Включается, если задан config.mail_state_file.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self._path = path
+        self._state: SyncState | None = None
+        # забранные на обработку письма и их отправители, для отката
+        self._taken: dict[int, str] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def path(self) -> Path | None:
+        return self._path or config.mail_state_file
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def state(self) -> SyncState:
+        if self._state is None:
+            if self.path is None:
+                raise RuntimeError("Mail state file is not configured")
+            self._state = SyncState.load(self.path)
+        return self._state
+
+    def save(self) -> None:
+        if self.path is not None:
+            self.state.save(self.path)
+
+    def get_new_mails_from(
+            self,
+            connection: imaplib.IMAP4_SSL,
+            mail_from: str,
+    ) -> list[str]:
+        """UID новых писем от mail_from, как mail.get_new_mails_from"""
+        with self._lock:
+            self._sync(connection, mail_from)
+            pending = self.state.senders[mail_from].pending
+            return [str(uid) for uid in sorted(pending)]
+
+    def _sync(self, connection: imaplib.IMAP4_SSL, mail_from: str) -> None:
+        state = self.state
+        before = asdict(state)
+        condstore = "CONDSTORE" in connection.capabilities
+        status = mail.get_mailbox_status(connection, condstore=condstore)
+        highestmodseq = status.get("HIGHESTMODSEQ")
+
+        if status["UIDVALIDITY"] != state.uidvalidity:
+            if state.uidvalidity is not None:
+                log.warning("UIDVALIDITY is changed, sync INBOX from scratch")
+            state = self._state = SyncState(uidvalidity=status["UIDVALIDITY"])
+            self._taken.clear()
+        else:
+            appended = status["UIDNEXT"] - state.uidnext
+            expunged = status["MESSAGES"] < state.messages + appended
+            modified = condstore and highestmodseq != state.highestmodseq
+            if expunged or modified:
+                self._drop_expunged(connection)
+
+        last_uid = status["UIDNEXT"] - 1
+        sender = state.senders.get(mail_from)
+        if sender is None:
+            # Первая проверка: новыми считаем непрочитанные письма
+            uids = mail.search_uids(connection, f"(UNSEEN FROM {mail_from})")
+            state.senders[mail_from] = SenderState(
+                last_uid=last_uid,
+                pending=[uid for uid in uids if uid <= last_uid],
+            )
+        elif last_uid > sender.last_uid:
+            uids = mail.search_uids(
+                connection, f"(UID {sender.last_uid + 1}:* FROM {mail_from})",
+            )
+            sender.pending += [
+                uid for uid in uids if sender.last_uid < uid <= last_uid
+            ]
+            sender.last_uid = last_uid
+
+        state.uidnext = status["UIDNEXT"]
+        state.messages = status["MESSAGES"]
+        state.highestmodseq = highestmodseq
+        if asdict(state) != before:
+            self.save()
+
+    def _drop_expunged(self, connection: imaplib.IMAP4_SSL) -> None:
+        pending = {
+            uid
+            for sender in self.state.senders.values()
+            for uid in sender.pending
+        }
+        if not pending:
+            return
+        uid_set = ",".join(str(uid) for uid in sorted(pending))
+        existing = set(mail.search_uids(connection, f"(UID {uid_set})"))
+        for mail_from, sender in self.state.senders.items():
+            for uid in set(sender.pending) - existing:
+                log.info("Mail %d from %s is expunged", uid, mail_from)
+            sender.pending = [uid for uid in sender.pending if uid in existing]
+
+    def mark_as_read(self, mail_id: str) -> None:
+        """Отмечает письмо обработанным"""
+        uid = int(mail_id)
+        with self._lock:
+            for mail_from, sender in self.state.senders.items():
+                if uid in sender.pending:
+                    sender.pending.remove(uid)
+                    self._taken[uid] = mail_from
+                    self.save()
+                    return
+
+    def mark_as_unread(self, mail_id: str) -> None:
+        """Возвращает забранное письмо в очередь новых"""
+        uid = int(mail_id)
+        with self._lock:
+            mail_from = self._taken.pop(uid, None)
+            sender = self.state.senders.get(mail_from or "")
+            if sender is None or uid in sender.pending:
+                return
+            sender.pending = sorted([*sender.pending, uid])
+            self.save()
+
+
+mailbox_sync = MailboxSync()
@@ -0,0 +1,108 @@
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from autopublisher.config import config
+from autopublisher.mail import mail
+from autopublisher.mail.idle import idle, supports_idle
+from autopublisher.mail.maildriver import MailPrefetcher, mail_prefetcher
+
+
+if TYPE_CHECKING:
+    import imaplib
+
+
+log = logging.getLogger(__name__)
+
+
+class MailWatcher:
+    """Фоновый поток, который следит за INBOX и заранее
+    загружает новые письма от указанных адресов.
+
+    Для ожидания использует отдельное соединение в режиме IDLE,
+    если сервер его не поддерживает -- опрашивает ящик
+    раз в poll_interval секунд.
+    """
+
+    def __init__(
+            self,
+            *,
+            senders: list[str],
+            prefetcher: MailPrefetcher = mail_prefetcher,
+            idle_timeout: float | None = None,
+            poll_interval: float | None = None,
+    ):
+        self.senders = senders
+        self.prefetcher = prefetcher
+        self.idle_timeout = idle_timeout or config.mail_idle_timeout
+        self.poll_interval = poll_interval or config.mail_poll_interval
+        self._connection: imaplib.IMAP4_SSL | None = None
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="mail-watcher", daemon=True,
+        )
+        self._thread.start()
+        log.info("Mail watcher started for %s", ", ".join(self.senders))
+
+    def stop(self) -> None:
+        self._stopping.set()
+        connection = self._connection
+        if connection is not None:
+            # прерываем ожидание в IDLE
+            try:
+                connection.shutdown()
+            except OSError:
+                log.debug("Error while closing IDLE connection", exc_info=True)
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.prefetcher.clear()
+
+    def prefetch(self) -> None:
+        for sender in self.senders:
+            if self._stopping.is_set():
+                return
+            loaded = self.prefetcher.prefetch(sender)
+            if loaded:
+                log.info(
+                    "Prefetched %d new mails from %s", len(loaded), sender,
+                )
+
+    def wait(self) -> None:
+        """Ждет изменений в ящике или истечения интервала опроса"""
+        connection = self._connection
+        if connection is None:
+            connection = self._connection = mail.get_connection()
+
+        if supports_idle(connection):
+            idle(connection, self.idle_timeout)
+        else:
+            self._stopping.wait(self.poll_interval)
+
+    def _drop_connection(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            connection.shutdown()
+        except OSError:
+            log.debug("Error while closing IDLE connection", exc_info=True)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.prefetch()
+                self.wait()
+            except Exception:
+                if self._stopping.is_set():
+                    break
+                log.exception("Mail watcher error, retry later")
+                self._drop_connection()
+                self._stopping.wait(self.poll_interval)
+        self._drop_connection()
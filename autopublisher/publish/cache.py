@@ -0,0 +1,166 @@
+"""Кеш производных файлов подготовки на диске.
+
+Ключ записи -- sha256 от названия шага, содержимого входных файлов
+и параметров преобразования. Запись -- папка с результатами шага
+(000.png, 001.png, ...). При чтении записи обновляется время
+изменения папки, и когда кеш больше max_size_mb, удаляются записи,
+которые дольше всех не читали (LRU). Повторная подготовка того же
+письма стоит только хеширования входных файлов.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+from autopublisher.config import config
+from autopublisher.utils.file import file_hash
+
+
+log = logging.getLogger(__name__)
+
+
+# меняется, когда меняется результат шагов при тех же параметрах
+CACHE_VERSION = 1
+TMP_ENTRY_PREFIX = "."
+
+TargetsT = Callable[[int], list[Path]]
+
+
+def get_entry_size(entry: Path) -> int:
+    return sum(item.stat().st_size for item in entry.iterdir())
+
+
+class ArtifactCache:
+    """Кеш результатов шагов подготовки, общий для всех писем"""
+
+    def __init__(
+            self,
+            *,
+            folder: Path | None = None,
+            max_size_mb: int | None = None,
+    ):
+        self._folder = folder
+        self._max_size_mb = max_size_mb
+        self._lock = threading.Lock()
+
+    @property
+    def folder(self) -> Path:
+        if self._folder is not None:
+            return self._folder
+        if config.cache_folder is not None:
+            return config.cache_folder
+        return config.tmp_folder / f"{config.tmp_folder_prefix}cache"
+
+    @property
+    def max_size_mb(self) -> int:
+        if self._max_size_mb is not None:
+            return self._max_size_mb
+        return config.cache_size_mb
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size_mb > 0
+
+    def key(self, step: str, sources: Iterable[Path], **params: Any) -> str:
+        data = json.dumps({
+            "version": CACHE_VERSION,
+            "step": step,
+            "sources": [file_hash(source) for source in sources],
+            "params": params,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key: str) -> list[Path] | None:
+        """Файлы записи по порядку или None, если записи нет"""
+        entry = self.folder / key
+        try:
+            os.utime(entry)
+            return sorted(entry.iterdir())
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, files: list[Path]) -> None:
+        """Сохраняет копии files в запись key"""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        tmp_entry = self.folder / f"{TMP_ENTRY_PREFIX}{uuid.uuid4().hex}"
+        tmp_entry.mkdir()
+        for i, file in enumerate(files):
+            shutil.copyfile(file, tmp_entry / f"{i:03d}{file.suffix}")
+        try:
+            tmp_entry.rename(self.folder / key)
+        except OSError:
+            # ту же запись уже сохранил другой поток или процесс
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+
+    def restore(self, key: str, targets: TargetsT) -> list[Path] | None:
+        """Копирует файлы записи в targets(число файлов)"""
+        files = self.get(key)
+        if files is None:
+            return None
+        restored = targets(len(files))
+        try:
+            for file, target in zip(files, restored, strict=True):
+                shutil.copyfile(file, target)
+        except FileNotFoundError:
+            # запись удалили, пока копировали
+            return None
+        return restored
+
+    def restore_file(self, key: str, target: Path) -> bool:
+        """Копирует единственный файл записи в target"""
+        return self.restore(key, lambda _: [target]) is not None
+
+    def call(
+            self,
+            step: str,
+            sources: list[Path],
+            build: Callable[[], list[Path]],
+            targets: TargetsT,
+            **params: Any,
+    ) -> list[Path]:
+        """Результат build() из кеша или новый, сохраненный в кеш.
+        targets(n) -- куда положить n файлов из кеша.
+        """
+        if not self.enabled:
+            return build()
+        key = self.key(step, sources, **params)
+        restored = self.restore(key, targets)
+        if restored is not None:
+            log.info("Cache hit for %s: %s", step, key)
+            return restored
+        files = build()
+        self.put(key, files)
+        return files
+
+    def evict(self) -> None:
+        """Удаляет самые давно прочитанные записи сверх max_size_mb"""
+        max_size = self.max_size_mb * 1024 * 1024
+        with self._lock:
+            entries = []
+            for entry in self.folder.iterdir():
+                if entry.name.startswith(TMP_ENTRY_PREFIX):
+                    continue
+                try:
+                    entries.append(
+                        (entry.stat().st_mtime, get_entry_size(entry), entry),
+                    )
+                except FileNotFoundError:
+                    continue
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= max_size:
+                    break
+                log.info("Evict cache entry %s", entry.name)
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+
+artifact_cache = ArtifactCache()
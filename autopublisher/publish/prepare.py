@@ -1,22 +1,47 @@
 import logging
+import multiprocessing
+import os
 import shutil
-import subprocess
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from typing import Any
 
-from bs4 import BeautifulSoup
 from razdel import sentenize
 
-from autopublisher.config import IMAGEMAGICK_PATH, SOFFICE_PATH, config
+from autopublisher.config import config
 from autopublisher.documents.document import (
+    FORMATTED_FILE,
+    NEW_FONT,
+    OLD_FONT,
     HtmlT,
-    cd,
-    docx2html,
     format_rasp_docx,
-    get_lines_from_html,
     resize_jpeg_on_wide_size,
 )
+from autopublisher.documents.html_text import get_lines_from_html
 from autopublisher.documents.image import Image
+from autopublisher.documents.news import NewsDocument
+from autopublisher.documents.office import (
+    PDF_FILTER,
+    OfficeError,
+    convert_to_pdf,
+    get_pdf_path,
+)
+from autopublisher.documents.pdf import (
+    PdfError,
+    get_page_paths,
+    rasterize_pdf,
+)
+from autopublisher.documents.photo import (
+    MAX_QUALITY,
+    MIN_QUALITY,
+    PhotoEncoding,
+    prepare_photo,
+)
+from autopublisher.documents.png import optimize_pngs
+from autopublisher.publish.cache import ArtifactCache, artifact_cache
 from autopublisher.utils.dt import get_dt_now_string
 from autopublisher.utils.file import (
     format_img_name,
@@ -30,7 +55,8 @@ log = logging.getLogger(__name__)
 
 IMG_FOR_NEWS_FOLDER = "img"
 WIDE_SIDE_IMAGE = 1024
-MAX_NEWS_IMAGE_SIZE_MB = 1.5
+# ширина колонки сайта, в которую рендерится страница расписания
+RASP_IMAGE_WIDTH = 849
 
 HTML_P_START = """<p style="text-align: justify; text-indent: 20px;"><span style="font-size: 14pt; line-height: 115%; font-family: 'Times New Roman', 'serif'; color: #000000;">"""  # noqa:E501
 HTML_P_END = "</span></p>"
@@ -56,6 +82,14 @@ def check_rasp_folder(folder: Path) -> None:
         raise PrepareError("Jpeg or png in rasp mail found!")
 
 
+def render_rasp_images(pdf: Path, target: Path) -> list[Path]:
+    """Страницы расписания, PNG сразу сжимаются, см. documents.png"""
+    images = rasterize_pdf(pdf, target, width=RASP_IMAGE_WIDTH)
+    if target.suffix == ".png" and config.rasp_optimize_png:
+        optimize_pngs(images)
+    return images
+
+
 def rasp(mail_folder: Path) -> list[Path]:
     rasp_img_name = "rasp_" + get_dt_now_string()
     rasp_img_name = f"{rasp_img_name}.{config.rasp_image_format}"
@@ -66,73 +100,207 @@ def rasp(mail_folder: Path) -> list[Path]:
 
     docxs = get_files_for_extension(mail_folder, ".docx")
     docx_name = docxs[0]
-    formatted_docx = format_rasp_docx(docx_name, mail_folder)
+    [formatted_docx] = artifact_cache.call(
+        "format_rasp_docx",
+        [docx_name],
+        lambda: [format_rasp_docx(docx_name, mail_folder)],
+        lambda _: [mail_folder / FORMATTED_FILE],
+        old_font=OLD_FONT,
+        new_font=NEW_FONT,
+    )
 
     if not formatted_docx.exists():
         raise PrepareError(f"Can't find formatted docx: {formatted_docx}")
 
-    with cd(mail_folder):
-        soffice_command = [
-            SOFFICE_PATH,
-            "--headless",
-            "--convert-to", "pdf",
-            str(formatted_docx),
-        ]
-        log.info("RUN: %s", " ".join(soffice_command))
-        subprocess.call(soffice_command)  # noqa:S603
-        pdf_name = mail_folder / f"{formatted_docx.stem}.pdf"
-        if not pdf_name.exists():
-            raise PrepareError(
-                f"Can't find formatted pdf: {formatted_docx}",
-            )
-
-        # previous version of this command:
-        # ["convert", "-density", "300", PDF_NAME, "-quality", "100", JPG_NAME]  # noqa:ERA001,E501
-        imagemagick_command = [
-            IMAGEMAGICK_PATH,
-            "-verbose",
-            "-density", "150",
-            # add "-trim", to remove page fields
-            str(pdf_name),
-            "-quality", "100",
-            "-alpha", "remove",
-            # add "-sharpen", "0x1.0", to more image sharpness
-            "-colorspace", "sRGB",
-            str(rasp_img_path),
-        ]
-        log.info("RUN: %s", " ".join(imagemagick_command))
-        subprocess.call(imagemagick_command)  # noqa:S603
-    rasp_images = get_files_for_extension(
-        mail_folder, config.rasp_image_format,
-    )
-    rasp_images.sort()
-    log.info("Rasp images: %s", ", ".join(map(str, rasp_images)))
+    try:
+        [pdf_name] = artifact_cache.call(
+            "convert_to_pdf",
+            [formatted_docx],
+            lambda: [convert_to_pdf(formatted_docx, mail_folder)],
+            lambda _: [get_pdf_path(formatted_docx, mail_folder)],
+            pdf_filter=PDF_FILTER,
+        )
+    except OfficeError as e:
+        raise PrepareError(
+            f"Can't convert {formatted_docx} to pdf: {e}",
+        ) from e
 
-    if not rasp_images:
-        raise PrepareError("Can't find rasp images")
+    try:
+        rasp_images = artifact_cache.call(
+            "rasterize_pdf",
+            [pdf_name],
+            lambda: render_rasp_images(pdf_name, rasp_img_path),
+            lambda pages: get_page_paths(rasp_img_path, pages),
+            width=RASP_IMAGE_WIDTH,
+            image_format=config.rasp_image_format,
+            optimize_png=config.rasp_optimize_png,
+        )
+    except PdfError as e:
+        raise PrepareError(f"Can't render rasp images: {e}") from e
+    log.info("Rasp images: %s", ", ".join(map(str, rasp_images)))
 
     return rasp_images
 
 
+ProgressT = Callable[[int, int], None]
+
+
+class ImagePool:
+    """Пул процессов для подготовки фотографий: ресайз упирается
+    в процессор, и потоки из-за GIL его не ускоряют.
+
+    Процессы запускаются при первой подготовке и живут до close().
+    """
+
+    def __init__(self, *, max_workers: int | None = None):
+        self._max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self) -> int:
+        return (
+            self._max_workers or config.image_workers or os.cpu_count() or 1
+        )
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # бот многопоточный, fork из него небезопасен
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+image_pool = ImagePool()
+
+
+def get_news_photo_encoding() -> PhotoEncoding:
+    # процессы пула config не видят, поэтому настройки передаются им
+    # в PhotoEncoding
+    return PhotoEncoding(
+        wide_side=WIDE_SIDE_IMAGE,
+        budget=config.news_image_budget_kb * 1024,
+        format=config.news_image_format,
+    )
+
+
+def iter_prepare_jpegs(
+        jpegs: list[tuple[Path, Path]],
+        pool: ImagePool,
+        encoding: PhotoEncoding,
+) -> Iterator[Path]:
+    """Готовит пары (фотография, результат) и отдает результаты
+    по мере готовности
+    """
+    if len(jpegs) <= 1 or pool.max_workers == 1:
+        for jpeg, new_jpeg in jpegs:
+            yield prepare_photo(jpeg, new_jpeg, encoding)
+        return
+
+    log.info(
+        "Prepare %d images in %d processes", len(jpegs), pool.max_workers,
+    )
+    futures: list[Future[Path]] = [
+        pool.executor.submit(prepare_photo, jpeg, new_jpeg, encoding)
+        for jpeg, new_jpeg in jpegs
+    ]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    except BrokenProcessPool:
+        # процесс пула умер, следующая подготовка запустит новые
+        pool.close()
+        raise
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def get_news_jpeg_key(
+        jpeg: Path, encoding: PhotoEncoding, cache: ArtifactCache,
+) -> str | None:
+    if not cache.enabled:
+        return None
+    return cache.key(
+        "prepare_photo",
+        [jpeg],
+        wide_side=encoding.wide_side,
+        budget=encoding.budget,
+        format=encoding.format,
+        min_quality=MIN_QUALITY,
+        max_quality=MAX_QUALITY,
+    )
+
+
+def get_news_photo_names(jpegs: list[Path], suffix: str) -> list[str]:
+    """Имена фотографий для новости. Разные файлы могут получить одно
+    имя (Фото 1.jpg и Фото 1.jpeg -> foto_1.jpg), тогда к повторам
+    добавляется номер, иначе одна фотография затрет другую
+    """
+    names: list[str] = []
+    used: set[str] = set()
+    for jpeg in jpegs:
+        name = format_img_name(jpeg.stem + suffix)
+        index = 1
+        while name in used:
+            index += 1
+            name = format_img_name(f"{jpeg.stem}_{index}{suffix}")
+        used.add(name)
+        names.append(name)
+    return names
+
+
 def prepare_jpegs_for_news(
-        *, jpegs: list[Path], jpegs_folder: Path,
+        *,
+        jpegs: list[Path],
+        jpegs_folder: Path,
+        progress: ProgressT | None = None,
+        pool: ImagePool = image_pool,
+        cache: ArtifactCache = artifact_cache,
 ) -> list[Path]:
-    """jpegs: full-path jpegs"""
-    jpegs_for_news = []
+    """jpegs: full-path jpegs.
+    Фотографии берутся из cache или готовятся параллельно в pool,
+    результат в порядке jpegs. progress(done, total) вызывается
+    после каждой готовой фотографии.
+    """
+    encoding = get_news_photo_encoding()
     jpegs_folder.mkdir(parents=True)
-    formatted_names_jpegs = {
-        jpeg: format_img_name(jpeg.name) for jpeg in jpegs
-    }
-    for jpeg in jpegs:
-        size = get_file_size_mb(jpeg)
-        new_jpeg = jpegs_folder / formatted_names_jpegs[jpeg]
-        if size > MAX_NEWS_IMAGE_SIZE_MB:
-            resize_jpeg_on_wide_size(
-                jpeg, new_jpeg, WIDE_SIDE_IMAGE,
-            )
-        else:
-            shutil.copyfile(jpeg, new_jpeg)
-        jpegs_for_news.append(new_jpeg)
+    jpegs_for_news = [
+        jpegs_folder / name
+        for name in get_news_photo_names(jpegs, encoding.suffix)
+    ]
+    keys: dict[Path, str | None] = {}
+    missed = []
+    for jpeg, new_jpeg in zip(jpegs, jpegs_for_news, strict=True):
+        key = keys[new_jpeg] = get_news_jpeg_key(jpeg, encoding, cache)
+        if key is None or not cache.restore_file(key, new_jpeg):
+            missed.append((jpeg, new_jpeg))
+
+    total = len(jpegs)
+    restored = total - len(missed)
+    if restored:
+        log.info("%d of %d images restored from cache", restored, total)
+    if progress is not None and restored:
+        progress(restored, total)
+    for done, new_jpeg in enumerate(
+            iter_prepare_jpegs(missed, pool, encoding), restored + 1,
+    ):
+        key = keys[new_jpeg]
+        if key is not None:
+            cache.put(key, [new_jpeg])
+        if progress is not None:
+            progress(done, total)
     return jpegs_for_news
 
 
@@ -153,9 +321,7 @@ def prepare_html_for_news(mail_folder: Path) -> tuple[str, HtmlT]:
         raise PrepareError("Can't search news text in mail body")
     if len(docxs) > 1:
         raise PrepareError("Found many docx for one news")
-    docx = docxs[0]
-    title, html = get_html_news_from_docx(docx)
-    return title, html
+    return get_html_news(NewsDocument.from_docx(docxs[0]))
 
 
 def prepare_text(text: str) -> tuple[str, list[str]]:
@@ -180,17 +346,14 @@ def html_from_sentences(sentences: list[str]) -> HtmlT:
     return "\n".join(paragraphs)
 
 
-def get_html_news_from_docx(docx: Path) -> tuple[str, HtmlT]:
-    html, messages = docx2html(docx)
-    soup = BeautifulSoup(html, "html.parser")
+def get_html_news(document: NewsDocument) -> tuple[str, HtmlT]:
     paragraphs: list[str] = []
     title = None
-    for p in soup.find_all("p"):
-        string_p = str(p)
+    for p in document.paragraphs:
         if not title:
             title = p.text
             continue
-        string_p = string_p.replace("<p>", HTML_P_START)
+        string_p = p.html.replace("<p>", HTML_P_START)
         string_p = string_p.replace("</p>", HTML_P_END)
         paragraphs.append(string_p)
     news_html = "\n".join(paragraphs)
@@ -12,7 +12,7 @@ from selenium.webdriver.support import expected_conditions as EC  # noqa:N812
 from selenium.webdriver.support.ui import WebDriverWait
 
 from autopublisher.config import FIREFOX_BINARY_PATH, config
-from autopublisher.documents.document import HtmlT
+from autopublisher.documents.document import HtmlT, get_image_size
 from autopublisher.documents.image import Image
 
 
@@ -29,7 +29,7 @@ JPEG_TEMPLATE = """<!-- MAINPAGE JPEG -->
 
 """
 
-RASP_HTML_TEMPLATE = """<p><img src="/sites/default/files/{}" alt="" width="849" height="1200" /></p>"""  # noqa:E501
+RASP_HTML_TEMPLATE = """<p><img src="/sites/default/files/{name}" alt="" width="{width}" height="{height}" /></p>"""  # noqa:E501
 
 
 class title_not_contains:  # noqa:N801
@@ -118,10 +118,13 @@ def load_jpegs_to_site(*, driver: WebDriver, jpegs: list[Path]) -> None:
 
 
 def create_rasp_html(jpegs: list[Path]) -> HtmlT:
-    html_items = [
-        RASP_HTML_TEMPLATE.format(jpeg.name)
-        for jpeg in jpegs
-    ]
+    # после обрезки полей размер у каждой страницы свой
+    html_items = []
+    for jpeg in jpegs:
+        width, height = get_image_size(jpeg)
+        html_items.append(RASP_HTML_TEMPLATE.format(
+            name=jpeg.name, width=width, height=height,
+        ))
     return "".join(html_items)
 
 
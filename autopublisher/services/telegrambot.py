@@ -5,12 +5,17 @@ from telegram import Update
 from telegram.ext import Application
 from yarl import URL
 
+from autopublisher.documents.office import OfficeService, office_service
 from autopublisher.handlers.any_handler import any_handler
 from autopublisher.handlers.echo import echo_handler
 from autopublisher.handlers.error import error_handler
 from autopublisher.handlers.imagebot import image_handler
 from autopublisher.handlers.mailbot import mail_handler
 from autopublisher.handlers.start import start_handler
+from autopublisher.mail.aio import async_mail_client
+from autopublisher.mail.client import mail_client
+from autopublisher.mail.watcher import MailWatcher
+from autopublisher.publish.prepare import image_pool
 
 
 log = logging.getLogger(__name__)
@@ -72,10 +77,44 @@ class TelegramBot:
         log.info("SERVER MODE %s", config.server_mode)
         self.token = token
         self.proxy = proxy
+        self.mail_watcher: MailWatcher | None = None
+        if config.mail_watch:
+            self.mail_watcher = MailWatcher(
+                senders=[config.mail_from, config.alternate_mail],
+            )
+        self.office_service: OfficeService | None = None
+        if config.office_listener:
+            self.office_service = office_service
+
+    async def on_startup(
+            self,
+            application: Application,  # type: ignore[type-arg]  # noqa:ARG002
+    ) -> None:
+        if self.office_service is not None:
+            self.office_service.start()
+        if self.mail_watcher is not None:
+            self.mail_watcher.start()
+
+    async def on_shutdown(
+            self,
+            application: Application,  # type: ignore[type-arg]  # noqa:ARG002
+    ) -> None:
+        if self.mail_watcher is not None:
+            self.mail_watcher.stop()
+        async_mail_client.close()
+        mail_client.close()
+        image_pool.close()
+        if self.office_service is not None:
+            self.office_service.stop()
 
     def start(self) -> None:
         # Create the Application and pass it your bot's token.
-        application = Application.builder().token(self.token)
+        application = (
+            Application.builder()
+            .token(self.token)
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+        )
         if self.proxy.full_url:
             application = application.proxy(str(self.proxy.full_url))
         application = application.build()
@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 
 from autopublisher.utils.transliterate import (
@@ -6,6 +7,9 @@ from autopublisher.utils.transliterate import (
 )
 
 
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
 def format_img_name(jpeg_name: str) -> str:
     jpeg_name = transliterate(jpeg_name)
     jpeg_name = replace_non_alphabetic_symbols(jpeg_name)
@@ -33,3 +37,11 @@ def get_files_for_extension(
             items.append(item)
 
     return items
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,189 @@
+"""Запуск внешних программ (soffice, convert, unrar).
+
+Все запуски идут через tool_runner: у каждой программы свое число
+одновременных процессов (config.tool_workers), процесс работает
+в отдельной группе и по таймауту останавливается вместе с дочерними,
+stdout и stderr читаются не больше OUTPUT_LIMIT байт,
+время каждого запуска пишется в лог.
+Запуск блокирующий: обработчики бота вызывают подготовку
+документов в потоке, а не в event loop.
+"""
+
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO
+
+from autopublisher.config import config
+
+
+log = logging.getLogger(__name__)
+
+
+STOP_TIMEOUT = 10.0
+OUTPUT_LIMIT = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+class ProcessError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ToolResult:
+    name: str
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    elapsed: float
+    # вывод был длиннее OUTPUT_LIMIT и обрезан
+    truncated: bool
+
+
+def terminate(
+        process: subprocess.Popen[bytes], timeout: float = STOP_TIMEOUT,
+) -> None:
+    """Останавливает группу процессов process: soffice и convert
+    запускают дочерние процессы (soffice.bin, gs)
+    """
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        log.warning(
+            "Process %d did not stop in %.1fs, killing", process.pid, timeout,
+        )
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        process.wait()
+
+
+def read_output(
+        streams: list[IO[bytes]], deadline: float, limit: int,
+) -> tuple[list[bytes], bool]:
+    """Читает streams до конца или до deadline (time.monotonic),
+    сохраняя из каждого не больше limit байт: остальное читается
+    и отбрасывается, чтобы процесс не встал на полном pipe
+    """
+    buffers = {stream: bytearray() for stream in streams}
+    truncated = False
+    with selectors.DefaultSelector() as selector:
+        for stream in streams:
+            selector.register(stream, selectors.EVENT_READ)
+        while selector.get_map():
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise TimeoutError
+            for key, _ in selector.select(timeout):
+                chunk = os.read(key.fd, READ_SIZE)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                buffer = buffers[key.fileobj]  # type: ignore[index]
+                truncated |= len(buffer) + len(chunk) > limit
+                buffer += chunk[:limit - len(buffer)]
+    return [bytes(buffers[stream]) for stream in streams], truncated
+
+
+class ToolRunner:
+    def __init__(self, *, workers: int | None = None):
+        self._workers = workers
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self) -> int:
+        return self._workers or config.tool_workers or os.cpu_count() or 1
+
+    def slots(self, name: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if name not in self._slots:
+                self._slots[name] = threading.BoundedSemaphore(self.workers)
+            return self._slots[name]
+
+    @contextmanager
+    def slot(self, command: list[str]) -> Iterator[None]:
+        """Ждет своей очереди среди запусков той же программы"""
+        with self.slots(Path(command[0]).name):
+            yield
+
+    def run(
+            self,
+            command: list[str],
+            *,
+            timeout: float,
+            limit: int = OUTPUT_LIMIT,
+    ) -> ToolResult:
+        """Запускает command, ждет завершения не дольше timeout секунд,
+        ProcessError -- если не дождались или код возврата не 0
+        """
+        name = Path(command[0]).name
+        with self.slot(command):
+            log.info("RUN: %s", " ".join(command))
+            result = self._run(command, timeout, limit)
+        log.info(
+            "%s exited with code %d in %.2fs",
+            name, result.returncode, result.elapsed,
+        )
+        if result.truncated:
+            log.warning("%s output is truncated to %d bytes", name, limit)
+        if result.returncode:
+            raise ProcessError(
+                f"{name} exited with code {result.returncode}: "
+                f"{result.stderr.decode(errors='replace').strip()}",
+            )
+        return result
+
+    def _run(
+            self, command: list[str], timeout: float, limit: int,
+    ) -> ToolResult:
+        name = Path(command[0]).name
+        started = time.monotonic()
+        deadline = started + timeout
+        process = subprocess.Popen(  # noqa:S603
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        assert process.stdout is not None  # noqa:S101
+        assert process.stderr is not None  # noqa:S101
+        try:
+            (stdout, stderr), truncated = read_output(
+                [process.stdout, process.stderr], deadline, limit,
+            )
+            process.wait(max(deadline - time.monotonic(), 0))
+        except (TimeoutError, subprocess.TimeoutExpired) as e:
+            raise ProcessError(f"{name} timed out after {timeout:.1f}s") from e
+        finally:
+            terminate(process)
+            process.stdout.close()
+            process.stderr.close()
+        return ToolResult(
+            name=name,
+            returncode=process.returncode,
+            stdout=stdout,
+            stderr=stderr,
+            elapsed=time.monotonic() - started,
+            truncated=truncated,
+        )
+
+
+tool_runner = ToolRunner()
+
+
+def run(command: list[str], *, timeout: float) -> bytes:
+    """Запускает command через tool_runner и возвращает stdout"""
+    return tool_runner.run(command, timeout=timeout).stdout
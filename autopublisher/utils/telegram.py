@@ -1,7 +1,10 @@
-from collections.abc import Callable, Coroutine
+import asyncio
+from collections.abc import Awaitable, Callable, Coroutine
 from functools import wraps
+from typing import TypeVar
 
 from telegram import Update
+from telegram.constants import ChatAction
 from telegram.ext import ContextTypes
 
 from autopublisher.config import config
@@ -9,6 +12,11 @@ from autopublisher.config import config
 
 BotHandlerT = Callable[..., Coroutine]  # type: ignore[type-arg]
 
+T = TypeVar("T")
+
+# Telegram показывает действие в чате около 5 секунд
+CHAT_ACTION_INTERVAL = 4.0
+
 
 def owner_only(bot_handler: BotHandlerT) -> BotHandlerT:
 
@@ -26,3 +34,53 @@ def owner_only(bot_handler: BotHandlerT) -> BotHandlerT:
         return await bot_handler(update, context)
 
     return wrapper
+
+
+class Progress:
+    """Текст для wait_with_progress со счетчиком готовых частей
+    долгой работы. Рабочий поток вызывает progress(done, total).
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.done = 0
+        self.total = 0
+
+    def __call__(self, done: int, total: int) -> None:
+        self.done, self.total = done, total
+
+    def __str__(self) -> str:
+        if not self.total:
+            return self.text
+        return f"{self.text}: готово {self.done} из {self.total}"
+
+
+async def wait_with_progress(
+        awaitable: Awaitable[T],
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        *,
+        text: str | Progress | None = None,
+        interval: float = 30.0,
+) -> T:
+    """Ждет awaitable и показывает, что бот работает: действие
+    "печатает" в чате и, если ждать долго, раз в interval секунд
+    сообщение text с прошедшим временем.
+    """
+    chat_id = update.effective_chat.id
+    task = asyncio.ensure_future(awaitable)
+    loop = asyncio.get_running_loop()
+    started = last_report = loop.time()
+    while True:
+        await context.bot.send_chat_action(
+            chat_id=chat_id, action=ChatAction.TYPING,
+        )
+        done, _ = await asyncio.wait({task}, timeout=CHAT_ACTION_INTERVAL)
+        if done:
+            return task.result()
+        now = loop.time()
+        if text and now - last_report >= interval:
+            last_report = now
+            await context.bot.send_message(
+                chat_id=chat_id, text=f"{text} ({now - started:.0f} с)",
+            )
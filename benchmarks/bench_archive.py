@@ -0,0 +1,113 @@
+"""Распаковка .zip из вложения: весь архив против extract_archive.
+
+unzip -- как раньше делал unzip_without_structure: все файлы архива
+без проверок; extract_archive -- documents.archive.extract_archive:
+только .docx и картинки, с лимитами. Архив -- новость с фотографиями
+и большими сканами (.tif), которые публикации не нужны. Печатаем время
+и сколько записано на диск, затем время, за которое extract_archive
+отказывается распаковывать zip-бомбу.
+
+Запуск: `python -m benchmarks.bench_archive --scans 4 --scan-mb 64`
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from autopublisher.documents.archive import ArchiveError, extract_archive
+from benchmarks.samples import make_jpeg, make_news_docx, make_zip
+
+
+MB = 1024 * 1024
+BOMB_MB = 512
+
+
+def unzip(zip_name: Path, folder: Path) -> None:
+    with zipfile.ZipFile(zip_name, "r") as zip_ref:
+        for member in zip_ref.namelist():
+            filename = Path(member).name
+            if not filename:
+                continue
+            with (
+                zip_ref.open(member) as source,
+                (folder / filename).open("wb") as target,
+            ):
+                shutil.copyfileobj(source, target)
+
+
+def make_news_zip(scans: int, scan_mb: int) -> bytes:
+    # сканы почти не сжимаются, как настоящие фотографии
+    files = {
+        "news/Новость.docx": make_news_docx("Новость"),
+        **{
+            f"news/IMG_{i}.jpg": make_jpeg(1600, 1200, seed=i)
+            for i in range(4)
+        },
+        **{
+            f"scans/scan_{i}.tif": random.Random(i).randbytes(scan_mb * MB)
+            for i in range(scans)
+        },
+    }
+    return make_zip(files)
+
+
+def make_bomb(bomb: Path, size_mb: int) -> None:
+    with (
+        zipfile.ZipFile(bomb, "w", zipfile.ZIP_DEFLATED) as archive,
+        archive.open("photo.jpg", "w") as target,
+    ):
+        chunk = bytes(MB)
+        for _ in range(size_mb):
+            target.write(chunk)
+
+
+def folder_size(folder: Path) -> int:
+    return sum(f.stat().st_size for f in folder.iterdir())
+
+
+def measure(name: str, archive: Path, tmp: Path) -> None:
+    folder = tmp / name
+    folder.mkdir()
+    started = time.perf_counter()
+    if name == "unzip":
+        unzip(archive, folder)
+    else:
+        extract_archive(archive, folder)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<16} {elapsed * 1000:7.0f}ms, "
+        f"written {folder_size(folder) / MB:7.1f}MB",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scans", type=int, default=4)
+    parser.add_argument("--scan-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_name:
+        tmp = Path(tmp_name)
+        archive = tmp / "news.zip"
+        archive.write_bytes(make_news_zip(args.scans, args.scan_mb))
+        print(f"archive {archive.stat().st_size / MB:.1f}MB")
+        measure("unzip", archive, tmp)
+        measure("extract_archive", archive, tmp)
+
+        bomb = tmp / "bomb.zip"
+        make_bomb(bomb, BOMB_MB)
+        started = time.perf_counter()
+        try:
+            extract_archive(bomb, tmp)
+        except ArchiveError as e:
+            elapsed = time.perf_counter() - started
+            print(f"{BOMB_MB}MB zip bomb rejected in {elapsed * 1000:.1f}ms")
+            print(e)
+
+
+if __name__ == "__main__":
+    main()
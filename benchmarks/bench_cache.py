@@ -0,0 +1,99 @@
+"""Повторная подготовка того же письма с кешем производных файлов.
+
+cold -- подготовка с пустым publish.cache.ArtifactCache, warm --
+повтор с тем же содержимым в новой папке письма (как после отката
+или дубля письма): из кеша берутся отформатированный docx, PDF,
+картинки расписания и уменьшенные фотографии.
+
+Фотографии для новости проверяются всегда. Расписание -- если
+установлены LibreOffice (--soffice) и ImageMagick (--convert).
+
+Запуск: `python -m benchmarks.bench_cache --photos 8`
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from autopublisher.config import IMAGEMAGICK_PATH, SOFFICE_PATH
+from autopublisher.documents import office
+from autopublisher.documents import pdf as pdf_module
+from autopublisher.publish import prepare
+from autopublisher.publish.cache import ArtifactCache
+from benchmarks.samples import make_jpeg, make_rasp_docx
+
+
+def make_mail(folder: Path, files: dict[str, bytes]) -> Path:
+    folder.mkdir()
+    for name, content in files.items():
+        (folder / name).write_bytes(content)
+    return folder
+
+
+def measure(name: str, prepare_mail: Callable[[Path], None], root: Path) -> None:
+    timings = []
+    for attempt in ("cold", "warm"):
+        mail_folder = root / f"{name}_{attempt}"
+        started = time.perf_counter()
+        prepare_mail(mail_folder)
+        timings.append(time.perf_counter() - started)
+        shutil.rmtree(mail_folder)
+    cold, warm = timings
+    print(
+        f"{name:<6} cold {cold * 1000:7.0f}ms, warm {warm * 1000:7.0f}ms, "
+        f"speedup {cold / warm:5.1f}x",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=8)
+    parser.add_argument("--size", type=int, nargs=2, default=[4000, 3000])
+    parser.add_argument("--rows", type=int, default=60)
+    parser.add_argument("--soffice", default=SOFFICE_PATH)
+    parser.add_argument("--convert", default=IMAGEMAGICK_PATH)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        cache = ArtifactCache(folder=root / "cache", max_size_mb=1024)
+        pool = prepare.ImagePool(max_workers=1)
+        photos = {
+            f"IMG_{i:04d}.jpg": make_jpeg(*args.size, seed=i)
+            for i in range(args.photos)
+        }
+
+        def prepare_news(mail_folder: Path) -> None:
+            make_mail(mail_folder, photos)
+            prepare.prepare_jpegs_for_news(
+                jpegs=sorted(mail_folder.iterdir()),
+                jpegs_folder=mail_folder / prepare.IMG_FOR_NEWS_FOLDER,
+                pool=pool,
+                cache=cache,
+            )
+
+        measure("news", prepare_news, root)
+
+        if not Path(args.soffice).exists():
+            print(f"LibreOffice is not found: {args.soffice}")
+            return
+        if not Path(args.convert).exists():
+            print(f"ImageMagick is not found: {args.convert}")
+            return
+        office.SOFFICE_PATH = args.soffice
+        pdf_module.IMAGEMAGICK_PATH = args.convert
+        prepare.artifact_cache = cache
+        docx = make_rasp_docx(args.rows)
+
+        def prepare_rasp(mail_folder: Path) -> None:
+            make_mail(mail_folder, {"Расписание.docx": docx})
+            prepare.rasp(mail_folder)
+
+        measure("rasp", prepare_rasp, root)
+
+
+if __name__ == "__main__":
+    main()
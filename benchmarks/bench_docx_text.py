@@ -0,0 +1,69 @@
+"""Текст новости из docx: mammoth + html2text против прямого разбора.
+
+Прежний путь -- docx2html (mammoth) и html2text
+(html_text.html2text_lines), новый -- documents.docx_text.read_docx_text, который
+читает document.xml потоком. На наборе новостей со случайным
+оформлением печатаем время на документ для обоих путей.
+Что строки и текст новости совпадают, проверяют тесты
+tests/test_docx_text.py на документах из Word и LibreOffice.
+
+Запуск: `python -m benchmarks.bench_docx_text --docs 200 --paragraphs 40`
+"""
+
+import argparse
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from autopublisher.documents.document import docx2html
+from autopublisher.documents.docx_text import read_docx_text
+from autopublisher.documents.html_text import html2text_lines
+from benchmarks.samples import make_formatted_news_docx, make_news_docx
+
+
+def mammoth_lines(docx: Path) -> list[str]:
+    html, _ = docx2html(docx)
+    return html2text_lines(html)
+
+
+def direct_lines(docx: Path) -> list[str]:
+    return read_docx_text(docx).lines
+
+
+def measure(
+        name: str, get_lines: Callable[[Path], list[str]], docxs: list[Path],
+) -> float:
+    started = time.perf_counter()
+    for docx in docxs:
+        get_lines(docx)
+    elapsed = (time.perf_counter() - started) / len(docxs)
+    print(f"{name:<8} {elapsed * 1000:7.2f}ms per document")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        docxs = []
+        for seed in range(args.docs):
+            docx = Path(tmp) / f"news_{seed}.docx"
+            docx.write_bytes(
+                make_formatted_news_docx(args.paragraphs, seed=seed),
+            )
+            docxs.append(docx)
+        plain = Path(tmp) / "plain.docx"
+        plain.write_bytes(make_news_docx("Новость", args.paragraphs))
+        docxs.append(plain)
+
+        old = measure("mammoth", mammoth_lines, docxs)
+        new = measure("direct", direct_lines, docxs)
+        print(f"speedup {old / new:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Преобразование document.xml большого расписания.
+
+Сравниваем прежние два прохода (замена шрифта во всей строке XML,
+затем разбор ElementTree и cantSplit только в первой таблице)
+с потоковым documents.docx_xml.transform_docx_xml, который
+за один проход меняет шрифт в w:rFonts и ставит cantSplit
+во всех строках всех таблиц, включая вложенные.
+Печатаем время, пиковую память (tracemalloc) и сколько строк
+таблиц получили cantSplit.
+
+Запуск: `python -m benchmarks.bench_docx_xml --tables 20 --rows 100`
+"""
+
+import argparse
+import io
+import re
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+import zipfile
+from collections.abc import Callable
+
+from autopublisher.documents.document import (
+    DOCUMENT_XML,
+    NEW_FONT,
+    OLD_FONT,
+    format_rasp_xml,
+)
+from benchmarks.samples import make_rasp_docx
+
+
+def format_two_passes(source: io.BytesIO, target: io.BytesIO) -> None:
+    """Прежняя реализация, без записи на диск"""
+    xml = source.read().replace(OLD_FONT.encode(), NEW_FONT.encode())
+    root = ET.fromstring(xml)
+    namespace = re.findall(r"\{(.*?)\}", root.tag)[0]
+    ns = {"w": namespace}
+    table = root.find("w:body/w:tbl", ns)
+    for tr in table.findall("w:tr", ns):  # type: ignore[union-attr]
+        trpr = tr.find("w:trPr", ns)
+        if trpr is None:
+            trpr = ET.SubElement(tr, f"{{{namespace}}}trPr")
+        if trpr.find("w:cantSplit", ns) is None:
+            ET.SubElement(
+                trpr, f"{{{namespace}}}cantSplit",
+                {f"{{{namespace}}}val": "true"},
+            )
+    target.write(ET.tostring(root))
+
+
+def measure(
+        name: str,
+        func: Callable[[io.BytesIO, io.BytesIO], None],
+        xml: bytes,
+        repeat: int,
+) -> None:
+    timings = []
+    for _ in range(repeat):
+        target = io.BytesIO()
+        started = time.perf_counter()
+        func(io.BytesIO(xml), target)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    func(io.BytesIO(xml), io.BytesIO())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = target.getvalue()
+    print(
+        f"{name:<12} {sum(timings) / repeat * 1000:7.1f}ms, "
+        f"min {min(timings) * 1000:7.1f}ms, "
+        f"peak {peak / 1024 / 1024:6.1f}MB, "
+        f"cantSplit x{result.count(b'cantSplit')}",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--columns", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    docx = make_rasp_docx(
+        args.rows, args.columns, tables=args.tables, nested=True,
+    )
+    with zipfile.ZipFile(io.BytesIO(docx)) as archive:
+        xml = archive.read(DOCUMENT_XML)
+    rows = xml.count(b"<w:tr>")
+    print(f"document.xml: {len(xml) / 1024 / 1024:.1f}MB, {rows} table rows")
+    measure("two passes", format_two_passes, xml, args.repeat)
+    measure("streaming", format_rasp_xml, xml, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
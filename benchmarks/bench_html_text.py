@@ -0,0 +1,91 @@
+"""Абзацы из HTML тела письма: html2text против html_text.
+
+html2text -- прежний get_lines_from_html (новый HTML2Text на каждый
+вызов, Markdown целиком, потом разбиение на абзацы), reused -- то же
+с одним заранее настроенным HTML2Text на все письма (только для
+сравнения: html2text не сбрасывает состояние между handle, и строки
+следующего письма получаются другими), html_text --
+documents.html_text.read_html_lines за один проход. Печатаем время
+на тело письма на наборе писем со случайной разметкой и пересланных
+новостей, затем время и пиковую память (tracemalloc) на большой
+рассылке в 1x, 2x и 4x размера: время должно расти линейно.
+Что строки совпадают, проверяют тесты tests/test_html_text.py.
+
+Запуск: `python -m benchmarks.bench_html_text --mails 300 --newsletter 2000`
+"""
+
+import argparse
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from autopublisher.documents.html_text import (
+    html2text_lines,
+    make_html2text,
+    read_html_lines,
+    split_markdown_lines,
+)
+from benchmarks.samples import make_forwarded_news, make_mail_html
+
+
+REUSED_HTML2TEXT = make_html2text()
+
+
+def reused_html2text_lines(body: str) -> list[str]:
+    return split_markdown_lines(REUSED_HTML2TEXT.handle(body))
+
+
+ENGINES: dict[str, Callable[[str], list[str]]] = {
+    "html2text": html2text_lines,
+    "reused": reused_html2text_lines,
+    "html_text": read_html_lines,
+}
+
+
+def measure_bodies(bodies: list[str]) -> None:
+    for name, get_lines in ENGINES.items():
+        started = time.perf_counter()
+        for body in bodies:
+            get_lines(body)
+        elapsed = (time.perf_counter() - started) / len(bodies)
+        print(f"{name:<10} {elapsed * 1000:7.2f}ms per mail")
+
+
+def measure_newsletter(blocks: int, repeat: int) -> None:
+    for scale in (1, 2, 4):
+        body = make_mail_html(blocks * scale, seed=scale)
+        for name, get_lines in ENGINES.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                get_lines(body)
+                timings.append(time.perf_counter() - started)
+            elapsed = min(timings)
+            tracemalloc.start()
+            get_lines(body)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{len(body) / 1024:7.0f}KB {name:<10} "
+                f"{elapsed * 1000:7.0f}ms, peak {peak / 1024 / 1024:6.1f}MB",
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mails", type=int, default=300)
+    parser.add_argument("--newsletter", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    bodies = [make_mail_html(seed=seed) for seed in range(args.mails)]
+    bodies += [
+        make_forwarded_news("news@localhost", i).get_content()
+        for i in range(10)
+    ]
+    measure_bodies(bodies)
+    measure_newsletter(args.newsletter, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Загрузка картинки для главной страницы.
+
+old -- как раньше download_image: файл пишется в .download, тип
+определяется libmagic по файлу, файл переносится под имя с расширением,
+а image_loader еще два раза читает файл через libmagic
+(Image.magic_text и Image.type), sha256 -- отдельным проходом
+по файлу; new -- documents.image.ImageWriter: тип, размер и sha256
+по ходу записи, файл сразу с нужным именем.
+Данные пишутся кусками по --chunk-kb, как их отдает загрузчик.
+Печатаем время на картинку.
+
+Запуск: `python -m benchmarks.bench_image_ingest --images 20`
+"""
+
+import argparse
+import hashlib
+import shutil
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import magic
+
+from autopublisher.documents.image import (
+    ImageWriter,
+    get_img_full_name,
+    get_possible_type_from_magic_text,
+)
+from benchmarks.samples import make_photo
+
+
+PHOTO_SIZES = ((4000, 3000), (2048, 1536), (1024, 768))
+
+
+def chunks(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def ingest_old(folder: Path, name: str, parts: list[bytes]) -> str:
+    download = folder / f"{name}.download"
+    with download.open("wb") as f:
+        for part in parts:
+            f.write(part)
+    magic_text = magic.from_file(download)
+    image_path = folder / get_img_full_name(
+        img_name=name, img_type=get_possible_type_from_magic_text(magic_text),
+    )
+    shutil.move(download, image_path)
+    magic.from_file(image_path)
+    with image_path.open("rb") as f:
+        hashlib.file_digest(f, "sha256").hexdigest()
+    return get_possible_type_from_magic_text(magic.from_file(image_path))
+
+
+def ingest_new(folder: Path, name: str, parts: list[bytes]) -> str:
+    with ImageWriter(folder, name) as writer:
+        for part in parts:
+            writer.write(part)
+    return get_possible_type_from_magic_text(writer.info.magic_text)
+
+
+def measure(
+        name: str,
+        ingest: Callable[[Path, str, list[bytes]], str],
+        images: list[list[bytes]],
+        folder: Path,
+) -> None:
+    folder.mkdir()
+    started = time.perf_counter()
+    types = {
+        ingest(folder, f"image_{i}", parts) for i, parts in enumerate(images)
+    }
+    elapsed = (time.perf_counter() - started) / len(images)
+    print(f"{name:<4} {elapsed * 1000:6.1f}ms per image, types {types}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    args = parser.parse_args()
+
+    images = [
+        chunks(
+            make_photo(*PHOTO_SIZES[i % len(PHOTO_SIZES)], seed=i),
+            args.chunk_kb * 1024,
+        )
+        for i in range(args.images)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        measure("old", ingest_old, images, Path(tmp) / "old")
+        measure("new", ingest_new, images, Path(tmp) / "new")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Полная загрузка письма против загрузки по BODYSTRUCTURE.
+
+Письмо с .docx и большими фотографиями: сравниваем время до показа
+письма (mail.about) и объем переданных данных для full и lazy режимов,
+а также объем для последующей загрузки только .docx (как для rasp).
+
+Запуск: `python -m benchmarks.bench_lazy_fetch --photos 20 --photo-mb 3`
+"""
+
+import argparse
+import os
+import time
+from email.message import EmailMessage
+
+from autopublisher.config import config
+from autopublisher.mail import maildriver
+from autopublisher.mail.client import mail_client
+from benchmarks.imap_standin import IMAPStandIn, configure
+
+
+MAIL_FROM = "sender@example.com"
+
+
+def make_message(photos: int, photo_mb: float) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = "bench@localhost"
+    message["Subject"] = "Fwd: Новость с фотографиями"
+    message["Date"] = "Mon, 01 Jan 2024 10:00:00 +0300"
+    message.set_content("<p>Текст новости во вложении</p>", subtype="html")
+    message.add_attachment(
+        os.urandom(50 * 1024),
+        maintype="application",
+        subtype="vnd.openxmlformats-officedocument.wordprocessingml.document",
+        filename="Новость.docx",
+    )
+    for i in range(photos):
+        message.add_attachment(
+            os.urandom(int(photo_mb * 1024 * 1024)),
+            maintype="image",
+            subtype="jpeg",
+            filename=f"IMG_{i:04d}.jpg",
+        )
+    return message
+
+
+def run(standin: IMAPStandIn, mode: str) -> None:
+    config.mail_fetch_mode = mode
+    standin.stats.reset()
+    started = time.perf_counter()
+    current_mail = maildriver.mail_prefetcher.take(MAIL_FROM)
+    first_message = time.perf_counter() - started
+    if current_mail is None:
+        raise RuntimeError("Mail is not found")
+    first_bytes = standin.stats.bytes_sent
+
+    current_mail.fetch_attachments(".docx")
+    docx_bytes = standin.stats.bytes_sent - first_bytes
+    current_mail.rollback()
+
+    print(
+        f"{mode:<5} time to first message={first_message * 1000:8.1f}ms, "
+        f"transferred={first_bytes / 1024:10.1f}KB, "
+        f"+docx={docx_bytes / 1024:8.1f}KB",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=20)
+    parser.add_argument("--photo-mb", type=float, default=3.0)
+    parser.add_argument(
+        "--latency", type=float, default=0.01,
+        help="Simulated network round trip, seconds",
+    )
+    args = parser.parse_args()
+
+    with IMAPStandIn(latency=args.latency) as standin:
+        configure(standin)
+        standin.mailbox.append(make_message(args.photos, args.photo_mb))
+        # разбор письма на стороне stand-in не должен попадать в замер
+        stored = standin.mailbox.messages[0]
+        _ = stored.parsed, stored.headers
+        for mode in ("full", "lazy"):
+            run(standin, mode)
+        mail_client.close()
+
+
+if __name__ == "__main__":
+    main()
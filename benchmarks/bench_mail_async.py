@@ -0,0 +1,111 @@
+"""Задержка event loop бота, пока загружается письмо.
+
+Загружаем письмо из stand-in с задержкой --latency на round trip
+прямым вызовом (как раньше делал check_mail) и через
+async_mail_client. Параллельно в том же event loop работает задача,
+которая просыпается каждые 10 мс, -- как обработка других сообщений
+боту. Сравниваем наибольшую паузу между ее пробуждениями.
+
+Запуск: `python -m benchmarks.bench_mail_async --latency 0.05`
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable
+from email.message import EmailMessage
+
+from autopublisher.mail import maildriver
+from autopublisher.mail.aio import async_mail_client
+from autopublisher.mail.client import mail_client
+from benchmarks.imap_standin import IMAPStandIn, configure
+
+
+MAIL_FROM = "sender@example.com"
+TICK = 0.01
+
+
+def make_message(attachment_mb: float) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = "bench@localhost"
+    message["Subject"] = "Новость"
+    message.set_content("<p>Текст новости во вложении</p>", subtype="html")
+    message.add_attachment(
+        os.urandom(int(attachment_mb * 1024 * 1024)),
+        maintype="image",
+        subtype="jpeg",
+        filename="IMG_0001.jpg",
+    )
+    return message
+
+
+async def ticker(stop: asyncio.Event, pauses: list[float]) -> None:
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(TICK)
+        now = time.perf_counter()
+        pauses.append(now - last - TICK)
+        last = now
+
+
+async def measure(
+        take: Callable[[], Awaitable[maildriver.CurrentMail | None]],
+) -> tuple[float, float]:
+    stop = asyncio.Event()
+    pauses: list[float] = []
+    task = asyncio.create_task(ticker(stop, pauses))
+    await asyncio.sleep(TICK * 2)
+    started = time.perf_counter()
+    current_mail = await take()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await task
+    if current_mail is None:
+        raise RuntimeError("Mail is not found")
+    await async_mail_client.call(current_mail.rollback)
+    return elapsed, max(pauses)
+
+
+async def take_blocking() -> maildriver.CurrentMail | None:
+    return maildriver.mail_prefetcher.take(MAIL_FROM)
+
+
+async def take_async() -> maildriver.CurrentMail | None:
+    return await async_mail_client.call(
+        maildriver.mail_prefetcher.take, MAIL_FROM,
+    )
+
+
+async def run(repeat: int) -> None:
+    for name, take in (("blocking", take_blocking), ("async", take_async)):
+        results = [await measure(take) for _ in range(repeat)]
+        elapsed = sum(result[0] for result in results) / repeat
+        stall = max(result[1] for result in results)
+        print(
+            f"{name:<8} take: {elapsed * 1000:7.1f}ms, "
+            f"max event loop stall: {stall * 1000:7.1f}ms",
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--attachment-mb", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--latency", type=float, default=0.05,
+        help="Simulated network round trip, seconds",
+    )
+    args = parser.parse_args()
+
+    with IMAPStandIn(latency=args.latency) as standin:
+        configure(standin)
+        standin.mailbox.append(make_message(args.attachment_mb))
+        asyncio.run(run(args.repeat))
+        async_mail_client.close()
+        mail_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Разбор очереди писем: по одному против batch mode.
+
+По одному -- как при ручной работе: /mail, затем подготовка новости,
+и так для каждого письма. Batch mode -- все новые письма загружаются
+одной командой FETCH и готовятся параллельно в mail_batch_workers
+потоках.
+
+Проверка орфографии ходит в сеть, поэтому здесь она заменена
+задержкой --speller-latency на каждую строку.
+
+Запуск: `python -m benchmarks.bench_mail_batch --mails 12 --workers 1 4 8`
+"""
+
+import argparse
+import time
+from email.message import EmailMessage
+
+from autopublisher.config import config
+from autopublisher.mail import maildriver
+from autopublisher.mail.client import mail_client
+from benchmarks.imap_standin import IMAPStandIn, configure
+from benchmarks.samples import make_jpeg, make_news_docx
+
+
+MAIL_FROM = "sender@example.com"
+
+
+def make_message(number: int, photos: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = "bench@localhost"
+    message["Subject"] = f"Новость {number}"
+    message["Date"] = "Mon, 01 Jan 2024 10:00:00 +0300"
+    message.set_content("<p>Текст новости во вложении</p>", subtype="html")
+    message.add_attachment(
+        make_news_docx(f"Новость номер {number}"),
+        maintype="application",
+        subtype="vnd.openxmlformats-officedocument.wordprocessingml.document",
+        filename=f"Новость {number}.docx",
+    )
+    for i in range(photos):
+        message.add_attachment(
+            make_jpeg(1024, 768, seed=number * photos + i),
+            maintype="image",
+            subtype="jpeg",
+            filename=f"IMG_{number:02d}{i:02d}.jpg",
+        )
+    return message
+
+
+def take_all() -> int:
+    """Забирает все письма и готовит из каждого новость"""
+    count = 0
+    while current_mail := maildriver.mail_prefetcher.take(MAIL_FROM):
+        if not current_mail.images_prepared:
+            maildriver.prepare_news(current_mail)
+        if not current_mail.sentences:
+            raise RuntimeError(f"News is not prepared: {current_mail.mail_id}")
+        current_mail.clear()
+        count += 1
+    return count
+
+
+def run(standin: IMAPStandIn, name: str, *, batch: bool, workers: int) -> None:
+    for stored in standin.mailbox.messages:
+        stored.flags.clear()
+    config.mail_batch = batch
+    config.mail_batch_workers = workers
+    standin.stats.reset()
+
+    started = time.perf_counter()
+    count = take_all()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<18} {count} mails in {elapsed:6.2f}s "
+        f"({count / elapsed:5.2f} mails/s, "
+        f"{standin.stats.commands} IMAP commands)",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mails", type=int, default=12)
+    parser.add_argument("--photos", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument(
+        "--latency", type=float, default=0.01,
+        help="Simulated network round trip, seconds",
+    )
+    parser.add_argument(
+        "--speller-latency", type=float, default=0.05,
+        help="Simulated spellchecker response time per line, seconds",
+    )
+    args = parser.parse_args()
+
+    def spell_line(line: str) -> str:
+        time.sleep(args.speller_latency)
+        return line
+
+    maildriver.spell_line = spell_line  # type: ignore[assignment]
+
+    with IMAPStandIn(latency=args.latency) as standin:
+        configure(standin)
+        for number in range(args.mails):
+            standin.mailbox.append(make_message(number, args.photos))
+
+        run(standin, "one by one", batch=False, workers=1)
+        for workers in args.workers:
+            run(standin, f"batch, {workers} workers", batch=True, workers=workers)
+        mail_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Сравнение подключения на каждую команду с общим MailClient.
+
+Запуск: `python -m benchmarks.bench_mail_client --latency 0.02`
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from email.message import EmailMessage
+
+from autopublisher.mail import mail
+from autopublisher.mail.client import MailClient
+from benchmarks.imap_standin import IMAPStandIn, configure, iter_latencies
+
+
+MAIL_FROM = "sender@example.com"
+
+
+def make_message() -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = "bench@localhost"
+    message["Subject"] = "Benchmark"
+    message.set_content("Hello")
+    return message
+
+
+def per_call_check() -> None:
+    connection = mail.get_connection()
+    try:
+        mail.get_new_mails_from(connection, MAIL_FROM)
+    finally:
+        mail.close_connection(connection)
+
+
+def per_call_rollback() -> None:
+    connection = mail.get_connection()
+    try:
+        mail.mark_as_unread(connection, "1")
+    finally:
+        mail.close_connection(connection)
+
+
+def measure(func: Callable[[], object], repeat: int) -> list[float]:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list[float], commands: int) -> None:
+    stats = ", ".join(
+        f"{key}={value * 1000:.2f}ms" for key, value in iter_latencies(latencies)
+    )
+    print(f"{name:<28} {stats}, IMAP commands/op={commands / len(latencies):.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.01,
+        help="Simulated network round trip, seconds",
+    )
+    args = parser.parse_args()
+
+    with IMAPStandIn(latency=args.latency) as standin:
+        configure(standin)
+        standin.mailbox.append(make_message())
+        client = MailClient(keepalive_interval=3600)
+
+        scenarios: list[tuple[str, Callable[[], object]]] = [
+            ("per-call: check mail", per_call_check),
+            ("per-call: rollback", per_call_rollback),
+            (
+                "MailClient: check mail",
+                lambda: client.run(mail.get_new_mails_from, MAIL_FROM),
+            ),
+            (
+                "MailClient: rollback",
+                lambda: client.run(mail.mark_as_unread, "1"),
+            ),
+        ]
+        # первое подключение общего клиента не входит в замер
+        client.run(mail.get_new_mails_from, MAIL_FROM)
+        print(f"Simulated RTT: {args.latency * 1000:.1f}ms")
+        for name, func in scenarios:
+            standin.stats.reset()
+            latencies = measure(func, args.repeat)
+            report(name, latencies, standin.stats.commands)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
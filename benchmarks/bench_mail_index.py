@@ -0,0 +1,121 @@
+"""Повторно присланные письма с индексом обработанных писем и без него.
+
+В ящике --mails писем с фотографиями, которые уже были опубликованы:
+половина -- те же письма (тот же Message-ID), половина -- пересланные
+копии с теми же вложениями. Без индекса каждое письмо загружается
+и готовится заново; с индексом повторы отсеиваются по Message-ID
+до загрузки или по хешам вложений сразу после нее.
+
+Запуск: `python -m benchmarks.bench_mail_index --mails 6 --photos 5`
+"""
+
+import argparse
+import email.utils
+import tempfile
+import time
+from email.message import EmailMessage
+from pathlib import Path
+
+from autopublisher.config import config
+from autopublisher.mail import maildriver
+from autopublisher.mail.client import mail_client
+from autopublisher.mail.index import mail_index
+from benchmarks.imap_standin import IMAPStandIn, configure
+from benchmarks.samples import make_jpeg, make_news_docx
+
+
+MAIL_FROM = "sender@example.com"
+
+
+def make_message(number: int, photos: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = "bench@localhost"
+    message["Subject"] = f"Новость {number}"
+    message["Date"] = "Mon, 01 Jan 2024 10:00:00 +0300"
+    message["Message-ID"] = email.utils.make_msgid(domain="example.com")
+    message.set_content("<p>Текст новости во вложении</p>", subtype="html")
+    message.add_attachment(
+        make_news_docx(f"Новость номер {number}"),
+        maintype="application",
+        subtype="vnd.openxmlformats-officedocument.wordprocessingml.document",
+        filename=f"Новость {number}.docx",
+    )
+    for i in range(photos):
+        message.add_attachment(
+            make_jpeg(2048, 1536, seed=number * photos + i),
+            maintype="image",
+            subtype="jpeg",
+            filename=f"IMG_{number:02d}{i:02d}.jpg",
+        )
+    return message
+
+
+def publish_all() -> int:
+    """Забирает все письма и "публикует" их, как mailbot"""
+    count = 0
+    while current_mail := maildriver.mail_prefetcher.take(MAIL_FROM):
+        maildriver.prepare_news(current_mail)
+        current_mail.mark_published(f"https://example.com/news/{count}")
+        current_mail.clear()
+        count += 1
+    return count
+
+
+def run(standin: IMAPStandIn, name: str) -> None:
+    for stored in standin.mailbox.messages:
+        stored.flags.clear()
+    standin.stats.reset()
+    started = time.perf_counter()
+    count = publish_all()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<10} {count} of {len(standin.mailbox.messages)} mails "
+        f"processed in {elapsed:6.2f}s, "
+        f"{standin.stats.bytes_sent / 1024 / 1024:6.1f}MB downloaded",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mails", type=int, default=6)
+    parser.add_argument("--photos", type=int, default=5)
+    parser.add_argument(
+        "--latency", type=float, default=0.01,
+        help="Simulated network round trip, seconds",
+    )
+    args = parser.parse_args()
+
+    maildriver.spell_line = lambda line: line  # type: ignore[assignment]
+    with (
+        IMAPStandIn(latency=args.latency) as standin,
+        tempfile.TemporaryDirectory() as tmp,
+    ):
+        configure(standin)
+        originals = [
+            make_message(number, args.photos) for number in range(args.mails)
+        ]
+        for message in originals:
+            standin.mailbox.append(message)
+
+        config.mail_index_file = Path(tmp) / "mail_index.sqlite"
+        run(standin, "first run")
+
+        # те же письма еще раз и пересланные копии
+        for number, message in enumerate(originals):
+            if number % 2:
+                del message["Message-ID"]
+                message["Message-ID"] = email.utils.make_msgid()
+                message.replace_header("Subject", "Fwd: " + message["Subject"])
+            standin.mailbox.append(message)
+        standin.mailbox.messages[:args.mails] = []
+        config.mail_index_file = None
+        run(standin, "no index")
+        config.mail_index_file = Path(tmp) / "mail_index.sqlite"
+        run(standin, "index")
+        mail_index.close()
+        mail_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Сквозной бенчмарк загрузки почты по сценариям.
+
+Для каждого сценария письма отправляются через SMTP stand-in
+в ящик IMAP stand-in, затем в отдельном процессе забираются по одному,
+как по команде /mail: maildriver.load_most_old_mail_from и
+CurrentMail (с распаковкой .zip и .rar). Печатаем пропускную
+способность, перцентили времени на письмо и пиковую память процесса.
+
+Сценарии:
+  news_html  -- пересланная новость, текст в HTML теле письма
+  news_docx  -- новость в .docx и несколько фотографий
+  rasp       -- расписание в .docx с таблицей
+  zip        -- .docx и фотографии в .zip
+  rar        -- .docx и фотографии в .rar (нужен /usr/bin/unrar)
+  jpegs      -- много больших фотографий
+
+Запуск: `python -m benchmarks.bench_mail_ingest --mails 10 --mode full`
+"""
+
+import argparse
+import shutil
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Any
+
+from autopublisher.config import config
+from autopublisher.mail import maildriver
+from benchmarks.harness import max_rss_mb, run_in_process
+from benchmarks.imap_standin import IMAPStandIn, configure, iter_latencies
+from benchmarks.samples import (
+    make_forwarded_news,
+    make_jpeg,
+    make_mail,
+    make_news_docx,
+    make_rar,
+    make_rasp_docx,
+    make_zip,
+)
+from benchmarks.smtp_standin import SMTPStandIn
+
+
+MAIL_FROM = "sender@example.com"
+
+
+def photos(number: int, count: int, size: tuple[int, int]) -> dict[str, bytes]:
+    return {
+        f"IMG_{number:03d}_{i:02d}.jpg": make_jpeg(*size, seed=number + i)
+        for i in range(count)
+    }
+
+
+def news_files(number: int) -> dict[str, bytes]:
+    return {
+        f"Новость {number}.docx": make_news_docx(f"Новость номер {number}"),
+        **photos(number, 3, (1600, 1200)),
+    }
+
+
+SCENARIOS: dict[str, Callable[[int], EmailMessage]] = {
+    "news_html": lambda number: make_forwarded_news(MAIL_FROM, number),
+    "news_docx": lambda number: make_mail(
+        MAIL_FROM, f"Новость {number}", attachments=news_files(number),
+    ),
+    "rasp": lambda number: make_mail(
+        MAIL_FROM, f"Расписание {number}",
+        attachments={"Расписание.docx": make_rasp_docx()},
+    ),
+    "zip": lambda number: make_mail(
+        MAIL_FROM, f"Новость {number}",
+        attachments={"news.zip": make_zip(news_files(number))},
+    ),
+    "rar": lambda number: make_mail(
+        MAIL_FROM, f"Новость {number}",
+        attachments={"news.rar": make_rar(news_files(number))},
+    ),
+    "jpegs": lambda number: make_mail(
+        MAIL_FROM, f"Фотографии {number}",
+        attachments=photos(number, 8, (3000, 2000)),
+    ),
+}
+
+
+@dataclass
+class Result:
+    mails: int
+    errors: int
+    elapsed: float
+    latencies: list[float]
+    saved_bytes: int
+    baseline_mb: float
+    peak_mb: float
+
+
+def folder_size(folder: Path) -> int:
+    return sum(f.stat().st_size for f in folder.rglob("*") if f.is_file())
+
+
+def ingest(settings: dict[str, Any]) -> Result:
+    """Забирает все письма из ящика, как /mail"""
+    for key, value in settings.items():
+        setattr(config, key, value)
+    baseline = max_rss_mb()
+    latencies: list[float] = []
+    errors = saved_bytes = 0
+    started = time.perf_counter()
+    while True:
+        mail_started = time.perf_counter()
+        loaded = maildriver.load_most_old_mail_from(MAIL_FROM)
+        if loaded is None:
+            break
+        try:
+            current_mail = loaded.to_current_mail()
+        except Exception:
+            errors += 1
+            shutil.rmtree(loaded.folder, ignore_errors=True)
+            continue
+        latencies.append(time.perf_counter() - mail_started)
+        saved_bytes += folder_size(current_mail.folder)
+        current_mail.clear()
+    return Result(
+        mails=len(latencies),
+        errors=errors,
+        elapsed=time.perf_counter() - started,
+        latencies=latencies,
+        saved_bytes=saved_bytes,
+        baseline_mb=baseline,
+        peak_mb=max_rss_mb(),
+    )
+
+
+def report(name: str, result: Result) -> None:
+    if not result.latencies:
+        print(f"{name:<10} no mails processed, {result.errors} errors")
+        return
+    percentiles = ", ".join(
+        f"{key}={value * 1000:.0f}ms"
+        for key, value in iter_latencies(result.latencies)
+    )
+    print(
+        f"{name:<10} {result.mails / result.elapsed:6.2f} mails/s, "
+        f"{result.saved_bytes / 1024 / 1024 / result.elapsed:6.1f} MB/s, "
+        f"{percentiles}, "
+        f"peak RSS={result.peak_mb:.0f}MB "
+        f"(+{result.peak_mb - result.baseline_mb:.0f}MB), "
+        f"errors={result.errors}",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--mails", type=int, default=10)
+    parser.add_argument(
+        "--mode", choices=("full", "lazy", "stream"), default="full",
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS),
+        default=list(SCENARIOS),
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="Simulated network round trip, seconds",
+    )
+    args = parser.parse_args()
+
+    with (
+        IMAPStandIn(latency=args.latency) as standin,
+        SMTPStandIn(standin.mailbox) as smtp,
+    ):
+        configure(standin)
+        settings = {
+            "mail_server": config.mail_server,
+            "mail_port": config.mail_port,
+            "mail_login": config.mail_login,
+            "mail_passwd": config.mail_passwd,
+            "mail_fetch_mode": args.mode,
+        }
+        print(f"mode={args.mode}, {args.mails} mails per scenario")
+        for name in args.scenarios:
+            standin.mailbox.clear()
+            smtp.send([SCENARIOS[name](number) for number in range(args.mails)])
+            report(name, run_in_process(ingest, settings))
+
+
+if __name__ == "__main__":
+    main()
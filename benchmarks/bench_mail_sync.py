@@ -0,0 +1,96 @@
+"""Проверка почты: SEARCH UNSEEN против синхронизации по UID.
+
+В ящике --mailbox старых прочитанных писем и несколько новых.
+Сравниваем время проверки новых писем и число IMAP-команд
+на проверку и на откат письма.
+
+Запуск: `python -m benchmarks.bench_mail_sync --mailbox 5000`
+"""
+
+import argparse
+import tempfile
+import time
+from email.message import EmailMessage
+from pathlib import Path
+
+from autopublisher.config import config
+from autopublisher.mail import maildriver
+from autopublisher.mail.client import mail_client
+from benchmarks.imap_standin import IMAPStandIn, configure, iter_latencies
+
+
+MAIL_FROM = "sender@example.com"
+
+
+def make_message(number: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM if number % 3 else "other@example.com"
+    message["To"] = "bench@localhost"
+    message["Subject"] = f"Письмо {number}"
+    message.set_content("Hello")
+    return message
+
+
+def check() -> list[str]:
+    return mail_client.run(
+        maildriver._get_new_mails_from, MAIL_FROM,  # noqa:SLF001
+    )
+
+
+def run(standin: IMAPStandIn, name: str, repeat: int) -> None:
+    check()  # первая синхронизация
+    standin.stats.reset()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        check()
+        latencies.append(time.perf_counter() - started)
+    check_commands = standin.stats.commands / repeat
+
+    current_mail = maildriver.mail_prefetcher.take(MAIL_FROM)
+    if current_mail is None:
+        raise RuntimeError("Mail is not found")
+    standin.stats.reset()
+    current_mail.rollback()
+    rollback_commands = standin.stats.commands
+
+    stats = ", ".join(
+        f"{key}={value * 1000:.2f}ms"
+        for key, value in iter_latencies(latencies)
+    )
+    print(
+        f"{name:<6} check: {stats}, IMAP commands/check={check_commands:.1f}, "
+        f"IMAP commands/rollback={rollback_commands}",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mailbox", type=int, default=5000)
+    parser.add_argument("--new", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="Simulated network round trip, seconds",
+    )
+    args = parser.parse_args()
+
+    with IMAPStandIn(latency=args.latency) as standin:
+        configure(standin)
+        for number in range(args.mailbox):
+            standin.mailbox.append(make_message(number), flags=(rb"\Seen",))
+        for number in range(args.new):
+            standin.mailbox.append(make_message(number * 3 + 1))
+        for message in standin.mailbox.messages:
+            _ = message.headers  # разбор на стороне stand-in не замеряем
+
+        config.mail_state_file = None
+        run(standin, "SEARCH", args.repeat)
+        with tempfile.TemporaryDirectory() as tmp:
+            config.mail_state_file = Path(tmp) / "mail_state.json"
+            run(standin, "sync", args.repeat)
+        mail_client.close()
+
+
+if __name__ == "__main__":
+    main()
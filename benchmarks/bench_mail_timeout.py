@@ -0,0 +1,83 @@
+"""Время /mail, когда IMAP-сервер зависает.
+
+Сервер "зависает" на --stall секунд на разных этапах: при
+подключении, на LOGIN, на UID FETCH -- один раз (повтор проходит)
+или на каждой попытке. Печатаем время проверки почты и ошибку,
+которую увидит пользователь. Без таймаутов каждый такой случай
+длился бы все --stall секунд.
+
+Запуск: `python -m benchmarks.bench_mail_timeout --stall 30 --timeout 2`
+"""
+
+import argparse
+import time
+from email.message import EmailMessage
+
+from autopublisher.config import config
+from autopublisher.mail import maildriver
+from autopublisher.mail.client import mail_client
+from benchmarks.imap_standin import IMAPStandIn, configure
+
+
+MAIL_FROM = "sender@example.com"
+
+
+def make_message() -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = "bench@localhost"
+    message["Subject"] = "Новость"
+    message.set_content("<p>Текст новости</p>", subtype="html")
+    return message
+
+
+def check() -> str:
+    """Проверяет почту, как /mail, и возвращает результат"""
+    try:
+        loaded = maildriver.load_most_old_mail_from(MAIL_FROM)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    if loaded is None:
+        return "no mail"
+    maildriver.load_one_mail_rollback(loaded.mail_id, loaded.folder)
+    return "ok"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stall", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--deadline", type=float, default=10.0)
+    args = parser.parse_args()
+
+    config.mail_connect_timeout = args.timeout
+    config.mail_timeout = args.timeout
+    config.mail_retries = args.retries
+    config.mail_deadline = args.deadline
+    scenarios = [
+        ("no stall", b"", 0),
+        ("connect, once", b"GREETING", 1),
+        ("LOGIN, once", b"LOGIN", 1),
+        ("FETCH, once", b"FETCH", 1),
+        ("FETCH, always", b"FETCH", args.retries),
+        ("SEARCH, always", b"SEARCH", args.retries),
+    ]
+    with IMAPStandIn() as standin:
+        configure(standin)
+        standin.mailbox.append(make_message())
+        for name, command, count in scenarios:
+            mail_client.close()
+            if command not in (b"GREETING", b"LOGIN"):
+                check()  # зависнет уже открытое соединение
+            standin.server.stall(command, *[args.stall] * count)
+            started = time.perf_counter()
+            result = check()
+            elapsed = time.perf_counter() - started
+            standin.server.stalls.clear()
+            print(f"{name:<15} {elapsed:6.2f}s  {result}")
+        mail_client.close()
+
+
+if __name__ == "__main__":
+    main()
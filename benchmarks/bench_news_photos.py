@@ -0,0 +1,99 @@
+"""Фотографии для новости: прежняя подготовка против бюджета по размеру.
+
+old -- как раньше prepare_jpeg_for_news: фотография больше 1.5MB
+уменьшается до 1024 пикселей с качеством 100
+(documents.document.resize_jpeg_on_wide_size), меньше -- копируется
+как есть, с EXIF и превью; jpeg и webp -- documents.photo.prepare_photo
+с бюджетом --budget-kb (меньше, чем по умолчанию в боте, чтобы
+качество приходилось подбирать). Фотографии с телефона разного размера.
+Печатаем время на фотографию, средний и наибольший размер файла
+и сколько файлов больше бюджета.
+
+Запуск: `python -m benchmarks.bench_news_photos --photos 12 --budget-kb 100`
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from autopublisher.documents.document import resize_jpeg_on_wide_size
+from autopublisher.documents.photo import (
+    JPEG_FORMAT,
+    WEBP_FORMAT,
+    PhotoEncoding,
+    prepare_photo,
+)
+from autopublisher.publish.prepare import WIDE_SIDE_IMAGE
+from benchmarks.samples import make_photo
+
+
+OLD_MAX_SIZE = int(1.5 * 1024 * 1024)
+PHOTO_SIZES = ((4000, 3000), (2048, 1536), (1024, 768))
+
+
+def prepare_old(jpeg: Path, new_jpeg: Path) -> Path:
+    if jpeg.stat().st_size > OLD_MAX_SIZE:
+        return resize_jpeg_on_wide_size(jpeg, new_jpeg, WIDE_SIDE_IMAGE)
+    shutil.copyfile(jpeg, new_jpeg)
+    return new_jpeg
+
+
+def measure(
+        name: str,
+        prepare: Callable[[Path, Path], Path],
+        jpegs: list[Path],
+        folder: Path,
+        budget: int,
+) -> None:
+    folder.mkdir()
+    started = time.perf_counter()
+    sizes = [
+        prepare(jpeg, folder / jpeg.name).stat().st_size for jpeg in jpegs
+    ]
+    elapsed = (time.perf_counter() - started) / len(jpegs)
+    over = sum(size > budget for size in sizes)
+    print(
+        f"{name:<5} {elapsed * 1000:6.0f}ms per photo, "
+        f"mean {sum(sizes) / len(sizes) / 1024:6.0f}KB, "
+        f"max {max(sizes) / 1024:6.0f}KB, {over} over budget",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=12)
+    parser.add_argument("--budget-kb", type=int, default=100)
+    args = parser.parse_args()
+    budget = args.budget_kb * 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        jpegs = []
+        for i in range(args.photos):
+            jpeg = folder / f"IMG_{i:04d}.jpg"
+            jpeg.write_bytes(
+                make_photo(*PHOTO_SIZES[i % len(PHOTO_SIZES)], seed=i),
+            )
+            jpegs.append(jpeg)
+
+        measure("old", prepare_old, jpegs, folder / "old", budget)
+        for image_format in (JPEG_FORMAT, WEBP_FORMAT):
+            encoding = PhotoEncoding(
+                wide_side=WIDE_SIDE_IMAGE, budget=budget, format=image_format,
+            )
+            measure(
+                image_format,
+                lambda jpeg, target, e=encoding: prepare_photo(
+                    jpeg, target, e,
+                ),
+                jpegs,
+                folder / image_format,
+                budget,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Конвертация расписания в PDF: холодный и теплый LibreOffice.
+
+cold -- отдельный процесс soffice на каждый документ, как раньше
+делал prepare.rasp; warm -- documents.office.office_service,
+запущенный один раз. Отдельно печатаем время первой конвертации
+(вместе с запуском LibreOffice) и восстановления после того,
+как LibreOffice убит.
+
+Нужен установленный LibreOffice (--soffice, по умолчанию
+config.SOFFICE_PATH) и модуль uno (python3-uno) для warm.
+
+Запуск: `python -m benchmarks.bench_office --conversions 5`
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from autopublisher.config import SOFFICE_PATH, config
+from autopublisher.documents import office
+from autopublisher.documents.document import format_rasp_docx
+from benchmarks.samples import make_rasp_docx
+
+
+def timed(func: Callable[[], Path]) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def report(name: str, timings: list[float]) -> None:
+    print(
+        f"{name:<8} mean {statistics.mean(timings) * 1000:7.0f}ms, "
+        f"min {min(timings) * 1000:7.0f}ms, "
+        f"max {max(timings) * 1000:7.0f}ms",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversions", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=60)
+    parser.add_argument("--soffice", default=SOFFICE_PATH)
+    parser.add_argument("--port", type=int, default=config.office_port)
+    args = parser.parse_args()
+
+    if not Path(args.soffice).exists():
+        print(f"LibreOffice is not found: {args.soffice}")
+        return
+
+    office.SOFFICE_PATH = args.soffice
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        source = folder / "Расписание.docx"
+        source.write_bytes(make_rasp_docx(args.rows))
+        docx = format_rasp_docx(source, folder)
+
+        def cold() -> Path:
+            return office.convert_to_pdf_once(docx, folder)
+
+        service = office.OfficeService(
+            port=args.port, profile=folder / "profile",
+        )
+
+        def warm() -> Path:
+            return service.convert_to_pdf(docx, folder)
+
+        report("cold", [timed(cold) for _ in range(args.conversions)])
+        try:
+            service.start()
+            print(f"{'start':<8} {timed(warm) * 1000:7.0f}ms")
+            report("warm", [timed(warm) for _ in range(args.conversions)])
+            process = service._process  # noqa:SLF001
+            if process is not None:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+            print(
+                f"{'restart':<8} {timed(warm) * 1000:7.0f}ms, "
+                f"restarts={service.restarts}",
+            )
+        finally:
+            service.stop()
+
+
+if __name__ == "__main__":
+    main()
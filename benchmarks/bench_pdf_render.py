@@ -0,0 +1,89 @@
+"""Растеризация многостраничного расписания в PNG.
+
+sequential -- как раньше делал prepare.rasp: один процесс convert
+на весь PDF с плотностью 150 dpi; parallel --
+documents.pdf.rasterize_pdf: по процессу на страницу, плотность
+подобрана под ширину 849 пикселей. Печатаем время и ширину картинок.
+
+Нужен ImageMagick с Ghostscript (--convert, по умолчанию
+config.IMAGEMAGICK_PATH).
+
+Запуск: `python -m benchmarks.bench_pdf_render --pages 1 4 8`
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image as PILImage
+
+from autopublisher.config import IMAGEMAGICK_PATH
+from autopublisher.documents import pdf as pdf_module
+from autopublisher.publish.prepare import RASP_IMAGE_WIDTH
+from autopublisher.utils.process import run
+from benchmarks.samples import make_pdf
+
+
+OLD_DENSITY = 150
+
+
+def render_sequential(pdf: Path, target: Path) -> list[Path]:
+    run([
+        pdf_module.IMAGEMAGICK_PATH,
+        "-density", str(OLD_DENSITY),
+        str(pdf),
+        "-quality", "100",
+        "-alpha", "remove",
+        "-colorspace", "sRGB",
+        str(target),
+    ], timeout=pdf_module.RENDER_TIMEOUT)
+    return sorted(target.parent.glob(f"{target.stem}*{target.suffix}"))
+
+
+def render_parallel(pdf: Path, target: Path) -> list[Path]:
+    return pdf_module.rasterize_pdf(pdf, target, width=RASP_IMAGE_WIDTH)
+
+
+def measure(pages: int, repeat: int) -> None:
+    for name, render in (
+            ("sequential", render_sequential),
+            ("parallel", render_parallel),
+    ):
+        timings = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                pdf = Path(tmp) / "rasp.pdf"
+                pdf.write_bytes(make_pdf(pages))
+                started = time.perf_counter()
+                images = render(pdf, Path(tmp) / "rasp.png")
+                timings.append(time.perf_counter() - started)
+                with PILImage.open(images[0]) as image:
+                    width = image.width
+        print(
+            f"{pages:>3} pages {name:<10} "
+            f"{sum(timings) / repeat * 1000:7.0f}ms, "
+            f"{len(images)} images, width {width}px",
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--convert", default=IMAGEMAGICK_PATH)
+    args = parser.parse_args()
+
+    if not Path(args.convert).exists():
+        print(f"ImageMagick is not found: {args.convert}")
+        return
+
+    pdf_module.IMAGEMAGICK_PATH = args.convert
+    print(f"{os.cpu_count()} CPUs")
+    for pages in args.pages:
+        measure(pages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
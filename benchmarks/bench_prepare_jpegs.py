@@ -0,0 +1,81 @@
+"""Подготовка фотографий для новости в зависимости от числа процессов.
+
+publish.prepare.prepare_jpegs_for_news с ImagePool на 1, 2, 4, ...
+процесса (до числа ядер): время на пачку фотографий и ускорение
+относительно одного процесса. Запуск процессов пула в замер
+не входит, как и в боте, где пул живет все время работы.
+
+Запуск: `python -m benchmarks.bench_prepare_jpegs --photos 16`
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from autopublisher.publish.prepare import ImagePool, prepare_jpegs_for_news
+from benchmarks.samples import make_jpeg
+
+
+def get_workers_counts(cpus: int) -> list[int]:
+    counts = []
+    workers = 1
+    while workers < cpus:
+        counts.append(workers)
+        workers *= 2
+    counts.append(cpus)
+    return counts
+
+
+def measure(
+        jpegs: list[Path], folder: Path, workers: int, repeat: int,
+) -> float:
+    pool = ImagePool(max_workers=workers)
+    try:
+        if workers > 1:
+            # запускаем процессы заранее
+            list(pool.executor.map(abs, range(workers)))
+        timings = []
+        for i in range(repeat):
+            started = time.perf_counter()
+            prepare_jpegs_for_news(
+                jpegs=jpegs,
+                jpegs_folder=folder / f"news_{workers}_{i}",
+                pool=pool,
+            )
+            timings.append(time.perf_counter() - started)
+    finally:
+        pool.close()
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=16)
+    parser.add_argument("--size", type=int, nargs=2, default=[4000, 3000])
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--cpus", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        jpegs = []
+        for i in range(args.photos):
+            jpeg = folder / f"IMG_{i:04d}.jpg"
+            jpeg.write_bytes(make_jpeg(*args.size, seed=i))
+            jpegs.append(jpeg)
+
+        print(f"{os.cpu_count()} CPUs, {args.photos} photos {args.size}")
+        baseline = None
+        for workers in get_workers_counts(args.cpus):
+            elapsed = measure(jpegs, folder, workers, args.repeat)
+            baseline = baseline or elapsed
+            print(
+                f"{workers:>3} workers {elapsed * 1000:7.0f}ms, "
+                f"speedup {baseline / elapsed:4.2f}x",
+            )
+
+
+if __name__ == "__main__":
+    main()
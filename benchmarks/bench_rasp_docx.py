@@ -0,0 +1,92 @@
+"""Форматирование .docx расписания перед конвертацией в PDF.
+
+Сравниваем прежнюю схему (распаковать весь .docx во временную папку,
+переписать word/document.xml на диске, заново сжать все файлы)
+с documents.document.format_rasp_docx, который копирует элементы
+архива без повторного сжатия и меняет только document.xml в памяти.
+В расписании --images картинок, как логотипы и фото в настоящих.
+
+Запуск: `python -m benchmarks.bench_rasp_docx --images 4 --repeat 20`
+"""
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from collections.abc import Callable
+from pathlib import Path
+
+from autopublisher.documents.document import (
+    DOCUMENT_XML,
+    FORMATTED_FILE,
+    format_rasp_docx,
+    format_rasp_xml,
+)
+from benchmarks.samples import make_rasp_docx
+
+
+def format_unpacked(docx: Path, mail_folder: Path) -> Path:
+    """Прежняя реализация: распаковка на диск и упаковка заново"""
+    word_tmp_dir = mail_folder / "word_tmp"
+    with zipfile.ZipFile(docx) as source:
+        source.extractall(word_tmp_dir)
+    xml_name = word_tmp_dir / DOCUMENT_XML
+    formatted_xml = io.BytesIO()
+    with xml_name.open("rb") as xml:
+        format_rasp_xml(xml, formatted_xml)
+    xml_name.write_bytes(formatted_xml.getvalue())
+    formatted_filename = mail_folder / FORMATTED_FILE
+    with zipfile.ZipFile(formatted_filename, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for root, _dirs, files in os.walk(word_tmp_dir):
+            for file in files:
+                path = Path(root) / file
+                zipf.write(path, path.relative_to(word_tmp_dir))
+    shutil.rmtree(word_tmp_dir)
+    return formatted_filename
+
+
+def measure(
+        name: str,
+        func: Callable[[Path, Path], Path],
+        docx_data: bytes,
+        repeat: int,
+) -> None:
+    timings = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            mail_folder = Path(tmp)
+            docx = mail_folder / "Расписание.docx"
+            docx.write_bytes(docx_data)
+            started = time.perf_counter()
+            formatted = func(docx, mail_folder)
+            timings.append(time.perf_counter() - started)
+            with zipfile.ZipFile(formatted) as result:
+                if result.testzip() is not None:
+                    raise RuntimeError(f"{name}: broken archive")
+                xml = result.read(DOCUMENT_XML)
+            size = formatted.stat().st_size
+    print(
+        f"{name:<10} {sum(timings) / repeat * 1000:7.1f}ms per docx, "
+        f"min {min(timings) * 1000:7.1f}ms, "
+        f"{size / 1024:7.0f}KB, cantSplit x{xml.count(b'cantSplit')}",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=60)
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    docx_data = make_rasp_docx(args.rows, images=args.images)
+    print(f"source docx: {len(docx_data) / 1024:.0f}KB")
+    measure("unpacked", format_unpacked, docx_data, args.repeat)
+    measure("in memory", format_rasp_docx, docx_data, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
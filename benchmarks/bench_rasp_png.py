@@ -0,0 +1,50 @@
+"""Сжатие PNG страниц расписания.
+
+Страницы -- таблица с текстом на белом поле, как после convert
+в documents.pdf.render_page. Для каждой печатаем размер до и после
+documents.png.optimize_png, размер картинки и время, в конце -- итог.
+
+Запуск: `python -m benchmarks.bench_rasp_png --pages 6`
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image as PILImage
+
+from autopublisher.documents.png import optimize_png
+from benchmarks.samples import make_rasp_page
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=6)
+    args = parser.parse_args()
+
+    before = after = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for page in range(args.pages):
+            png = Path(tmp) / f"rasp-{page}.png"
+            png.write_bytes(make_rasp_page(seed=page))
+            started = time.perf_counter()
+            saving = optimize_png(png)
+            elapsed = time.perf_counter() - started
+            with PILImage.open(png) as image:
+                size, mode = image.size, image.mode
+            print(
+                f"page {page}: {saving.size_before / 1024:6.1f}KB -> "
+                f"{saving.size_after / 1024:6.1f}KB, "
+                f"{size[0]}x{size[1]} {mode}, {elapsed * 1000:5.0f}ms",
+            )
+            before += saving.size_before
+            after += saving.size_after
+    print(
+        f"total {before / 1024:.1f}KB -> {after / 1024:.1f}KB, "
+        f"saved {(before - after) / before:.0%}",
+    )
+
+
+if __name__ == "__main__":
+    main()
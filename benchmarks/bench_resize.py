@@ -0,0 +1,105 @@
+"""Ресайз фотографий для новости до 1024 пикселей по широкой стороне.
+
+imagemagick -- как раньше делал resize_jpeg_on_wide_size: процесс
+convert на каждую фотографию (если ImageMagick установлен);
+full -- Pillow с декодированием фотографии целиком;
+draft -- documents.document.resize_jpeg_on_wide_size: Pillow
+с уменьшением JPEG при декодировании.
+Печатаем время на фотографию и процессорное время, включая
+дочерние процессы.
+
+Запуск: `python -m benchmarks.bench_resize --photos 8 --size 4000 3000`
+"""
+
+import argparse
+import resource
+import subprocess
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from PIL import Image as PILImage
+
+from autopublisher.config import IMAGEMAGICK_PATH
+from autopublisher.documents.document import (
+    get_image_size,
+    get_resized_image_size,
+    resize_jpeg_on_wide_size,
+)
+from autopublisher.publish.prepare import WIDE_SIDE_IMAGE
+from benchmarks.samples import make_jpeg
+
+
+def resize_imagemagick(jpeg: Path, new_jpeg: Path, wide_side: int) -> Path:
+    width, _ = get_resized_image_size(*get_image_size(jpeg), wide_side)
+    subprocess.run([  # noqa:S603
+        IMAGEMAGICK_PATH,
+        str(jpeg),
+        "-resize", str(width),
+        "-quality", "100",
+        str(new_jpeg),
+    ], check=True)
+    return new_jpeg
+
+
+def resize_full(jpeg: Path, new_jpeg: Path, wide_side: int) -> Path:
+    with PILImage.open(jpeg) as image:
+        width, height = image.size
+        size = get_resized_image_size(width, height, wide_side)
+        image.resize(size, PILImage.Resampling.LANCZOS).save(
+            new_jpeg, "JPEG", quality=100, subsampling=0,
+        )
+    return new_jpeg
+
+
+def cpu_time() -> float:
+    usage = [
+        resource.getrusage(who)
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+    ]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def measure(
+        name: str,
+        resize: Callable[[Path, Path, int], Path],
+        jpegs: list[Path],
+        folder: Path,
+) -> None:
+    cpu_started = cpu_time()
+    started = time.perf_counter()
+    for jpeg in jpegs:
+        resize(jpeg, folder / f"{name}_{jpeg.name}", WIDE_SIDE_IMAGE)
+    elapsed = time.perf_counter() - started
+    cpu = cpu_time() - cpu_started
+    print(
+        f"{name:<12} {elapsed / len(jpegs) * 1000:7.0f}ms per photo, "
+        f"CPU {cpu / len(jpegs) * 1000:7.0f}ms per photo",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=8)
+    parser.add_argument("--size", type=int, nargs=2, default=[4000, 3000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        jpegs = []
+        for i in range(args.photos):
+            jpeg = folder / f"IMG_{i:04d}.jpg"
+            jpeg.write_bytes(make_jpeg(*args.size, seed=i))
+            jpegs.append(jpeg)
+
+        if Path(IMAGEMAGICK_PATH).exists():
+            measure("imagemagick", resize_imagemagick, jpegs, folder)
+        else:
+            print(f"ImageMagick is not found: {IMAGEMAGICK_PATH}")
+        measure("full", resize_full, jpegs, folder)
+        measure("draft", resize_jpeg_on_wide_size, jpegs, folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Пиковая память при сохранении большого письма: full против stream.
+
+Каждый режим запускается в отдельном процессе, чтобы замер пиковой
+памяти (VmHWM) не включал stand-in и предыдущие прогоны.
+
+Запуск: `python -m benchmarks.bench_stream_save --size-mb 200`
+"""
+
+import argparse
+import base64
+import os
+import shutil
+import time
+from typing import Any
+
+from autopublisher.config import config
+from autopublisher.mail import mail, maildriver
+from benchmarks.harness import max_rss_mb, run_in_process
+from benchmarks.imap_standin import IMAPStandIn, configure
+
+
+MAIL_FROM = "sender@example.com"
+BOUNDARY = b"bench-boundary"
+
+
+def make_message(size_mb: int) -> bytes:
+    attachment = base64.encodebytes(os.urandom(size_mb * 1024 * 1024))
+    return b"\r\n".join((
+        b"From: " + MAIL_FROM.encode(),
+        b"To: bench@localhost",
+        b"Subject: Large attachment",
+        b"Date: Mon, 01 Jan 2024 10:00:00 +0300",
+        b"MIME-Version: 1.0",
+        b'Content-Type: multipart/mixed; boundary="' + BOUNDARY + b'"',
+        b"",
+        b"--" + BOUNDARY,
+        b"Content-Type: text/plain; charset=utf-8",
+        b"",
+        b"Large attachment inside",
+        b"--" + BOUNDARY,
+        b"Content-Type: application/octet-stream",
+        b'Content-Disposition: attachment; filename="large.bin"',
+        b"Content-Transfer-Encoding: base64",
+        b"",
+        attachment.replace(b"\n", b"\r\n"),
+        b"--" + BOUNDARY + b"--",
+        b"",
+    ))
+
+
+def load(
+        mode: str,
+        settings: dict[str, Any],
+) -> tuple[float, float, float, int]:
+    for key, value in settings.items():
+        setattr(config, key, value)
+    config.mail_fetch_mode = mode
+    baseline = max_rss_mb()
+
+    connection = mail.get_connection()
+    started = time.perf_counter()
+    loaded = maildriver._load_mail(connection, "1", peek=True)  # noqa:SLF001
+    elapsed = time.perf_counter() - started
+    mail.close_connection(connection)
+
+    size = (loaded.folder / "large.bin").stat().st_size
+    shutil.rmtree(loaded.folder)
+    return elapsed, baseline, max_rss_mb(), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=200)
+    args = parser.parse_args()
+
+    with IMAPStandIn() as standin:
+        configure(standin)
+        standin.mailbox.append(make_message(args.size_mb))
+        settings = {
+            "mail_server": config.mail_server,
+            "mail_port": config.mail_port,
+            "mail_login": config.mail_login,
+            "mail_passwd": config.mail_passwd,
+        }
+        for mode in ("full", "stream"):
+            elapsed, baseline, peak, size = run_in_process(
+                load, mode, settings,
+            )
+            print(
+                f"{mode:<6} {size / 1024 / 1024:6.0f}MB attachment: "
+                f"time={elapsed:6.2f}s, peak RSS={peak:7.1f}MB "
+                f"(after imports {baseline:.1f}MB)",
+            )
+
+
+if __name__ == "__main__":
+    main()
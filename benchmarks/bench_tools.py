@@ -0,0 +1,89 @@
+"""Запуск внешних программ из обработчика бота.
+
+blocking -- как раньше обработчик rasp вызывал prepare.rasp: процессы
+запускаются прямо в event loop; thread -- через asyncio.to_thread.
+Оба раза процессы идут через utils.process.ToolRunner. Программа --
+процесс python, который занимает процессор на --work секунд,
+как convert на странице расписания.
+Пока идут запуски, в том же event loop тикает таймер, как обработка
+сообщений Telegram: печатаем общее время и самую большую задержку
+таймера.
+
+Запуск: `python -m benchmarks.bench_tools --runs 8 --work 0.2`
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections.abc import Callable
+
+from autopublisher.utils.process import ToolRunner
+
+
+TICK = 0.01
+TIMEOUT = 60.0
+
+
+def burn_command(work: float) -> list[str]:
+    script = (
+        "import time\n"
+        f"end = time.perf_counter() + {work}\n"
+        "while time.perf_counter() < end: pass"
+    )
+    return [sys.executable, "-c", script]
+
+
+def run_all(runner: ToolRunner, command: list[str], runs: int) -> None:
+    for _ in range(runs):
+        runner.run(command, timeout=TIMEOUT)
+
+
+async def ticker(stop: asyncio.Event) -> float:
+    loop = asyncio.get_running_loop()
+    lag = 0.0
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lag = max(lag, loop.time() - expected)
+    return lag
+
+
+async def measure(
+        name: str, call: Callable[[], object], *, blocking: bool,
+) -> None:
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(stop))
+    await asyncio.sleep(TICK)
+    started = time.perf_counter()
+    if blocking:
+        call()
+    else:
+        await asyncio.to_thread(call)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    lag = await tick
+    print(f"{name:<10} {elapsed:6.2f}s, max event loop lag {lag * 1000:7.0f}ms")
+
+
+async def main_async(runs: int, work: float) -> None:
+    runner = ToolRunner()
+    command = burn_command(work)
+    await measure(
+        "blocking", lambda: run_all(runner, command, runs), blocking=True,
+    )
+    await measure(
+        "thread", lambda: run_all(runner, command, runs), blocking=False,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=8)
+    parser.add_argument("--work", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.runs, args.work))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Общее для бенчмарков: замер пиковой памяти и запуск
+замеров в отдельном процессе
+"""
+
+import multiprocessing
+from collections.abc import Callable
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss наследуется через fork/exec, VmHWM -- нет
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    raise RuntimeError("VmHWM is not found")
+
+
+def _call(
+        target: Callable[..., Any],
+        args: tuple[Any, ...],
+        result: Connection,
+) -> None:
+    result.send(target(*args))
+
+
+def run_in_process(target: Callable[..., Any], *args: Any) -> Any:
+    """Выполняет target(*args) в новом процессе (spawn) и возвращает
+    результат, чтобы пиковая память считалась только для него
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_call, args=(target, args, sender))
+    process.start()
+    try:
+        return receiver.recv()
+    finally:
+        process.join()
@@ -0,0 +1,623 @@
+"""Локальная замена IMAP-сервера для бенчмарков.
+
+Понимает подмножество IMAP4rev1, которым пользуется
+autopublisher.mail: CAPABILITY, LOGIN, SELECT, STATUS, NOOP, SEARCH,
+FETCH (в том числе BODYSTRUCTURE, BODY[<section>] и
+BODY[HEADER.FIELDS (...)]), STORE, IDLE, LOGOUT и их UID-варианты,
+а также HIGHESTMODSEQ из CONDSTORE. Работает поверх TLS
+с самоподписанным сертификатом (нужен `openssl`), чтобы
+стоимость подключения была как у настоящего сервера.
+"""
+
+import email.parser
+import email.policy
+import email.utils
+import logging
+import re
+import select
+import socket
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from email.header import Header
+from email.message import EmailMessage, Message
+from functools import cached_property
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+from autopublisher.config import config
+
+
+log = logging.getLogger(__name__)
+
+
+CAPABILITIES = ("IMAP4rev1", "IDLE", "UIDPLUS", "CONDSTORE")
+
+TOKEN_RE = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+\[[^\]]*\](?:<[^>]*>)?|[^\s()]+')  # noqa:E501
+
+TokenT = bytes | list["TokenT"]
+
+BODY_ITEM_RE = re.compile(rb"^BODY(\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?$")
+
+
+def tokenize(line: bytes) -> list[TokenT]:
+    stack: list[list[TokenT]] = [[]]
+    for match in TOKEN_RE.finditer(line):
+        token = match.group()
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", token[1:-1]))
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+
+def flatten(tokens: list[TokenT]) -> list[bytes]:
+    result: list[bytes] = []
+    for token in tokens:
+        if isinstance(token, list):
+            result.extend(flatten(token))
+        else:
+            result.append(token)
+    return result
+
+
+def generate_certificate(folder: Path) -> tuple[Path, Path]:
+    certfile, keyfile = folder / "cert.pem", folder / "key.pem"
+    subprocess.run(  # noqa:S603
+        [  # noqa:S607
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", str(keyfile), "-out", str(certfile),
+            "-subj", "/CN=localhost", "-days", "1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def _quote(value: str | None) -> bytes:
+    if value is None:
+        return b"NIL"
+    if not value.isascii():
+        value = Header(value, "utf-8").encode()
+    return b'"' + value.replace("\\", "\\\\").replace('"', '\\"').encode() + b'"'
+
+
+def _params(params: list[tuple[str, Any]]) -> bytes:
+    if not params:
+        return b"NIL"
+    return b"(" + b" ".join(
+        _quote(key) + b" " + _quote(email.utils.collapse_rfc2231_value(value))
+        for key, value in params
+    ) + b")"
+
+
+def _raw_body(part: Message) -> bytes:
+    payload = part.get_payload()
+    if isinstance(payload, list):
+        if part.get_content_type() == "message/rfc822":
+            return payload[0].as_bytes(policy=email.policy.SMTP)
+        raise ValueError("Multipart has no raw body")
+    # get_payload() перекодирует 8bit-текст по charset,
+    # а нам нужны исходные байты
+    return part._payload.encode("ascii", "surrogateescape")  # type: ignore[attr-defined]  # noqa:SLF001
+
+
+def bodystructure(part: Message) -> bytes:
+    """BODYSTRUCTURE для письма, разобранного email.message_from_bytes"""
+    if part.get_content_maintype() == "multipart":
+        children = b"".join(bodystructure(p) for p in part.get_payload())
+        return (
+            b"(" + children + b" " + _quote(part.get_content_subtype().upper())
+            + b" " + _params((part.get_params() or [])[1:])
+            + b" NIL NIL NIL)"
+        )
+
+    raw = _raw_body(part)
+    fields = [
+        _quote(part.get_content_maintype().upper()),
+        _quote(part.get_content_subtype().upper()),
+        _params((part.get_params() or [])[1:]),
+        b"NIL",
+        b"NIL",
+        _quote(str(part.get("Content-Transfer-Encoding", "7BIT")).upper()),
+        b"%d" % len(raw),
+    ]
+    if part.get_content_maintype() == "text":
+        fields.append(b"%d" % raw.count(b"\n"))
+    elif part.get_content_type() == "message/rfc822":
+        inner = part.get_payload()[0]
+        envelope = [_quote(inner["Date"]), _quote(inner["Subject"])]
+        fields.append(b"(" + b" ".join(envelope + [b"NIL"] * 8) + b")")
+        fields.append(bodystructure(inner))
+        fields.append(b"%d" % raw.count(b"\n"))
+
+    disposition = part.get_content_disposition()
+    if disposition:
+        fields.append(b"NIL")
+        fields.append(
+            b"(" + _quote(disposition.upper()) + b" " + _params(
+                (part.get_params(header="content-disposition") or [])[1:],
+            ) + b")",
+        )
+        fields.extend([b"NIL", b"NIL"])
+    return b"(" + b" ".join(fields) + b")"
+
+
+def find_part(message: Message, section: str) -> Message:
+    part = message
+    for number in section.split("."):
+        index = int(number)
+        if part.get_content_type() == "message/rfc822":
+            part = part.get_payload()[0]
+        if part.is_multipart():
+            part = part.get_payload()[index - 1]
+        elif index != 1:
+            raise ValueError(f"No section {section}")
+    return part
+
+
+@dataclass
+class StoredMessage:
+    uid: int
+    data: bytes
+    flags: set[bytes] = field(default_factory=set)
+
+    @cached_property
+    def headers(self) -> Message:
+        return email.parser.BytesHeaderParser().parsebytes(self.data)
+
+    @cached_property
+    def parsed(self) -> Message:
+        return email.message_from_bytes(self.data)
+
+    def section(self, section: str) -> bytes:
+        if not section:
+            return self.data
+        separator = b"\r\n\r\n" if b"\r\n\r\n" in self.data else b"\n\n"
+        header, _, text = self.data.partition(separator)
+        if section == "HEADER":
+            return header + separator
+        if section.startswith("HEADER.FIELDS"):
+            names = section.partition("(")[2].rstrip(")").upper().split()
+            lines = [
+                f"{name}: {value}\r\n"
+                for name, value in self.headers.items()
+                if name.upper() in names
+            ]
+            return "".join(lines).encode() + b"\r\n"
+        if section == "TEXT":
+            return text
+        return _raw_body(find_part(self.parsed, section))
+
+
+@dataclass
+class Stats:
+    connections: int = 0
+    commands: int = 0
+    bytes_sent: int = 0
+
+    def reset(self) -> None:
+        self.connections = self.commands = self.bytes_sent = 0
+
+
+class Mailbox:
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.messages: list[StoredMessage] = []
+        self.lock = threading.RLock()
+
+    def append(
+            self,
+            message: bytes | EmailMessage,
+            flags: tuple[bytes, ...] = (),
+    ) -> int:
+        if isinstance(message, EmailMessage):
+            message = message.as_bytes(policy=email.policy.SMTP)
+        with self.lock:
+            uid = self.uidnext
+            self.uidnext += 1
+            self.highestmodseq += 1
+            self.messages.append(StoredMessage(uid, message, set(flags)))
+            return uid
+
+    def expunge(self, uid: int) -> None:
+        with self.lock:
+            self.messages = [m for m in self.messages if m.uid != uid]
+            self.highestmodseq += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.messages.clear()
+            self.highestmodseq += 1
+
+    def parse_set(self, value: bytes, *, uid: bool) -> list[int]:
+        """Возвращает номера сообщений (с 1) для sequence set"""
+        if uid:
+            largest = self.messages[-1].uid if self.messages else 0
+        else:
+            largest = len(self.messages)
+        numbers: set[int] = set()
+        for part in value.split(b","):
+            start, _, end = part.partition(b":")
+            low = largest if start == b"*" else int(start)
+            high = low if not end else largest if end == b"*" else int(end)
+            low, high = min(low, high), max(low, high)
+            numbers.update(range(low, high + 1))
+
+        if not uid:
+            return sorted(n for n in numbers if 1 <= n <= largest)
+        return [
+            num for num, message in enumerate(self.messages, 1)
+            if message.uid in numbers
+        ]
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    server: "StandInServer"
+
+    def setup(self) -> None:
+        self.server.simulate_latency(3)  # TCP + TLS handshake
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.request = self.server.ssl_context.wrap_socket(
+            self.request, server_side=True,
+        )
+        super().setup()
+        self.server.stats.connections += 1
+
+    def send(self, data: bytes) -> None:
+        self.server.stats.bytes_sent += len(data)
+        self.wfile.write(data)
+
+    def untagged(self, data: bytes) -> None:
+        self.send(b"* " + data + b"\r\n")
+
+    def handle(self) -> None:
+        try:
+            self.serve()
+        except OSError:
+            log.debug("Client disconnected", exc_info=True)
+
+    def serve(self) -> None:
+        self.server.simulate_stall(b"GREETING")
+        self.untagged(b"OK IMAP4rev1 stand-in ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.rstrip(b"\r\n").partition(b" ")
+            command, _, arguments = rest.partition(b" ")
+            command = command.upper()
+            self.server.stats.commands += 1
+            self.server.simulate_latency()
+            use_uid = command == b"UID"
+            if use_uid:
+                command, _, arguments = arguments.partition(b" ")
+                command = command.upper()
+            self.server.simulate_stall(command)
+
+            method = getattr(self, f"do_{command.decode().lower()}", None)
+            if method is None:
+                self.send(tag + b" BAD unknown command\r\n")
+                continue
+            try:
+                result = method(tokenize(arguments), use_uid=use_uid)
+            except Exception:
+                log.exception("Stand-in failed on %r", line)
+                self.send(tag + b" BAD internal error\r\n")
+                continue
+            self.send(tag + b" OK " + command + b" completed\r\n")
+            self.wfile.flush()
+            if result is False:
+                return
+
+    # ##### COMMANDS ##### #
+    def do_capability(self, _args: list[TokenT], **_: bool) -> None:
+        self.untagged(b"CAPABILITY " + b" ".join(
+            c.encode() for c in self.server.capabilities
+        ))
+
+    def do_login(self, _args: list[TokenT], **_: bool) -> None:
+        pass
+
+    def do_noop(self, _args: list[TokenT], **_: bool) -> None:
+        pass
+
+    def do_select(self, _args: list[TokenT], **_: bool) -> None:
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            self.untagged(b"%d EXISTS" % len(mailbox.messages))
+            self.untagged(b"0 RECENT")
+            self.untagged(b"OK [UIDVALIDITY %d]" % mailbox.uidvalidity)
+            self.untagged(b"OK [UIDNEXT %d]" % mailbox.uidnext)
+            if "CONDSTORE" in self.server.capabilities:
+                self.untagged(
+                    b"OK [HIGHESTMODSEQ %d]" % mailbox.highestmodseq,
+                )
+            self.untagged(rb"FLAGS (\Seen \Deleted)")
+
+    def do_status(self, args: list[TokenT], **_: bool) -> None:
+        name, items = args[0], args[1]
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            values = {
+                b"MESSAGES": len(mailbox.messages),
+                b"UIDNEXT": mailbox.uidnext,
+                b"UIDVALIDITY": mailbox.uidvalidity,
+                b"UNSEEN": sum(
+                    rb"\Seen" not in message.flags
+                    for message in mailbox.messages
+                ),
+            }
+            if "CONDSTORE" in self.server.capabilities:
+                values[b"HIGHESTMODSEQ"] = mailbox.highestmodseq
+        response = [
+            b"%s %d" % (item.upper(), values[item.upper()])
+            for item in flatten(items)  # type: ignore[arg-type]
+        ]
+        self.untagged(
+            b"STATUS " + name + b" (" + b" ".join(response) + b")",  # type: ignore[operator]
+        )
+
+    def _readable(self, timeout: float) -> bool:
+        if self.request.pending():
+            return True
+        return bool(select.select([self.request], [], [], timeout)[0])
+
+    def do_idle(self, _args: list[TokenT], **_: bool) -> None:
+        mailbox = self.server.mailbox
+        known = len(mailbox.messages)
+        self.send(b"+ idling\r\n")
+        while True:
+            if self._readable(0.05) and self.rfile.readline().strip().upper() in (
+                b"DONE", b"",
+            ):
+                return
+            with mailbox.lock:
+                if len(mailbox.messages) != known:
+                    known = len(mailbox.messages)
+                    self.untagged(b"%d EXISTS" % known)
+
+    def do_logout(self, _args: list[TokenT], **_: bool) -> bool:
+        self.untagged(b"BYE stand-in logging out")
+        return False
+
+    def do_search(
+            self, args: list[TokenT], *, use_uid: bool,
+    ) -> None:
+        criteria = flatten(args)
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            found = [
+                message.uid if use_uid else num
+                for num, message in enumerate(mailbox.messages, 1)
+                if self._matches(message, criteria, num)
+            ]
+        self.untagged(b"SEARCH" + b"".join(b" %d" % n for n in found))
+
+    def _matches(
+            self, message: StoredMessage, criteria: list[bytes], num: int,
+    ) -> bool:
+        items = iter(criteria)
+        for item in items:
+            key = item.upper()
+            if key == b"FROM":
+                value = next(items).decode().lower()
+                if value not in str(message.headers["From"]).lower():
+                    return False
+            elif key == b"UNSEEN":
+                if rb"\Seen" in message.flags:
+                    return False
+            elif key == b"SEEN":
+                if rb"\Seen" not in message.flags:
+                    return False
+            elif key == b"UID":
+                numbers = self.server.mailbox.parse_set(next(items), uid=True)
+                if num not in numbers:
+                    return False
+        return True
+
+    def do_fetch(
+            self, args: list[TokenT], *, use_uid: bool,
+    ) -> None:
+        sequence, items = args[0], args[1]
+        if not isinstance(items, list):
+            items = [items]
+        names = [item.upper() for item in flatten(items)]
+        if use_uid and b"UID" not in names:
+            names.insert(0, b"UID")
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            for num in mailbox.parse_set(sequence, uid=use_uid):  # type: ignore[arg-type]
+                message = mailbox.messages[num - 1]
+                parts = [self._fetch_item(message, name) for name in names]
+                self.send(b"* %d FETCH (" % num + b" ".join(parts) + b")\r\n")
+
+    def _fetch_item(self, message: StoredMessage, name: bytes) -> bytes:
+        if name == b"UID":
+            return b"UID %d" % message.uid
+        if name == b"FLAGS":
+            return b"FLAGS (" + b" ".join(sorted(message.flags)) + b")"
+        if name == b"RFC822.SIZE":
+            return b"RFC822.SIZE %d" % len(message.data)
+        if name == b"BODYSTRUCTURE":
+            return b"BODYSTRUCTURE " + bodystructure(message.parsed)
+        if name == b"RFC822":
+            message.flags.add(rb"\Seen")
+            return name + self._literal(message.data)
+        body = BODY_ITEM_RE.match(name)
+        if body is None:
+            raise ValueError(f"Unsupported FETCH item {name!r}")
+
+        peek, section, start, length = body.groups()
+        if not peek:
+            message.flags.add(rb"\Seen")
+        data = message.section(section.decode())
+        response_name = b"BODY[" + section + b"]"
+        if start is not None:
+            data = data[int(start):int(start) + int(length)]
+            response_name += b"<" + start + b">"
+        return response_name + self._literal(data)
+
+    @staticmethod
+    def _literal(data: bytes) -> bytes:
+        return b" {%d}\r\n" % len(data) + data
+
+    def do_store(
+            self, args: list[TokenT], *, use_uid: bool,
+    ) -> None:
+        sequence, action = args[0], args[1].upper()  # type: ignore[union-attr]
+        flags = set(flatten(args[2:]))
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            for num in mailbox.parse_set(sequence, uid=use_uid):  # type: ignore[arg-type]
+                message = mailbox.messages[num - 1]
+                mailbox.highestmodseq += 1
+                if action.startswith(b"+"):
+                    message.flags |= flags
+                elif action.startswith(b"-"):
+                    message.flags -= flags
+                else:
+                    message.flags = flags
+                self.untagged(
+                    b"%d FETCH (FLAGS (" % num
+                    + b" ".join(sorted(message.flags)) + b"))",
+                )
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+            self,
+            ssl_context: ssl.SSLContext,
+            *,
+            latency: float,
+            capabilities: tuple[str, ...],
+    ):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.ssl_context = ssl_context
+        self.latency = latency
+        self.capabilities = capabilities
+        self.mailbox = Mailbox()
+        self.stats = Stats()
+        # команды, на которые сервер "зависает": {команда: [паузы]}
+        self.stalls: dict[bytes, list[float]] = {}
+        self._stalls_lock = threading.Lock()
+
+    def simulate_latency(self, round_trips: int = 1) -> None:
+        if self.latency:
+            time.sleep(self.latency * round_trips)
+
+    def stall(self, command: bytes, *pauses: float) -> None:
+        """Следующие len(pauses) команд command ответят с паузой"""
+        with self._stalls_lock:
+            self.stalls.setdefault(command.upper(), []).extend(pauses)
+
+    def simulate_stall(self, command: bytes) -> None:
+        with self._stalls_lock:
+            pauses = self.stalls.get(command)
+            pause = pauses.pop(0) if pauses else 0.0
+        if pause:
+            time.sleep(pause)
+
+
+class IMAPStandIn:
+    """Запускает StandInServer в фоновом потоке.
+
+    latency -- искусственная задержка одного round trip в секундах.
+    """
+
+    def __init__(
+            self,
+            *,
+            latency: float = 0.0,
+            capabilities: tuple[str, ...] = CAPABILITIES,
+    ):
+        self.latency = latency
+        self.capabilities = capabilities
+        self._tmp = tempfile.TemporaryDirectory(prefix="imap_standin_")
+        self._server: StandInServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def server(self) -> StandInServer:
+        if self._server is None:
+            raise RuntimeError("Stand-in is not started")
+        return self._server
+
+    @property
+    def host(self) -> str:
+        return self.server.server_address[0]  # type: ignore[return-value]
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def mailbox(self) -> Mailbox:
+        return self.server.mailbox
+
+    @property
+    def stats(self) -> Stats:
+        return self.server.stats
+
+    def start(self) -> None:
+        certfile, keyfile = generate_certificate(Path(self._tmp.name))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self._server = StandInServer(
+            context, latency=self.latency, capabilities=self.capabilities,
+        )
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self._tmp.cleanup()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+
+def configure(standin: IMAPStandIn) -> None:
+    """Направляет autopublisher.config на запущенный stand-in"""
+    config.mail_server = standin.host
+    config.mail_port = standin.port
+    config.mail_login = "bench@localhost"
+    config.mail_passwd = "bench"  # noqa:S105
+
+
+def iter_latencies(latencies: list[float]) -> Iterator[tuple[str, float]]:
+    ordered = sorted(latencies)
+    yield "mean", sum(ordered) / len(ordered)
+    for percentile in (50, 95, 99):
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        yield f"p{percentile}", ordered[index]
@@ -0,0 +1,470 @@
+"""Синтетические вложения и письма для бенчмарков:
+.docx, .jpg, .pdf, .zip, .rar и письма с ними
+"""
+
+import io
+import random
+import re
+import struct
+import time
+import zipfile
+import zlib
+from email.message import EmailMessage
+from xml.sax.saxutils import escape
+
+from PIL import Image as PILImage
+from PIL import ImageDraw
+
+
+DOCX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""  # noqa:E501
+
+DOCX_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""  # noqa:E501
+
+DOCX_DOCUMENT = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+<w:body>{body}</w:body>
+</w:document>"""
+
+DOCX_PARAGRAPH = (
+    '<w:p><w:r><w:rPr><w:rFonts w:ascii="Times New Roman" '
+    'w:hAnsi="Times New Roman"/></w:rPr><w:t>{text}</w:t></w:r></w:p>'
+)
+
+DOCX_TABLE_ROW = (
+    '<w:tr><w:trPr><w:trHeight w:val="284"/></w:trPr>{cells}</w:tr>'
+)
+DOCX_TABLE_CELL = (
+    '<w:tc><w:p><w:r><w:rPr><w:rFonts w:ascii="{font}" w:hAnsi="{font}"/>'
+    "</w:rPr><w:t>{text}</w:t></w:r></w:p>{table}</w:tc>"
+)
+
+DOCX_MIME_TYPE = (
+    "application",
+    "vnd.openxmlformats-officedocument.wordprocessingml.document",
+)
+
+# шрифт, который documents.document.format_rasp_docx меняет на обычный
+RASP_FONT = "Izhitsa"
+
+NEWS_SENTENCE = (
+    "В администрации округа прошло совещание, посвященное подготовке "
+    "к празднику, в нем приняли участие руководители учреждений."
+)
+
+
+def make_docx(
+        paragraphs: list[str],
+        body_xml: str = "",
+        media: dict[str, bytes] | None = None,
+        parts: dict[str, str] | None = None,
+) -> bytes:
+    """Минимальный .docx с абзацами paragraphs, произвольным
+    дополнительным содержимым body_xml (например, таблицами),
+    файлами media в word/media/ и частями parts в word/
+    (например, styles.xml)
+    """
+    body = "".join(
+        DOCX_PARAGRAPH.format(text=escape(text)) for text in paragraphs
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        docx.writestr("_rels/.rels", DOCX_RELS)
+        docx.writestr(
+            "word/document.xml",
+            DOCX_DOCUMENT.format(body=body + body_xml),
+        )
+        for name, data in (media or {}).items():
+            docx.writestr(f"word/media/{name}", data)
+        for name, xml in (parts or {}).items():
+            docx.writestr(f"word/{name}", xml)
+    return buffer.getvalue()
+
+
+def make_news_docx(title: str, sentences: int = 8) -> bytes:
+    return make_docx([title, *[NEWS_SENTENCE] * sentences])
+
+
+# куски текста новостей: выделение, знаки, которые html2text экранирует,
+# и длинные слова, которые он переносит
+NEWS_WORDS = (
+    "совещание", "округа", "1. Пункт", "- тире", "* звездочка", "+ плюс",
+    "#хештег", "a_b", "R&D", "<тег>", '"кавычки"', "«елочки»", "\\путь",
+    "`код`", "[скобки]", "2024.", "!", "?", ".", ",", "---", "нераз\u00adрывный",
+    "дефис-через-дефис", "электро\u2011станция", "неразрывный\u00a0пробел",
+    "очень-длинное-слово-через-дефисы-которое-html2text-переносит",
+)
+NEWS_RUN = "<w:r><w:rPr>{props}</w:rPr>{content}</w:r>"
+NEWS_RUN_PROPS = {"bold": "<w:b/>", "italic": "<w:i/>", "strike": "<w:strike/>"}
+# доли оформленных прогонов в make_formatted_news_docx
+NEWS_RUN_SHARES = {"bold": 0.3, "italic": 0.3, "strike": 0.1}
+NEWS_WRAPPED_SHARE = 0.1
+NEWS_BOOKMARK_SHARE = 0.05
+# стили с нестандартными id: заголовок и полужирный узнаются по имени
+NEWS_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+<w:style w:type="paragraph" w:styleId="a1"><w:name w:val="heading 3"/></w:style>
+<w:style w:type="paragraph" w:styleId="a2"><w:name w:val="Normal"/></w:style>
+<w:style w:type="character" w:styleId="a3"><w:name w:val="Strong"/></w:style>
+</w:styles>"""
+# обертки прогонов, которые mammoth пропускает или раскрывает
+NEWS_RUN_WRAPPERS = (
+    '<w:hyperlink w:anchor="news">{}</w:hyperlink>',
+    "<w:hyperlink>{}</w:hyperlink>",
+    '<w:ins w:id="1" w:author="A">{}</w:ins>',
+    '<w:del w:id="2" w:author="A">{}</w:del>',
+    "<w:smartTag>{}</w:smartTag>",
+)
+
+
+def make_news_run(
+        text: str,
+        *,
+        bold: bool = False,
+        italic: bool = False,
+        strike: bool = False,
+        style: str | None = None,
+) -> str:
+    """Прогон текста с оформлением, \\n -- перенос строки, \\t -- табуляция"""
+    content = "".join(
+        {"\n": "<w:br/>", "\t": "<w:tab/>"}.get(
+            part, f'<w:t xml:space="preserve">{escape(part)}</w:t>',
+        )
+        for part in re.split(r"([\n\t])", text) if part
+    )
+    props = "".join(
+        NEWS_RUN_PROPS[name]
+        for name, value in (
+            ("bold", bold), ("italic", italic), ("strike", strike),
+        )
+        if value
+    )
+    if style:
+        props += f'<w:rStyle w:val="{style}"/>'
+    return NEWS_RUN.format(props=props, content=content)
+
+
+def make_news_paragraph(runs: list[str], style: str | None = None) -> str:
+    props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    return f"<w:p>{props}{''.join(runs)}</w:p>"
+
+
+def make_formatted_news_docx(paragraphs: int = 12, *, seed: int = 0) -> bytes:
+    """Новость со случайным оформлением: заголовки, полужирный,
+    курсив, зачеркнутый, переносы строк, пустые абзацы и закладки
+    """
+    rng = random.Random(seed)
+    body = []
+    for _ in range(paragraphs):
+        runs = []
+        for _ in range(rng.randint(0, 12)):
+            words = rng.choices(NEWS_WORDS, k=rng.randint(1, 6))
+            text = rng.choice(("", " ", "  ")).join(words)
+            text = rng.choice(("", " ", "\t", "\n")) + text
+            text += rng.choice(("", " ", " ", "\n", ". "))
+            run = make_news_run(
+                text,
+                style=rng.choice((None,) * 9 + ("a3",)),
+                **{
+                    name: rng.random() < share
+                    for name, share in NEWS_RUN_SHARES.items()
+                },
+            )
+            if rng.random() < NEWS_WRAPPED_SHARE:
+                run = rng.choice(NEWS_RUN_WRAPPERS).format(run)
+            runs.append(run)
+            if rng.random() < NEWS_BOOKMARK_SHARE:
+                runs.append(
+                    f'<w:bookmarkStart w:id="0" w:name="b{len(runs)}"/>'
+                    '<w:bookmarkEnd w:id="0"/>',
+                )
+        style = rng.choice(
+            (None,) * 8 + ("Heading1", "Heading2", "Title", "a1", "a2"),
+        )
+        body.append(make_news_paragraph(runs, style))
+    return make_docx([], "".join(body), parts={"styles.xml": NEWS_STYLES})
+
+
+def make_table(
+        rows: int, columns: int, font: str, *, nested: bool = False,
+) -> str:
+    """Таблица rows x columns шрифтом font, с nested в первой ячейке
+    каждой строки вложена таблица 2 x 2
+    """
+    return "<w:tbl>" + "".join(
+        DOCX_TABLE_ROW.format(cells="".join(
+            DOCX_TABLE_CELL.format(
+                font=font,
+                text=f"Занятие {row}.{column}",
+                table=make_table(2, 2, font) if nested and not column else "",
+            )
+            for column in range(columns)
+        ))
+        for row in range(rows)
+    ) + "</w:tbl>"
+
+
+def make_rasp_docx(
+        rows: int = 30,
+        columns: int = 5,
+        *,
+        images: int = 0,
+        tables: int = 1,
+        nested: bool = False,
+) -> bytes:
+    """Расписание: заголовок, tables таблиц rows x columns шрифтом
+    RASP_FONT и images картинок (логотипы, фотографии) в word/media/
+    """
+    body = "".join(
+        make_table(rows, columns, RASP_FONT, nested=nested)
+        for _ in range(tables)
+    )
+    media = {
+        f"image{i + 1}.jpeg": make_jpeg(1200, 800, seed=i)
+        for i in range(images)
+    }
+    return make_docx(["Расписание занятий"], body, media)
+
+
+def make_jpeg(width: int, height: int, *, seed: int = 0) -> bytes:
+    """JPEG с шумом, чтобы размер файла был похож на фотографию"""
+    noise = PILImage.effect_noise((width, height), 64 + seed % 32)
+    image = PILImage.merge("RGB", (noise, noise.rotate(90), noise))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+RASP_PAGE_MARGIN = 0.08
+RASP_PAGE_ROWS = 30
+RASP_PAGE_COLUMNS = 5
+
+
+def make_rasp_page(
+        width: int = 849, height: int = 1200, *, seed: int = 0,
+) -> bytes:
+    """PNG страницы расписания, как после convert: таблица с текстом
+    на белом поле. Рисуем в 4 раза крупнее и уменьшаем, чтобы края
+    линий и букв были сглажены, как при рендере Ghostscript.
+    """
+    rng = random.Random(seed)
+    scale = 4
+    image = PILImage.new("RGB", (width * scale, height * scale), "white")
+    draw = ImageDraw.Draw(image)
+    left, top = int(width * RASP_PAGE_MARGIN), int(height * RASP_PAGE_MARGIN)
+    right, bottom = width - left, height - top
+    row_height = (bottom - top) / RASP_PAGE_ROWS
+    column_width = (right - left) / RASP_PAGE_COLUMNS
+    for row in range(RASP_PAGE_ROWS + 1):
+        y = int((top + row * row_height) * scale)
+        draw.line((left * scale, y, right * scale, y), fill="black", width=3)
+    for column in range(RASP_PAGE_COLUMNS + 1):
+        x = int((left + column * column_width) * scale)
+        draw.line((x, top * scale, x, bottom * scale), fill="black", width=3)
+    for row in range(RASP_PAGE_ROWS):
+        for column in range(RASP_PAGE_COLUMNS):
+            x = int((left + column * column_width + 4) * scale)
+            y = int((top + row * row_height + 4) * scale)
+            # "слова": черные штрихи разной длины высотой со строчную букву
+            for _ in range(rng.randrange(1, 4)):
+                length = rng.randrange(8, 40) * scale
+                draw.rectangle(
+                    (x, y, x + length, y + 8 * scale), fill="black",
+                )
+                x += length + 4 * scale
+    image = image.resize((width, height), PILImage.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+PHOTO_EXIF_ORIENTATION = 0x0112
+PHOTO_EXIF_SOFTWARE = 0x0131
+PHOTO_THUMBNAIL_SIZE = (640, 480)
+
+
+def make_photo(width: int, height: int, *, seed: int = 0) -> bytes:
+    """JPEG, похожий на фотографию с телефона: плавные пятна с мелким
+    шумом, качество 95, EXIF с поворотом и большое превью в APP2
+    """
+    rng = random.Random(seed)
+    small = PILImage.new("RGB", (16, 12))
+    small.putdata([
+        (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        for _ in range(16 * 12)
+    ])
+    image = small.resize((width, height), PILImage.Resampling.BICUBIC)
+    noise = PILImage.effect_noise((width, height), 40).convert("RGB")
+    image = PILImage.blend(image, noise, 0.3)
+    exif = PILImage.Exif()
+    exif[PHOTO_EXIF_ORIENTATION] = 6
+    exif[PHOTO_EXIF_SOFTWARE] = "camera " * 100
+    thumbnail = io.BytesIO()
+    image.resize(PHOTO_THUMBNAIL_SIZE).save(thumbnail, "JPEG", quality=90)
+    buffer = io.BytesIO()
+    image.save(
+        buffer, "JPEG", quality=95, exif=exif.tobytes(),
+        extra=b"\xff\xe2" + struct.pack(">H", 2 + min(
+            len(thumbnail.getvalue()), 65533,
+        )) + thumbnail.getvalue()[:65533],
+    )
+    return buffer.getvalue()
+
+
+def make_pdf(pages: int, *, width: int = 595, height: int = 842) -> bytes:
+    """PDF из pages страниц A4 (в пунктах) с таблицей-сеткой"""
+    images = []
+    for page in range(pages):
+        image = PILImage.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+        for y in range(40, height - 40, 20):
+            draw.line((40, y, width - 40, y), fill="black")
+        for x in range(40, width - 40, 100):
+            draw.line((x, 40, x, height - 40), fill="black")
+        draw.text((50, 20), f"Page {page + 1}", fill="black")
+        images.append(image)
+    buffer = io.BytesIO()
+    images[0].save(
+        buffer, "PDF", resolution=72, save_all=True, append_images=images[1:],
+    )
+    return buffer.getvalue()
+
+
+def make_zip(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _rar_block(head_type: int, flags: int, body: bytes) -> bytes:
+    header = struct.pack("<BHH", head_type, flags, 7 + len(body)) + body
+    return struct.pack("<H", zlib.crc32(header) & 0xFFFF) + header
+
+
+def make_rar(files: dict[str, bytes]) -> bytes:
+    """RAR 4.x без сжатия (метод store): собрать настоящий RAR
+    без утилиты rar можно только так
+    """
+    now = time.localtime()
+    dos_time = (
+        (now.tm_year - 1980) << 25 | now.tm_mon << 21 | now.tm_mday << 16
+        | now.tm_hour << 11 | now.tm_min << 5 | now.tm_sec // 2
+    )
+    blocks = [b"Rar!\x1a\x07\x00", _rar_block(0x73, 0, bytes(6))]
+    for name, data in files.items():
+        encoded = name.encode()
+        body = struct.pack(
+            "<IIBIIBBHI",
+            len(data), len(data), 3, zlib.crc32(data), dos_time,
+            20, 0x30, len(encoded), 0o100644 << 16,
+        ) + encoded
+        # 0x8000: за заголовком идут данные, 0x0200: имя в UTF-8
+        blocks += [_rar_block(0x74, 0x8000 | 0x0200, body), data]
+    blocks.append(_rar_block(0x7B, 0x4000, b""))
+    return b"".join(blocks)
+
+
+def make_mail(
+        mail_from: str,
+        subject: str,
+        *,
+        html: str = "<p>Текст новости во вложении</p>",
+        attachments: dict[str, bytes] | None = None,
+) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = mail_from
+    message["To"] = "bench@localhost"
+    message["Subject"] = subject
+    message["Date"] = "Mon, 01 Jan 2024 10:00:00 +0300"
+    message.set_content(html, subtype="html")
+    for filename, data in (attachments or {}).items():
+        maintype, subtype = ATTACHMENT_TYPES.get(
+            filename.rsplit(".", 1)[-1].lower(),
+            ("application", "octet-stream"),
+        )
+        message.add_attachment(
+            data, maintype=maintype, subtype=subtype, filename=filename,
+        )
+    return message
+
+
+ATTACHMENT_TYPES = {
+    "docx": DOCX_MIME_TYPE,
+    "jpg": ("image", "jpeg"),
+    "zip": ("application", "zip"),
+    "rar": ("application", "x-rar-compressed"),
+}
+
+
+def make_forwarded_news(mail_from: str, number: int) -> EmailMessage:
+    """Пересланная новость: текст только в HTML теле письма"""
+    paragraphs = "".join(
+        f"<p>{escape(NEWS_SENTENCE)}</p>" for _ in range(8)
+    )
+    html = (
+        "<div>-------- Пересылаемое сообщение --------</div>"
+        f"<div><b>Новость номер {number}</b></div>{paragraphs}"
+    )
+    return make_mail(mail_from, f"Fwd: Новость {number}", html=html)
+
+
+# разметка, которая встречается в письмах почтовых программ
+MAIL_HTML_HEAD = (
+    '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Письмо</title>'
+    "<style>p {{ margin: 0 }} /* <b> */</style></head><body>{body}"
+    "</body></html>"
+)
+MAIL_INLINE_TAGS = ("b", "i", "u", "strong", "em", "s", "span", "font", "a")
+MAIL_BLOCK_TAGS = ("div", "p", "blockquote", "h1", "h3")
+MAIL_WORDS = (
+    *NEWS_WORDS, "&nbsp;", "&amp;", "&laquo;", "&raquo;", "&mdash;",
+    "&#8212;", "&#x41;", "&quot;", "&lt;", "&copy;", "&unknown;", "& ",
+    "a < b", "<!-- комментарий -->", "<![if !supportLists]>", "<![endif]>",
+    "<br>", "<br/>", "<hr>", '<img src="cid:image001.png" alt="Логотип">',
+    "\n", "  ", "\t",
+)
+MAIL_NESTED_SHARE = 0.3
+MAIL_TABLE_SHARE = 0.05
+
+
+def make_mail_inline(rng: random.Random, depth: int) -> str:
+    words = rng.choices(MAIL_WORDS, k=rng.randint(1, 12))
+    text = "".join(
+        f"{rng.choice(('', ' ', ' ', '  '))}{word}" for word in words
+    )
+    if depth and rng.random() < MAIL_NESTED_SHARE:
+        tag = rng.choice(MAIL_INLINE_TAGS)
+        attrs = ' href="https://example.com/?a=1&amp;b=2"' if tag == "a" else ""
+        text += f"<{tag}{attrs}>{make_mail_inline(rng, depth - 1)}</{tag}>"
+        text += make_mail_inline(rng, 0)
+    return text
+
+
+def make_mail_html(blocks: int = 20, *, seed: int = 0) -> str:
+    """HTML тела письма со случайной разметкой: блоки, выделение,
+    ссылки, картинки, сущности, комментарии, цитаты и таблицы
+    """
+    rng = random.Random(seed)
+    body = []
+    for _ in range(blocks):
+        if rng.random() < MAIL_TABLE_SHARE:
+            cells = "".join(
+                f"<td>{make_mail_inline(rng, 1)}</td>" for _ in range(2)
+            )
+            body.append(f"<table><tr>{cells}</tr></table>")
+            continue
+        tag = rng.choice(MAIL_BLOCK_TAGS)
+        body.append(f"<{tag}>{make_mail_inline(rng, 2)}</{tag}>")
+        if rng.random() < MAIL_NESTED_SHARE:
+            body.append(make_mail_inline(rng, 1))
+    return MAIL_HTML_HEAD.format(body="\n".join(body))
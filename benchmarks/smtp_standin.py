@@ -0,0 +1,133 @@
+"""Локальная замена SMTP-сервера для бенчмарков.
+
+Принимает письма по SMTP (HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP,
+QUIT, без TLS и авторизации) и кладет их в Mailbox IMAP stand-in,
+как это сделал бы почтовый сервер. Так письма для бенчмарков
+проходят тот же путь, что и настоящие: отправка, доставка, загрузка.
+"""
+
+import logging
+import smtplib
+import socketserver
+import threading
+from email.message import EmailMessage
+from types import TracebackType
+from typing import Self
+
+from benchmarks.imap_standin import Mailbox
+
+
+log = logging.getLogger(__name__)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    server: "SMTPServer"
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self) -> None:
+        try:
+            self.serve()
+        except OSError:
+            log.debug("SMTP client disconnected", exc_info=True)
+
+    def serve(self) -> None:
+        self.reply("220 smtp stand-in ready")
+        recipients: list[str] = []
+        while line := self.rfile.readline():
+            command, _, argument = line.decode().rstrip("\r\n").partition(" ")
+            command = command.upper()
+            if command in ("HELO", "EHLO"):
+                self.reply("250 smtp stand-in")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                recipients.append(argument)
+                self.reply("250 OK")
+            elif command == "DATA":
+                if not recipients:
+                    self.reply("503 RCPT first")
+                    continue
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.server.deliver(self.read_data())
+                self.reply("250 OK delivered")
+            elif command in ("RSET", "NOOP"):
+                recipients = [] if command == "RSET" else recipients
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def read_data(self) -> bytes:
+        lines = []
+        while (line := self.rfile.readline()) not in (b".\r\n", b".\n", b""):
+            # dot-stuffing, RFC 5321, раздел 4.5.2
+            lines.append(line[1:] if line.startswith(b".") else line)
+        return b"".join(lines)
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: Mailbox):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.mailbox = mailbox
+        self.delivered = 0
+
+    def deliver(self, data: bytes) -> None:
+        self.mailbox.append(data)
+        self.delivered += 1
+
+
+class SMTPStandIn:
+    """Запускает SMTPServer, доставляющий письма в mailbox"""
+
+    def __init__(self, mailbox: Mailbox):
+        self.mailbox = mailbox
+        self._server: SMTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def server(self) -> SMTPServer:
+        if self._server is None:
+            raise RuntimeError("Stand-in is not started")
+        return self._server
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def send(self, messages: list[EmailMessage]) -> None:
+        """Отправляет письма одной SMTP-сессией"""
+        with smtplib.SMTP("127.0.0.1", self.port) as smtp:
+            for message in messages:
+                smtp.send_message(message)
+
+    def start(self) -> None:
+        self._server = SMTPServer(self.mailbox)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.stop()
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+
+FIXTURES = Path(__file__).parent / "fixtures"
+# файлы, которые быстрый разбор не поддерживает и отдает
+# прежней библиотеке (html2text, mammoth)
+FALLBACK_PREFIX = "fallback_"
+
+
+def fixture_files(folder: str, suffix: str) -> list[Path]:
+    """Файлы fixtures/folder, которые быстрый разбор должен
+    читать так же, как прежняя библиотека
+    """
+    return [
+        path for path in sorted((FIXTURES / folder).glob(f"*{suffix}"))
+        if not path.name.startswith(FALLBACK_PREFIX)
+    ]
+
+
+def fallback_files(folder: str, suffix: str) -> list[Path]:
+    return sorted((FIXTURES / folder).glob(f"{FALLBACK_PREFIX}*{suffix}"))
+
+
+def fixture_id(path: Path) -> str:
+    return path.stem
@@ -0,0 +1,125 @@
+import random
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from autopublisher.documents import archive as archive_module
+from autopublisher.documents.archive import (
+    ArchiveError,
+    ArchiveMember,
+    ExtractLimits,
+    extract_archive,
+    zip_members,
+)
+
+
+LIMITS = ExtractLimits(max_size=100_000, max_members=5, max_ratio=20.0)
+
+CENTRAL_HEADER_SIGNATURE = b"PK\x01\x02"
+# смещение несжатого размера в записи центрального каталога zip
+CENTRAL_HEADER_SIZE_AT = 24
+
+
+def make_zip(path: Path, files: dict[str, bytes]) -> Path:
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return path
+
+
+def folder_files(folder: Path) -> dict[str, bytes]:
+    return {
+        path.name: path.read_bytes()
+        for path in folder.iterdir() if path.suffix != ".zip"
+    }
+
+
+def random_bytes(size: int, seed: int = 0) -> bytes:
+    # почти не сжимается, как фотографии
+    return random.Random(seed).randbytes(size)
+
+
+def test_extracts_only_needed_files(tmp_path: Path) -> None:
+    files = {
+        "news/Новость.docx": random_bytes(3000, 1),
+        "news/photos/IMG_1.JPG": random_bytes(5000, 2),
+        "scans/scan.tif": random_bytes(5000, 3),
+        "Thumbs.db": b"thumbs",
+    }
+    archive = make_zip(tmp_path / "news.zip", files)
+    result = extract_archive(archive, tmp_path, limits=LIMITS)
+
+    assert result.files == [tmp_path / "Новость.docx", tmp_path / "IMG_1.JPG"]
+    assert result.skipped == ["scans/scan.tif", "Thumbs.db"]
+    assert folder_files(tmp_path) == {
+        "Новость.docx": files["news/Новость.docx"],
+        "IMG_1.JPG": files["news/photos/IMG_1.JPG"],
+    }
+
+
+@pytest.mark.parametrize(("files", "error"), [
+    ({f"{i}.jpg": random_bytes(100, i) for i in range(6)}, "Too many files"),
+    ({"big.jpg": random_bytes(100_001)}, "Too large"),
+    # zip-бомба: нули сжимаются в сотни раз
+    ({"photo.jpg": bytes(50_000)}, "compression ratio"),
+], ids=["members", "size", "ratio"])
+def test_rejects_by_listing(
+        tmp_path: Path, files: dict[str, bytes], error: str,
+) -> None:
+    archive = make_zip(tmp_path / "news.zip", {
+        "news.docx": random_bytes(100), **files,
+    })
+    with pytest.raises(ArchiveError, match=error):
+        extract_archive(archive, tmp_path, limits=LIMITS)
+    assert folder_files(tmp_path) == {}
+
+
+def test_cleanup_keeps_existing_files(tmp_path: Path) -> None:
+    archive = make_zip(tmp_path / "news.zip", {
+        "a.jpg": random_bytes(1000, 1),
+        "news.docx": random_bytes(1000, 2),
+        "b.jpg": random_bytes(1000, 3),
+    })
+    # размер b.jpg в оглавлении (последняя запись) врет
+    data = bytearray(archive.read_bytes())
+    size_at = data.rindex(CENTRAL_HEADER_SIGNATURE) + CENTRAL_HEADER_SIZE_AT
+    data[size_at:size_at + 4] = (999).to_bytes(4, "little")
+    archive.write_bytes(data)
+    (tmp_path / "news.docx").write_bytes(b"saved earlier")
+
+    with pytest.raises(ArchiveError, match="Can't extract"):
+        extract_archive(archive, tmp_path, limits=LIMITS)
+    # до extract_archive news.docx уже был, его перезаписали,
+    # но не удалили, a.jpg и b.jpg созданы заново и удалены
+    assert sorted(folder_files(tmp_path)) == ["news.docx"]
+
+
+def test_size_budget(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # как в испорченном .rar: оглавление занижает размер файла
+    def understated_members(archive: Path) -> list[ArchiveMember]:
+        return [
+            ArchiveMember(member.name, member.size // 2, member.compress_size)
+            for member in zip_members(archive)
+        ]
+
+    _, open_members = archive_module.ARCHIVE_READERS[".zip"]
+    monkeypatch.setitem(
+        archive_module.ARCHIVE_READERS, ".zip",
+        (understated_members, open_members),
+    )
+    archive = make_zip(tmp_path / "news.zip", {
+        "a.jpg": random_bytes(1000, 1), "b.jpg": random_bytes(1000, 2),
+    })
+    with pytest.raises(ArchiveError, match="larger than its listed size"):
+        extract_archive(archive, tmp_path, limits=LIMITS)
+    assert folder_files(tmp_path) == {}
+
+
+def test_bad_archive(tmp_path: Path) -> None:
+    archive = tmp_path / "news.zip"
+    archive.write_bytes(b"PK\x03\x04 not a zip")
+    with pytest.raises(ArchiveError, match=r"Can't read news\.zip"):
+        extract_archive(archive, tmp_path, limits=LIMITS)
@@ -0,0 +1,97 @@
+import os
+from pathlib import Path
+
+from autopublisher.publish.cache import ArtifactCache
+
+
+# три записи по 400 КБ не помещаются в 1 МБ
+ENTRY_SIZE = 400 * 1024
+
+
+def make_file(path: Path, data: bytes) -> Path:
+    path.write_bytes(data)
+    return path
+
+
+def make_entry(cache: ArtifactCache, tmp_path: Path, name: str) -> str:
+    png = make_file(tmp_path / f"{name}.png", name.encode() * ENTRY_SIZE)
+    key = cache.key("rasterize_pdf", [png])
+    cache.put(key, [png])
+    return key
+
+
+def set_read_time(cache: ArtifactCache, key: str, read_time: int) -> None:
+    os.utime(cache.folder / key, (read_time, read_time))
+
+
+def test_call_restores_from_cache(tmp_path: Path) -> None:
+    cache = ArtifactCache(folder=tmp_path / "cache", max_size_mb=1)
+    pdf = make_file(tmp_path / "rasp.pdf", b"%PDF-1.7")
+    built: list[Path] = []
+
+    def build() -> list[Path]:
+        page = make_file(tmp_path / f"page{len(built)}.png", b"png")
+        built.append(page)
+        return [page]
+
+    def targets(count: int) -> list[Path]:
+        return [tmp_path / f"restored{i}.png" for i in range(count)]
+
+    assert cache.call("rasterize_pdf", [pdf], build, targets, dpi=150) == [
+        tmp_path / "page0.png",
+    ]
+    restored = cache.call("rasterize_pdf", [pdf], build, targets, dpi=150)
+    assert restored == [tmp_path / "restored0.png"]
+    assert restored[0].read_bytes() == b"png"
+    assert len(built) == 1
+
+    # другие параметры и другое содержимое входного файла -- промах
+    cache.call("rasterize_pdf", [pdf], build, targets, dpi=300)
+    pdf.write_bytes(b"%PDF-1.7 changed")
+    cache.call("rasterize_pdf", [pdf], build, targets, dpi=150)
+    assert len(built) == 3  # noqa:PLR2004
+
+
+def test_evicts_least_recently_read(tmp_path: Path) -> None:
+    cache = ArtifactCache(folder=tmp_path / "cache", max_size_mb=1)
+    first = make_entry(cache, tmp_path, "a")
+    second = make_entry(cache, tmp_path, "b")
+    set_read_time(cache, first, 1000)
+    set_read_time(cache, second, 2000)
+
+    # первую запись прочитали последней: вытесняется вторая
+    assert cache.get(first) is not None
+    third = make_entry(cache, tmp_path, "c")
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.get(third) is not None
+    assert sorted(path.name for path in cache.folder.iterdir()) == sorted([
+        first, third,
+    ])
+
+
+def test_entry_larger_than_limit_is_evicted(tmp_path: Path) -> None:
+    cache = ArtifactCache(folder=tmp_path / "cache", max_size_mb=1)
+    png = make_file(tmp_path / "big.png", bytes(1024 * 1024 + 1))
+    key = cache.key("rasterize_pdf", [png])
+    cache.put(key, [png])
+    assert cache.get(key) is None
+    assert list(cache.folder.iterdir()) == []
+
+
+def test_disabled_cache_always_builds(tmp_path: Path) -> None:
+    cache = ArtifactCache(folder=tmp_path / "cache", max_size_mb=0)
+    pdf = make_file(tmp_path / "rasp.pdf", b"%PDF-1.7")
+    page = make_file(tmp_path / "page.png", b"png")
+    calls = []
+
+    def build() -> list[Path]:
+        calls.append(page)
+        return [page]
+
+    for _ in range(2):
+        assert cache.call(
+            "rasterize_pdf", [pdf], build, lambda _: [tmp_path / "copy.png"],
+        ) == [page]
+    assert len(calls) == 2  # noqa:PLR2004
+    assert not cache.folder.exists()
@@ -0,0 +1,98 @@
+import zipfile
+from pathlib import Path
+from typing import IO
+
+import pytest
+
+from autopublisher.documents.document import (
+    DATA_DESCRIPTOR_FLAG,
+    DOCUMENT_XML,
+    copy_zip_member,
+    rewrite_docx,
+)
+
+
+# .docx, как его пишут Word (сжатые xml, картинки без сжатия)
+# и программы, которые пишут zip в поток (с data descriptor)
+MEMBERS = {
+    "[Content_Types].xml": (b"<Types/>" * 50, zipfile.ZIP_DEFLATED),
+    DOCUMENT_XML: (b"<w:document>Izhitsa</w:document>", zipfile.ZIP_DEFLATED),
+    "word/media/image1.jpeg": (bytes(range(256)) * 40, zipfile.ZIP_STORED),
+    "word/media/Логотип.png": (b"\x89PNG" + bytes(500), zipfile.ZIP_DEFLATED),
+    "word/styles.xml": (b"<w:styles/>" * 100, zipfile.ZIP_DEFLATED),
+}
+
+
+class Unseekable:
+    """Файл без seek и tell: zipfile пишет data descriptor"""
+
+    def __init__(self, file: IO[bytes]):
+        self._file = file
+
+    def write(self, data: bytes) -> int:
+        return self._file.write(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+
+def make_docx(path: Path, *, streamed: bool = False) -> None:
+    with path.open("wb") as file:
+        target = Unseekable(file) if streamed else file
+        with zipfile.ZipFile(target, "w") as docx:  # type: ignore[arg-type]
+            for name, (data, compress_type) in MEMBERS.items():
+                info = zipfile.ZipInfo(name, (2024, 1, 1, 10, 0, 0))
+                info.compress_type = compress_type
+                with docx.open(info, "w") as member:
+                    member.write(data)
+
+
+def replace_font(source: IO[bytes], target: IO[bytes]) -> None:
+    target.write(source.read().replace(b"Izhitsa", b"Times New Roman"))
+
+
+@pytest.mark.parametrize("streamed", [False, True], ids=["seekable", "stream"])
+def test_rewrite_docx(tmp_path: Path, *, streamed: bool) -> None:
+    docx = tmp_path / "rasp.docx"
+    make_docx(docx, streamed=streamed)
+    new_docx = tmp_path / "new.docx"
+    rewrite_docx(docx, new_docx, replace_font)
+
+    with zipfile.ZipFile(docx) as source, zipfile.ZipFile(new_docx) as target:
+        assert target.testzip() is None
+        assert target.namelist() == list(MEMBERS)
+        for info in source.infolist():
+            new_info = target.getinfo(info.filename)
+            assert bool(info.flag_bits & DATA_DESCRIPTOR_FLAG) == streamed
+            assert not new_info.flag_bits & DATA_DESCRIPTOR_FLAG
+            if info.filename == DOCUMENT_XML:
+                assert target.read(new_info) == (
+                    b"<w:document>Times New Roman</w:document>"
+                )
+                continue
+            # скопировано как есть, без повторного сжатия
+            assert target.read(new_info) == MEMBERS[info.filename][0]
+            assert new_info.compress_type == info.compress_type
+            assert new_info.compress_size == info.compress_size
+            assert new_info.CRC == info.CRC
+            assert new_info.date_time == info.date_time
+
+    with pytest.raises(ValueError, match="already exists"):
+        rewrite_docx(docx, new_docx, replace_font)
+
+
+def test_copy_zip_member_checks_local_header(tmp_path: Path) -> None:
+    docx = tmp_path / "rasp.docx"
+    make_docx(docx)
+    with zipfile.ZipFile(docx) as source:
+        info = source.getinfo("word/styles.xml")
+    data = bytearray(docx.read_bytes())
+    data[info.header_offset] = 0
+    docx.write_bytes(data)
+
+    with (
+        zipfile.ZipFile(docx) as source,
+        zipfile.ZipFile(tmp_path / "new.docx", "w") as target,
+        pytest.raises(zipfile.BadZipFile, match=r"styles\.xml"),
+    ):
+        copy_zip_member(source, target, info)
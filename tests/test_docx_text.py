@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import pytest
+
+from autopublisher.documents.document import docx2html
+from autopublisher.documents.docx_text import DocxTextError, read_docx_text
+from autopublisher.documents.html_text import get_lines_from_html
+from autopublisher.publish.prepare import prepare_text
+from tests.conftest import fallback_files, fixture_files, fixture_id
+
+
+# Новости в docx от Word, LibreOffice и python-docx
+
+
+def mammoth_lines(docx: Path) -> list[str]:
+    html, _ = docx2html(docx)
+    return get_lines_from_html(html)
+
+
+@pytest.mark.parametrize(
+    "fixture", fixture_files("docx", ".docx"), ids=fixture_id,
+)
+def test_lines_match_mammoth(fixture: Path) -> None:
+    lines = read_docx_text(fixture).lines
+    expected = mammoth_lines(fixture)
+    assert lines
+    assert lines == expected
+    assert prepare_text("\n".join(lines)) == prepare_text("\n".join(expected))
+
+
+@pytest.mark.parametrize(
+    "fixture", fallback_files("docx", ".docx"), ids=fixture_id,
+)
+def test_unsupported_documents(fixture: Path) -> None:
+    with pytest.raises(DocxTextError):
+        read_docx_text(fixture)
+    assert mammoth_lines(fixture)
@@ -0,0 +1,81 @@
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from autopublisher.documents.docx_xml import (
+    W_NAMESPACE,
+    CantSplitTableRows,
+    DocxXmlRule,
+    ReplaceFont,
+    transform_docx_xml,
+)
+from tests.conftest import FIXTURES
+
+
+W = f"{{{W_NAMESPACE}}}"
+W14 = "{http://schemas.microsoft.com/office/word/2010/wordml}"
+
+# Строки таблиц расписания так, как их пишут Word и LibreOffice:
+# без w:trPr, с w:trPr без w:cantSplit, с w:cantSplit w:val="false",
+# с w:tblPrEx перед w:trPr и с таблицей, вложенной в ячейку
+DOCUMENT_XML = (FIXTURES / "xml" / "rasp_document.xml").read_bytes()
+ROWS = 6
+
+
+def transform(xml: bytes, rules: list[DocxXmlRule]) -> ET.Element:
+    target = io.BytesIO()
+    transform_docx_xml(io.BytesIO(xml), target, rules)
+    return ET.fromstring(target.getvalue())
+
+
+def test_cant_split_every_row() -> None:
+    rule = CantSplitTableRows()
+    root = transform(DOCUMENT_XML, [rule])
+    rows = list(root.iter(f"{W}tr"))
+    assert len(rows) == rule.count == ROWS
+    for row in rows:
+        children = [child.tag for child in row]
+        # w:trPr -- один, сразу после необязательного w:tblPrEx
+        props_at = 1 if children[:1] == [f"{W}tblPrEx"] else 0
+        assert children[props_at] == f"{W}trPr"
+        assert children.count(f"{W}trPr") == 1
+        cant_split = row[props_at].findall(f"{W}cantSplit")
+        assert len(cant_split) == 1
+        assert cant_split[0].get(f"{W}val") == "true"
+
+
+def row_props(row: ET.Element) -> list[str]:
+    props = row.find(f"{W}trPr")
+    assert props is not None
+    return [child.tag for child in props]
+
+
+def test_keeps_existing_row_properties() -> None:
+    root = transform(DOCUMENT_XML, [CantSplitTableRows()])
+    outer = root.find(f"{W}body/{W}tbl/{W}tr")
+    assert outer is not None
+    assert row_props(outer) == [f"{W}trHeight", f"{W}cantSplit"]
+    assert outer.get(f"{W14}paraId") == "1A2B3C4D"
+    nested = outer.findall(f"{W}tc/{W}tbl/{W}tr")
+    assert row_props(nested[1]) == [f"{W}cantSplit", f"{W}jc"]
+
+
+def test_untouched_document_is_equal() -> None:
+    target = io.BytesIO()
+    transform_docx_xml(io.BytesIO(DOCUMENT_XML), target, [])
+    assert ET.canonicalize(target.getvalue()) == ET.canonicalize(DOCUMENT_XML)
+
+
+def test_replace_font() -> None:
+    rule = ReplaceFont("Izhitsa", "Times New Roman")
+    root = transform(DOCUMENT_XML, [rule])
+    fonts = [
+        value for element in root.iter(f"{W}rFonts")
+        for value in element.attrib.values()
+    ]
+    assert fonts == ["Times New Roman"] * 3
+    assert rule.replaced == 3  # noqa:PLR2004
+
+    with pytest.raises(ValueError, match="Arial"):
+        transform(DOCUMENT_XML, [ReplaceFont("Arial", "Times New Roman")])
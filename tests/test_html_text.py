@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import html2text
+import pytest
+
+from autopublisher.documents.html_text import (
+    HTML2TEXT_VERSION,
+    HtmlTextError,
+    get_lines_from_html,
+    html2text_lines,
+    read_html_lines,
+)
+from tests.conftest import fallback_files, fixture_files, fixture_id
+
+
+# Тела писем: Outlook, Gmail, Thunderbird, рассылка и т.п.
+
+
+@pytest.mark.parametrize(
+    "fixture", fixture_files("html", ".html"), ids=fixture_id,
+)
+def test_lines_match_html2text(fixture: Path) -> None:
+    source = fixture.read_text()
+    lines = read_html_lines(source)
+    assert lines
+    assert lines == html2text_lines(source)
+
+
+@pytest.mark.parametrize(
+    "fixture", fallback_files("html", ".html"), ids=fixture_id,
+)
+def test_fallback_to_html2text(fixture: Path) -> None:
+    source = fixture.read_text()
+    with pytest.raises(HtmlTextError):
+        read_html_lines(source)
+    assert get_lines_from_html(source) == html2text_lines(source)
+
+
+def test_html2text_version() -> None:
+    # MarkdownWriter повторяет эту версию html2text: после обновления
+    # проверить тесты выше и поменять HTML2TEXT_VERSION
+    assert tuple(html2text.__version__) == HTML2TEXT_VERSION
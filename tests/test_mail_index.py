@@ -0,0 +1,91 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from autopublisher.mail.index import (
+    LOADED,
+    PUBLISHED,
+    MailIndex,
+    attachment_hashes,
+    attachments_key,
+)
+
+
+URL = "https://example.ru/news/1"
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> Iterator[MailIndex]:
+    index = MailIndex(tmp_path / "index.sqlite")
+    yield index
+    index.close()
+
+
+def write_files(folder: Path, files: dict[str, bytes]) -> dict[str, str]:
+    folder.mkdir()
+    for filename, data in files.items():
+        (folder / filename).write_bytes(data)
+    return attachment_hashes(folder, list(files))
+
+
+def test_attachments_key_ignores_names_and_order(tmp_path: Path) -> None:
+    first = write_files(tmp_path / "first", {
+        "Новость.docx": b"docx", "IMG_1.jpg": b"jpg 1", "IMG_2.jpg": b"jpg 2",
+    })
+    # переслали еще раз: почтовая программа переименовала файлы
+    second = write_files(tmp_path / "second", {
+        "IMG_2 (1).jpg": b"jpg 2", "news.docx": b"docx", "IMG_1.jpg": b"jpg 1",
+    })
+    assert attachments_key(first.values()) == attachments_key(second.values())
+
+    other = write_files(tmp_path / "other", {
+        "Новость.docx": b"docx", "IMG_1.jpg": b"jpg 1",
+    })
+    assert attachments_key(other.values()) != attachments_key(first.values())
+    assert attachments_key([]) is None
+
+
+def test_attachment_hashes_skip_missing_files(tmp_path: Path) -> None:
+    hashes = write_files(tmp_path / "mail", {"a.jpg": b"a"})
+    assert attachment_hashes(tmp_path / "mail", ["a.jpg", "b.jpg"]) == hashes
+
+
+def test_finds_published_copy(index: MailIndex) -> None:
+    hashes = {"Новость.docx": "1" * 64, "IMG_1.jpg": "2" * 64}
+    index.record("<first@example.ru>", LOADED, attachments=hashes)
+    # еще не опубликовано
+    assert index.find_published_copy("<second@example.ru>", [
+        "2" * 64, "1" * 64,
+    ]) is None
+
+    index.record("<first@example.ru>", PUBLISHED, url=URL)
+    copy = index.find_published_copy("<second@example.ru>", [
+        "2" * 64, "1" * 64,
+    ])
+    assert copy is not None
+    assert copy.message_id == "<first@example.ru>"
+    assert copy.published
+    assert copy.url == URL
+
+    # само письмо, другой набор вложений и письмо без вложений
+    assert index.find_published_copy(
+        "<first@example.ru>", hashes.values(),
+    ) is None
+    assert index.find_published_copy("<second@example.ru>", ["1" * 64]) is None
+    assert index.find_published_copy("<second@example.ru>", []) is None
+
+
+def test_record_keeps_url_and_updates_attachments(index: MailIndex) -> None:
+    index.record("<mail@example.ru>", PUBLISHED, attachments={"a.jpg": "1"})
+    index.record("<mail@example.ru>", PUBLISHED, url=URL)
+    index.record("<mail@example.ru>", PUBLISHED)
+    mail = index.get("<mail@example.ru>")
+    assert mail is not None
+    assert mail.url == URL
+    assert index.find_published_copy("<copy@example.ru>", ["1"]) == mail
+
+    index.record("<mail@example.ru>", PUBLISHED, attachments={"b.jpg": "2"})
+    assert index.find_published_copy("<copy@example.ru>", ["1"]) is None
+    assert index.find_published_copy("<copy@example.ru>", ["2"]) == mail
+    assert index.get("<unknown@example.ru>") is None
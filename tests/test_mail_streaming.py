@@ -0,0 +1,67 @@
+import email
+import io
+from pathlib import Path
+
+import pytest
+
+from autopublisher.mail import streaming
+from autopublisher.mail.mail import (
+    get_mail_metadata,
+    get_streamed_metadata,
+    save_email,
+    save_email_stream,
+)
+from tests.conftest import FIXTURES, fixture_files, fixture_id
+
+
+# Письма Outlook, Gmail, пересланные и с одинаковыми именами вложений
+
+# "--", разделитель до 70 символов (RFC 2046), "--" и \r\n
+BOUNDARY_LINE_MAX = 76
+
+
+def saved_files(folder: Path) -> dict[str, bytes]:
+    return {path.name: path.read_bytes() for path in folder.iterdir()}
+
+
+@pytest.mark.parametrize(
+    "fixture", fixture_files("mail", ".eml"), ids=fixture_id,
+)
+@pytest.mark.parametrize(
+    "line_limit", [streaming.LINE_LIMIT, BOUNDARY_LINE_MAX + 1],
+)
+def test_files_match_save_email(
+        fixture: Path,
+        line_limit: int,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # строки base64 и quoted-printable (76 символов и \r\n) читаются
+    # по кускам, а разделители частей -- целиком, как и с LINE_LIMIT
+    monkeypatch.setattr(streaming, "LINE_LIMIT", line_limit)
+    data = fixture.read_bytes()
+    message = email.message_from_bytes(data)
+    save_email(message, tmp_path / "email")
+    with io.BytesIO(data) as source:
+        streamed = save_email_stream(source, tmp_path / "stream")
+
+    files = saved_files(tmp_path / "stream")
+    assert files
+    assert files == saved_files(tmp_path / "email")
+    assert get_streamed_metadata(streamed) == get_mail_metadata(message)
+
+
+def test_decoded_and_duplicate_names(tmp_path: Path) -> None:
+    with (FIXTURES / "mail" / "outlook_news.eml").open("rb") as source:
+        streamed = save_email_stream(source, tmp_path / "outlook")
+    assert streamed.attachments == [
+        "Совещание.docx", "IMG_0001.jpg", "IMG_0002.jpg",
+    ]
+
+    with (FIXTURES / "mail" / "duplicate_names.eml").open("rb") as source:
+        streamed = save_email_stream(source, tmp_path / "duplicate")
+    # как и save_email: второй photo.jpg перезаписывает первый
+    assert streamed.attachments == ["photo.jpg", "photo.jpg"]
+    assert sorted(saved_files(tmp_path / "duplicate")) == [
+        "part-001.txt", "photo.jpg",
+    ]
@@ -0,0 +1,104 @@
+import email
+import re
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from autopublisher.mail.mail import (
+    get_attachments_list,
+    get_mail_metadata,
+    get_message_structure,
+    get_structure_metadata,
+    save_email,
+    save_message_parts,
+)
+from autopublisher.mail.structure import fetch_items, parse_bodystructure
+from benchmarks.imap_standin import StoredMessage, bodystructure
+from tests.conftest import fixture_files, fixture_id
+
+
+# Те же письма, что и для потокового сохранения: части, загруженные
+# по BODYSTRUCTURE, должны совпадать с файлами save_email
+
+FETCH_RE = re.compile(r"^\((BODYSTRUCTURE )?BODY\.PEEK\[([^\]]*)\]\)$")
+EXTENSIONS = (".docx", ".jpg", ".png", ".txt", ".html")
+
+
+class StandinConnection:
+    """UID FETCH одного письма, ответ в том виде, как его отдает imaplib"""
+
+    def __init__(self, data: bytes):
+        self.message = StoredMessage(uid=1, data=data)
+
+    def uid(self, command: str, mail_id: str, items: str) -> tuple[str, Any]:
+        assert command == "FETCH"
+        match = FETCH_RE.match(items)
+        assert match is not None, items
+        with_structure, section = match.groups()
+        payload = self.message.section(section)
+        structure = (
+            b"BODYSTRUCTURE " + bodystructure(self.message.parsed) + b" "
+            if with_structure else b""
+        )
+        head = b"%s (UID %s %sBODY[%s] {%d}" % (
+            mail_id.encode(), mail_id.encode(), structure,
+            section.encode(), len(payload),
+        )
+        return "OK", [(head, payload), b")"]
+
+
+def saved_files(folder: Path) -> dict[str, bytes]:
+    return {path.name: path.read_bytes() for path in folder.iterdir()}
+
+
+@pytest.mark.parametrize(
+    "fixture", fixture_files("mail", ".eml"), ids=fixture_id,
+)
+def test_parts_match_save_email(fixture: Path, tmp_path: Path) -> None:
+    data = fixture.read_bytes()
+    message = email.message_from_bytes(data)
+    save_email(message, tmp_path / "email")
+    expected = saved_files(tmp_path / "email")
+
+    connection: Any = StandinConnection(data)
+    structure = get_message_structure(connection, "1", peek=True)
+    # одноименные вложения save_email записывает в один файл
+    assert {part.filename for part in structure.saved_parts()} == set(expected)
+    assert structure.attachments == get_attachments_list(message)
+
+    folder = tmp_path / "structure"
+    folder.mkdir()
+    paths = save_message_parts(connection, "1", structure, folder, EXTENSIONS)
+    assert paths
+    assert saved_files(folder) == {
+        name: content for name, content in expected.items()
+        if name.endswith(EXTENSIONS)
+    }
+    assert get_structure_metadata(
+        connection, "1", structure,
+    ) == get_mail_metadata(message)
+
+
+# Пример из RFC 3501, раздел 7.4.2
+RFC3501_BODYSTRUCTURE = (
+    b'* 12 FETCH (BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "US-ASCII") '
+    b'NIL NIL "7BIT" 1152 23)("TEXT" "PLAIN" ("CHARSET" "US-ASCII" '
+    b'"NAME" "cc.diff") "<960723163407.20117h@cac.washington.edu>" '
+    b'"Compiler diff" "BASE64" 4554 73) "MIXED"))'
+)
+
+
+def test_rfc3501_example() -> None:
+    body = parse_bodystructure(
+        fetch_items([RFC3501_BODYSTRUCTURE])["BODYSTRUCTURE"],  # type: ignore[arg-type]
+    )
+    assert body.content_type == "multipart/mixed"
+    assert [
+        (part.section, part.content_type, part.encoding, part.size,
+         part.filename)
+        for part in body.children
+    ] == [
+        ("1", "text/plain", "7bit", 1152, None),
+        ("2", "text/plain", "base64", 4554, "cc.diff"),
+    ]
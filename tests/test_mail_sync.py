@@ -0,0 +1,161 @@
+import re
+from pathlib import Path
+
+import pytest
+
+from autopublisher.mail.sync import MailboxSync
+
+
+SENDER = "koshelev@example.ru"
+OTHER = "other@example.ru"
+
+SEARCH_RE = re.compile(
+    r"^\((?:UNSEEN FROM (?P<unseen>\S+)"
+    r"|UID (?P<start>\d+):\* FROM (?P<sender>\S+)"
+    r"|UID (?P<uids>[\d,]+))\)$",
+)
+
+
+class FakeInbox:
+    """STATUS и UID SEARCH, которыми пользуется MailboxSync"""
+
+    capabilities = ("IMAP4REV1",)
+
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        # uid: (отправитель, \Seen)
+        self.mails: dict[int, tuple[str, bool]] = {}
+        self.commands: list[str] = []
+        self.fail_search = False
+
+    def append(self, mail_from: str, *, seen: bool = False) -> int:
+        uid = self.uidnext
+        self.mails[uid] = (mail_from, seen)
+        self.uidnext += 1
+        return uid
+
+    def status(self, mailbox: str, _names: str) -> tuple[str, list[bytes]]:
+        self.commands.append("STATUS")
+        return "OK", [
+            b"%s (UIDVALIDITY %d UIDNEXT %d MESSAGES %d)" % (
+                mailbox.encode(), self.uidvalidity, self.uidnext,
+                len(self.mails),
+            ),
+        ]
+
+    def uid(
+            self, command: str, _charset: None, criteria: str,
+    ) -> tuple[str, list[bytes]]:
+        self.commands.append(command)
+        assert command == "SEARCH"
+        if self.fail_search:
+            raise TimeoutError
+        match = SEARCH_RE.match(criteria)
+        assert match is not None, criteria
+        if match["unseen"]:
+            uids = [
+                uid for uid, (mail_from, seen) in self.mails.items()
+                if mail_from == match["unseen"] and not seen
+            ]
+        elif match["start"]:
+            uids = [
+                uid for uid, (mail_from, _) in self.mails.items()
+                if uid >= int(match["start"]) and mail_from == match["sender"]
+            ]
+        else:
+            wanted = {int(uid) for uid in match["uids"].split(",")}
+            uids = [uid for uid in self.mails if uid in wanted]
+        return "OK", [" ".join(map(str, uids)).encode()]
+
+
+@pytest.fixture
+def inbox() -> FakeInbox:
+    inbox = FakeInbox()
+    inbox.append(SENDER, seen=True)
+    inbox.append(SENDER)
+    inbox.append(OTHER)
+    inbox.append(SENDER)
+    return inbox
+
+
+def test_checks_only_new_uids(inbox: FakeInbox, tmp_path: Path) -> None:
+    sync = MailboxSync(tmp_path / "state.json")
+    assert sync.get_new_mails_from(inbox, SENDER) == ["2", "4"]
+
+    inbox.commands.clear()
+    assert sync.get_new_mails_from(inbox, SENDER) == ["2", "4"]
+    assert inbox.commands == ["STATUS"]
+
+    inbox.append(OTHER)
+    inbox.append(SENDER)
+    assert sync.get_new_mails_from(inbox, SENDER) == ["2", "4", "6"]
+    # состояние переживает перезапуск
+    restarted = MailboxSync(tmp_path / "state.json")
+    assert restarted.get_new_mails_from(inbox, SENDER) == ["2", "4", "6"]
+
+
+def test_rollback_returns_mail(inbox: FakeInbox, tmp_path: Path) -> None:
+    sync = MailboxSync(tmp_path / "state.json")
+    sync.get_new_mails_from(inbox, SENDER)
+    inbox.commands.clear()
+
+    sync.mark_as_read("2")
+    assert sync.get_new_mails_from(inbox, SENDER) == ["4"]
+    assert MailboxSync(tmp_path / "state.json").get_new_mails_from(
+        inbox, SENDER,
+    ) == ["4"]
+
+    # обработка не удалась: письмо возвращается в очередь без STORE
+    sync.mark_as_unread("2")
+    assert sync.get_new_mails_from(inbox, SENDER) == ["2", "4"]
+    assert MailboxSync(tmp_path / "state.json").get_new_mails_from(
+        inbox, SENDER,
+    ) == ["2", "4"]
+    assert "STORE" not in inbox.commands
+
+
+def test_failed_sync_keeps_state(inbox: FakeInbox, tmp_path: Path) -> None:
+    path = tmp_path / "state.json"
+    sync = MailboxSync(path)
+    sync.get_new_mails_from(inbox, SENDER)
+    saved = path.read_text()
+
+    inbox.append(SENDER)
+    inbox.fail_search = True
+    with pytest.raises(TimeoutError):
+        sync.get_new_mails_from(inbox, SENDER)
+    assert path.read_text() == saved
+
+    inbox.fail_search = False
+    assert sync.get_new_mails_from(inbox, SENDER) == ["2", "4", "5"]
+
+
+def test_expunged_mail_is_dropped(inbox: FakeInbox, tmp_path: Path) -> None:
+    sync = MailboxSync(tmp_path / "state.json")
+    sync.get_new_mails_from(inbox, SENDER)
+
+    del inbox.mails[2]
+    assert sync.get_new_mails_from(inbox, SENDER) == ["4"]
+
+
+def test_uidvalidity_change_resets_state(
+        inbox: FakeInbox, tmp_path: Path,
+) -> None:
+    sync = MailboxSync(tmp_path / "state.json")
+    sync.get_new_mails_from(inbox, SENDER)
+    sync.mark_as_read("4")
+
+    # ящик пересоздан: те же письма с новыми UID
+    renumbered = FakeInbox(uidvalidity=2)
+    renumbered.append(OTHER)
+    renumbered.append(SENDER)
+    renumbered.append(SENDER, seen=True)
+    assert sync.get_new_mails_from(renumbered, SENDER) == ["2"]
+
+    # забранное до смены UIDVALIDITY письмо не возвращается
+    sync.mark_as_unread("4")
+    assert sync.get_new_mails_from(renumbered, SENDER) == ["2"]
+    restarted = MailboxSync(tmp_path / "state.json")
+    assert restarted.state.uidvalidity == 2  # noqa:PLR2004
+    assert restarted.get_new_mails_from(renumbered, SENDER) == ["2"]